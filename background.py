@@ -0,0 +1,110 @@
+"""
+Background subtraction (rolling-ball style white top-hat)
+ • "exact"       – skimage white_tophat with a full disk (reference result).
+ • "opencv"      – same disk footprint run through cv2.morphologyEx; matches
+                   "exact" pixel for pixel but is far faster.
+ • "decomposed"  – disk approximated by a sequence of 3×3 erosions/dilations.
+ • "downsample"  – estimate the background on a shrunken copy, upsample it
+                   and subtract (fastest, approximate).
+Run as a script to time every mode on an image and print its max deviation
+from the exact result:
+    python background.py slide.tif --radius 50
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_RADIUS = 50
+DEFAULT_MODE = "opencv"
+DOWNSAMPLE_FACTOR = 4
+MODES = ("exact", "opencv", "decomposed", "downsample")
+
+
+def disk_footprint(radius):
+    """Same footprint as skimage.morphology.disk(radius), as uint8."""
+    yy, xx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    return (xx * xx + yy * yy <= radius * radius).astype(np.uint8)
+
+
+def _tophat_exact(image, radius):
+    from skimage.morphology import white_tophat, disk
+    return white_tophat(image, disk(radius))
+
+
+def _tophat_opencv(image, radius):
+    return cv2.morphologyEx(image, cv2.MORPH_TOPHAT, disk_footprint(radius))
+
+
+def _tophat_decomposed(image, radius):
+    from skimage.morphology import disk
+    sequence = disk(radius, decomposition="sequence")
+    opened = image
+    for footprint, n in sequence:
+        opened = cv2.erode(opened, footprint.astype(np.uint8), iterations=int(n))
+    for footprint, n in sequence:
+        opened = cv2.dilate(opened, footprint.astype(np.uint8), iterations=int(n))
+    return cv2.subtract(image, opened)
+
+
+def _tophat_downsample(image, radius, factor=DOWNSAMPLE_FACTOR):
+    h, w = image.shape[:2]
+    small_w, small_h = max(1, w // factor), max(1, h // factor)
+    small = cv2.resize(image, (small_w, small_h), interpolation=cv2.INTER_AREA)
+    small_radius = max(1, int(round(radius / factor)))
+    background = cv2.morphologyEx(small, cv2.MORPH_OPEN, disk_footprint(small_radius))
+    background = cv2.resize(background, (w, h), interpolation=cv2.INTER_LINEAR)
+    # the true opening never exceeds the image, so clip before subtracting
+    return cv2.subtract(image, np.minimum(background, image))
+
+
+_MODE_FUNCS = {
+    "exact": _tophat_exact,
+    "opencv": _tophat_opencv,
+    "decomposed": _tophat_decomposed,
+    "downsample": _tophat_downsample,
+}
+
+
+def subtract_background(image, radius=DEFAULT_RADIUS, mode=DEFAULT_MODE):
+    """White top-hat of a grayscale image with a disk of the given radius."""
+    try:
+        func = _MODE_FUNCS[mode]
+    except KeyError:
+        raise ValueError(f"Unknown background mode {mode!r}; choose from {', '.join(MODES)}")
+    return func(image, radius)
+
+
+def compare_modes(image, radius=DEFAULT_RADIUS, modes=MODES):
+    """Time every mode and report its max absolute deviation from "exact"."""
+    start = time.perf_counter()
+    reference = _tophat_exact(image, radius)
+    report = {"exact": {"seconds": time.perf_counter() - start, "max_deviation": 0}}
+
+    for mode in modes:
+        if mode == "exact":
+            continue
+        start = time.perf_counter()
+        result = subtract_background(image, radius, mode)
+        elapsed = time.perf_counter() - start
+        deviation = int(np.max(cv2.absdiff(result, reference))) if result.size else 0
+        report[mode] = {"seconds": elapsed, "max_deviation": deviation}
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare background subtraction modes.")
+    parser.add_argument("image")
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS)
+    args = parser.parse_args()
+
+    img = cv2.imread(args.image, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        parser.error(f"Could not read image: {args.image}")
+    img = cv2.equalizeHist(img)
+
+    for mode, row in compare_modes(img, args.radius).items():
+        print(f"{mode:<11} {row['seconds']:8.3f} s   max deviation {row['max_deviation']}")
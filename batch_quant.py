@@ -0,0 +1,337 @@
+"""
+Headless batch quantification
+ • Runs the same per-image pipelines as the GUI apps (see pipelines.py) over
+   folders and/or glob patterns.
+ • Files are fanned out over a process pool; rows come back in input order,
+   so the combined table is deterministic regardless of worker count.
+ • Rows are streamed to the results table as each image finishes
+   (results_sink.py): .csv and .parquet are written incrementally and
+   survive a crash; .xlsx streams to <table>.xlsx.csv and is converted at
+   the end.
+ • --tissue restricts every statistic to tissue found on a low-resolution
+   level, ignoring empty glass (see tissue.py).
+ • --stain dab measures one stain separated by colour deconvolution
+   (stain_separation.py; --stain-matrix picks H-DAB, H&E or a custom matrix)
+   instead of the grayscale image, in memory and tiled.
+ • Images computed in-process (-j 1, or a single image) are split over
+   --threads threads (parallel_tiles.py; every core by default), so one
+   huge image still uses the whole machine; results are bit-identical.
+ • In-process runs (-j 1) read and decode the next --prefetch images on I/O
+   threads while the current one is computed (prefetch.py); --profile then
+   also reports each image's load time and I/O wait.
+ • --tiled streams TIFF / .npy inputs tile by tile under --memory-mb per
+   worker (see tiling.py); results match the in-memory path.
+ • Rows are cached on disk by image content + parameters (result_cache.py),
+   so re-running over the same folder only computes new or changed images.
+   --no-cache bypasses the cache, --refresh recomputes this parameter set.
+ • --estimate TOL samples tiles until the 95 % interval of % positive /
+   mean intensity is within ±TOL (estimate.py) – for triage, not results.
+ • --save-masks archives every binary mask as a 1-bit TIFF (packed_mask.py),
+   mirroring the input folders, which packed_mask.py can re-measure later
+   without the pipeline; with --tissue the tissue mask is archived with it.
+ • --profile adds per-stage wall / CPU / peak-allocation columns (and
+   bypasses the cache, so every image is measured); --trace also writes a
+   Chrome trace of all stages across workers (see profiling.py).
+Examples:
+    python batch_quant.py area   slides/            -o myelin.csv --workers 8
+    python batch_quant.py binary "study/**/*.tif"   -o area.xlsx --threshold 100
+    python batch_quant.py intensity sections/*.png  -o intensity.csv
+    python batch_quant.py area wsi/*.tif -o wsi.csv --tiled --memory-mb 512 -j 2
+"""
+
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from background import DEFAULT_MODE, DEFAULT_RADIUS, MODES
+from estimate import ESTIMATE_PIPELINES, estimate_file
+from packed_mask import mask_path, mask_root, packed_result
+from parallel_tiles import get_threads, set_threads
+from pipelines import (PIPELINES, IMAGE_EXTENSIONS, DEFAULT_THRESHOLD, analyze_file, reader_for,
+                       run_pipeline)
+from prefetch import DEFAULT_DEPTH, DEFAULT_PREFETCH_BUDGET, Prefetcher
+from profiling import Profiler
+from result_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, open_cache
+from results_sink import open_sink
+from stain_separation import DEFAULT_MATRIX, MATRICES, StainSeparator
+from tiling import STREAMABLE_EXTENSIONS, DEFAULT_MEMORY_BUDGET, analyze_file_tiled
+
+
+def collect_inputs(patterns, extensions=IMAGE_EXTENSIONS):
+    """Expand folders and glob patterns into a sorted, de-duplicated file list."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, f) for f in os.listdir(pattern)]
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        paths.extend(p for p in matches
+                     if os.path.isfile(p) and p.lower().endswith(extensions))
+    return sorted(set(os.path.normpath(p) for p in paths))
+
+
+def _run_one(path, pipeline, params, memory_budget=None, profile=False, mask_dir=None,
+             prefetched=None, estimate=None, root=None):
+    # worker entry point: never raise, so one bad file doesn't kill the batch;
+    # returns (row, error, profiling events); prefetched is the image already
+    # decoded by a Prefetcher; masks are named by the path below root
+    profiler = Profiler() if profile else None
+    name = os.path.basename(path)
+    try:
+        if estimate is not None:
+            row = estimate_file(path, pipeline, estimate, **params)
+        elif prefetched is not None:
+            if profiler:
+                prefetched.record(profiler, name)
+            if prefetched.error:
+                raise prefetched.error
+            if mask_dir:
+                _, row, mask = packed_result(pipeline, prefetched.image, name, params,
+                                             profiler=profiler)
+                mask.save(mask_path(mask_dir, path, root))
+            else:
+                _, row = run_pipeline(pipeline, prefetched.image, name, params,
+                                      with_binary=False, profiler=profiler)
+        elif memory_budget and profiler:
+            with profiler.stage(name, "tiled"):
+                row = analyze_file_tiled(path, pipeline, memory_budget, **params)
+        elif memory_budget:
+            row = analyze_file_tiled(path, pipeline, memory_budget, **params)
+        elif mask_dir:
+            _, row, mask = packed_result(pipeline, path, name, params, profiler=profiler)
+            mask.save(mask_path(mask_dir, path, root))
+        else:
+            row = analyze_file(path, pipeline, profiler, **params)
+    except Exception as e:
+        return None, f"{path}: {e}", []
+    finally:
+        if profiler:
+            profiler.close()
+    if profiler:
+        return profiler.annotate(row), None, profiler.events
+    return row, None, []
+
+
+def run_batch(paths, pipeline, workers=None, memory_budget=None, cache=None, profiler=None,
+              sink=None, mask_dir=None, prefetch=DEFAULT_DEPTH,
+              prefetch_budget=DEFAULT_PREFETCH_BUDGET, estimate=None, on_result=None,
+              threads=None, **params):
+    """Analyze every path; returns (rows in input order, error messages).
+
+    memory_budget (bytes per worker) switches to tiled processing.
+    cache (a result_cache.ResultCache) serves repeat images without recomputing.
+    profiler (a profiling.Profiler) collects per-stage events from every
+    worker, and rows gain per-stage columns.
+    sink (see results_sink.py) receives each row, in input order, as soon as
+    it is ready; rows are then not kept, and the returned list is empty.
+    mask_dir receives every binary mask as a 1-bit TIFF, in the input folders'
+    layout below their common root (images served from the cache have no
+    mask, so pass no cache along with it).
+    prefetch images (at most prefetch_budget bytes) are read ahead on I/O
+    threads when running in-process and not tiled; 0 reads each image just
+    before computing it.
+    estimate (a tolerance) samples tiles instead of measuring every pixel.
+    on_result(path, row, error), if given, is called for every path in input
+    order once its row has been handled (row is None on errors).
+    threads splits each image computed in-process (see parallel_tiles.py;
+    None: every core); process-pool workers run serially.
+    """
+    digests, results = {}, {}
+    if cache is not None:
+        for path in paths:
+            try:
+                digests[path] = cache.digest(path)
+            except OSError:
+                continue                     # unreadable: let the worker report it
+            hit = cache.get(digests[path], pipeline, params, os.path.basename(path))
+            if hit is not None:
+                results[path] = (hit[1], None, [])
+
+    todo = [path for path in paths if path not in results]
+    job = partial(_run_one, pipeline=pipeline, params=params, memory_budget=memory_budget,
+                  profile=profiler is not None, mask_dir=mask_dir, estimate=estimate,
+                  root=mask_root(paths) if mask_dir and paths else None)
+    pool = None
+    if workers != 1 and len(todo) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    serial_threads = get_threads()
+    if not pool:
+        set_threads(threads)
+    prefetcher = None
+    if not pool and prefetch and not memory_budget and estimate is None:
+        prefetcher = Prefetcher(todo, reader_for(pipeline, params), prefetch, prefetch_budget)
+    rows, errors = [], []
+    try:
+        # all three are lazy and ordered: rows are handled as they complete
+        if pool:
+            computed = pool.map(job, todo)
+        elif prefetcher:
+            computed = (job(item.path, prefetched=item) for item in prefetcher)
+        else:
+            computed = map(job, todo)
+        for path in paths:
+            if path in results:
+                row, error, _ = results[path]
+            else:
+                row, error, events = next(computed)
+                if row is not None and path in digests:
+                    cache.put(digests[path], pipeline, params, row)
+                if profiler is not None:
+                    profiler.merge(events)
+            if error:
+                errors.append(error)
+            elif sink is not None:
+                sink.write(row)
+            else:
+                rows.append(row)
+            if on_result is not None:
+                on_result(path, None if error else row, error)
+    finally:
+        if pool:
+            pool.shutdown()
+        set_threads(serial_threads)
+    if prefetcher and prefetcher.total_load_s:
+        print(f"Prefetch: {prefetcher.total_load_s:.2f} s loading, "
+              f"{prefetcher.total_wait_s:.2f} s waited on I/O", file=sys.stderr)
+    return rows, errors
+
+
+def add_pipeline_arguments(parser):
+    """The pipeline choice and its parameters (shared with watch_folder.py)."""
+    parser.add_argument("pipeline", choices=PIPELINES,
+                        help="area = stained_area_cal (tophat + Otsu), "
+                             "binary = stained_area_cal2 / just_binary (fixed threshold), "
+                             "intensity = stained_intensity_cal (mean intensity)")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="fixed threshold for the binary pipeline")
+    parser.add_argument("--background-mode", choices=MODES, default=DEFAULT_MODE)
+    parser.add_argument("--background-radius", type=int, default=DEFAULT_RADIUS)
+    parser.add_argument("--tissue", action="store_true",
+                        help="measure only inside tissue detected at low resolution "
+                             "(tiled runs also skip tiles without tissue)")
+    parser.add_argument("--stain", default=None,
+                        help="measure this stain (e.g. dab, hematoxylin, eosin, or a 1-based "
+                             "number) separated by colour deconvolution; binary counts "
+                             "pixels with more stain than --threshold as positive")
+    parser.add_argument("--stain-matrix", default=DEFAULT_MATRIX,
+                        help=f"{' / '.join(MATRICES)} or 'r,g,b;r,g,b[;r,g,b]' stain OD vectors")
+
+
+def pipeline_params(args):
+    """Pipeline parameters from parsed arguments; ValueError for an unknown stain."""
+    params = {}
+    if args.pipeline == "area":
+        params = {"background_mode": args.background_mode,
+                  "background_radius": args.background_radius}
+    elif args.pipeline == "binary":
+        params = {"threshold": args.threshold}
+    if args.tissue:
+        params["tissue"] = True
+    if args.stain:
+        StainSeparator.named(args.stain_matrix).index(args.stain)
+        params.update(stain=args.stain, stain_matrix=args.stain_matrix)
+    return params
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch area-fraction / intensity quantification.")
+    add_pipeline_arguments(parser)
+    parser.add_argument("inputs", nargs="+", help="image folders and/or glob patterns")
+    parser.add_argument("-o", "--output", default="results.csv",
+                        help="results table (.csv, .parquet, or .xlsx)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: CPU count; 1 = run in-process)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="threads each in-process image is split over (default: every core)")
+    parser.add_argument("--tiled", action="store_true",
+                        help="stream large TIFF / .npy images tile by tile")
+    parser.add_argument("--memory-mb", type=float, default=DEFAULT_MEMORY_BUDGET / 2**20,
+                        help="per-worker memory budget for --tiled (MiB)")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_DEPTH,
+                        help="images read ahead on I/O threads with -j 1 (0 = off)")
+    parser.add_argument("--prefetch-mb", type=float, default=DEFAULT_PREFETCH_BUDGET / 2**20,
+                        help="decoded images the read-ahead may hold (MiB)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't read or write the on-disk result cache")
+    parser.add_argument("--refresh", action="store_true",
+                        help="drop cached results for these parameters and recompute")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--estimate", type=float, metavar="TOL",
+                        help="sample tiles until the 95%% interval is within ± TOL "
+                             "(binary / intensity; bypasses the cache)")
+    parser.add_argument("--save-masks", metavar="DIR",
+                        help="archive each binary mask as a compressed 1-bit TIFF "
+                             "(area / binary, not with --tiled; bypasses the cache)")
+    parser.add_argument("--profile", action="store_true",
+                        help="add per-stage timing / memory columns (bypasses the cache)")
+    parser.add_argument("--trace", metavar="JSON",
+                        help="write a Chrome trace of every stage (implies --profile)")
+    parser.add_argument("--cache-mb", type=float, default=DEFAULT_MAX_BYTES / 2**20,
+                        help="cache size limit; least recently used entries are evicted (MiB)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    extensions = IMAGE_EXTENSIONS + STREAMABLE_EXTENSIONS if args.tiled else IMAGE_EXTENSIONS
+    paths = collect_inputs(args.inputs, extensions)
+    if not paths:
+        print("No image files found.", file=sys.stderr)
+        return 1
+
+    try:
+        params = pipeline_params(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if args.estimate is not None:
+        if args.pipeline not in ESTIMATE_PIPELINES or args.save_masks:
+            print(f"--estimate works with {' / '.join(ESTIMATE_PIPELINES)}, without --save-masks",
+                  file=sys.stderr)
+            return 1
+    if args.save_masks:
+        if args.pipeline == "intensity" or args.tiled:
+            print("--save-masks needs the area or binary pipeline without --tiled",
+                  file=sys.stderr)
+            return 1
+        os.makedirs(args.save_masks, exist_ok=True)
+
+    profiler = Profiler(trace_memory=False) if args.profile or args.trace else None
+    cache = None
+    if not (args.no_cache or profiler or args.save_masks or args.estimate is not None):
+        cache = open_cache(args.cache_dir, int(args.cache_mb * 2**20))
+        if cache is None:
+            print(f"Result cache unavailable at {args.cache_dir}; computing everything.",
+                  file=sys.stderr)
+        elif args.refresh:
+            cache.invalidate(args.pipeline, params)
+
+    memory_budget = int(args.memory_mb * 2**20) if args.tiled else None
+    try:
+        sink = open_sink(args.output)
+    except ImportError as e:
+        print(e, file=sys.stderr)
+        return 1
+    with sink:
+        _, errors = run_batch(paths, args.pipeline, args.workers, memory_budget, cache,
+                              profiler, sink, args.save_masks, args.prefetch,
+                              int(args.prefetch_mb * 2**20), args.estimate,
+                              threads=args.threads, **params)
+    if cache is not None:
+        cache.close()
+    for error in errors:
+        print(f"Skipped {error}", file=sys.stderr)
+    if sink.count:
+        print(f"{sink.count} image(s) written to {args.output}")
+    if profiler and args.trace:
+        profiler.write_trace(args.trace)
+        print(f"Stage trace written to {args.trace}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""
+Benchmark suite for the analysis pipelines
+ • Renders deterministic synthetic sections (synthetic.py) from 1 MP up to
+   whole-slide sizes and times every stage of every pipeline separately,
+   through the same stage graphs the GUI apps and batch CLI use
+   (pipelines.py): decode, grayscale, equalize, top-hat, histogram, Otsu,
+   counting, binary.
+ • Also times the Excel export, quick_snap's preview path (reduced decode,
+   pyramid, resize) and a region crop, plus the tiled pipelines for TIFF input.
+ • Per stage: best wall / CPU time over --repeat runs and the peak traced
+   allocation (tracemalloc, measured in a separate pass so tracing doesn't
+   inflate the timings). The process peak RSS is recorded once per run.
+ • Writes machine-readable JSON; --compare prints per-stage ratios against an
+   earlier run and exits 1 when anything slowed down past --tolerance.
+Examples:
+    python bench.py -o bench.json
+    python bench.py --sizes 1 4 16 64 256 --pipelines area -o wsi.json
+    python bench.py -o new.json --compare base.json --tolerance 1.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from parallel_tiles import get_threads, set_threads
+from pipelines import GRAPHS, PIPELINES
+from region_reader import RegionReader, build_pyramid, pyramid_level
+from results_sink import write_table
+from stages import StageGraph
+from synthetic import DEFAULT_SEED, size_for_megapixels, write_synthetic
+from tiling import DEFAULT_MEMORY_BUDGET, analyze_file_tiled
+
+DEFAULT_SIZES_MP = (1, 4, 16)
+DEFAULT_REPEAT = 3
+DEFAULT_EXPORT_ROWS = 100
+CANVAS = (800, 600)                  # quick_snap's default window
+CROP = 200                           # quick_snap's default square
+MIN_COMPARE_S = 0.001                # faster stages are too noisy to flag
+
+
+# ---------- measuring ----------
+def _timed(func):
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = func()
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def measure(func, repeat=DEFAULT_REPEAT, trace_memory=True, setup=None):
+    """Best wall/CPU seconds of func() over repeat runs, plus its peak traced bytes.
+
+    With setup, each run first calls setup() (untimed) to get the callable.
+    """
+    wall = cpu = float("inf")
+    for _ in range(repeat):
+        call = setup() if setup else func
+        _, w, c = _timed(call)
+        wall, cpu = min(wall, w), min(cpu, c)
+    peak = None
+    if trace_memory:
+        call = setup() if setup else func
+        tracemalloc.start()
+        try:
+            call()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {"wall_s": wall, "cpu_s": cpu, "peak_bytes": peak}
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:              # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+# ---------- benchmark groups ----------
+def bench_stages(path, pipeline, params, repeat, trace_memory):
+    """One record per stage, plus the pipeline's result row.
+
+    Each run starts from a fresh graph with every upstream stage already
+    memoised, so a measurement covers exactly one stage.
+    """
+    stages = GRAPHS[pipeline]
+    names = list(stages)
+    records, outputs = [], []
+    for i, name in enumerate(names):
+        def setup(name=name, upstream=tuple(names[:i])):
+            graph = StageGraph(stages, memory_budget=2**62)
+            if upstream:
+                graph.run(path, path, params, upstream)
+            return lambda: outputs.append(graph.run(path, path, params, (name,))[0])
+
+        records.append(dict(stage=name, **measure(None, repeat, trace_memory, setup)))
+        if name == "measure":
+            row = outputs[-1]
+    return records, row
+
+
+def bench_export(row, n_rows, repeat, trace_memory, workdir):
+    rows = [dict(row, **{"Image Name": f"image_{i}"}) for i in range(n_rows)]
+    records = []
+    for ext in ("xlsx", "csv"):
+        out_path = os.path.join(workdir, f"bench_export.{ext}")
+        records.append(dict(stage=f"export_{ext}", rows=n_rows,
+                            **measure(lambda: write_table(rows, out_path), repeat, trace_memory)))
+    return records
+
+
+def bench_preview(path, repeat, trace_memory):
+    """quick_snap's path: reduced decode → pyramid → fit to the canvas → crop."""
+    reader = RegionReader(path)
+    try:
+        preview = reader.preview()
+        pyramid = build_pyramid(preview)
+        ow, oh = reader.size
+        scale = min(CANVAS[0] / ow, CANVAS[1] / oh)
+        size = (max(1, int(ow * scale)), max(1, int(oh * scale)))
+        left, top = (ow - CROP) // 2, (oh - CROP) // 2
+        steps = (
+            ("preview_decode", reader.preview),
+            ("pyramid", lambda: build_pyramid(preview)),
+            ("preview_resize", lambda: pyramid_level(pyramid, *size).resize(size)),
+            ("crop", lambda: reader.read_region((left, top, left + CROP, top + CROP))),
+        )
+        return [dict(stage=name, **measure(func, repeat, trace_memory)) for name, func in steps]
+    finally:
+        reader.close()
+
+
+def bench_tiled(path, pipeline, params, memory_budget, repeat, trace_memory):
+    func = lambda: analyze_file_tiled(path, pipeline, memory_budget, **params)
+    return dict(stage="tiled_total", memory_budget=memory_budget,
+                **measure(func, repeat, trace_memory))
+
+
+# ---------- run / compare ----------
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def run_benchmarks(sizes_mp=DEFAULT_SIZES_MP, pipelines=PIPELINES, repeat=DEFAULT_REPEAT,
+                   fmt="tif", workdir=None, seed=DEFAULT_SEED, export_rows=DEFAULT_EXPORT_ROWS,
+                   trace_memory=True, memory_budget=DEFAULT_MEMORY_BUDGET, params=None,
+                   log=None):
+    """Run every benchmark group; returns the JSON-ready report."""
+    workdir = workdir or tempfile.mkdtemp(prefix="qhq_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    params = params or {}
+    results = []
+
+    def add(group, megapixels, width, height, records):
+        for record in records:
+            results.append(dict(group=group, size_mp=megapixels, width=width,
+                                height=height, **record))
+            if log:
+                log(f"{group:>10} {megapixels:>5g} MP {record['stage']:>15} "
+                    f"{record['wall_s'] * 1000:10.1f} ms")
+
+    for megapixels in sizes_mp:
+        width, height = size_for_megapixels(megapixels)
+        path = os.path.join(workdir, f"synthetic_{seed}_{width}x{height}.{fmt}")
+        write_synthetic(path, width, height, seed)
+
+        for pipeline in pipelines:
+            pipeline_params = {p: v for p, v in params.items()
+                               if p in StageGraph(GRAPHS[pipeline]).defaults()}
+            records, row = bench_stages(path, pipeline, pipeline_params, repeat, trace_memory)
+            add(pipeline, megapixels, width, height, records)
+            if export_rows and row is not None:
+                add(pipeline, megapixels, width, height,
+                    bench_export(row, export_rows, repeat, trace_memory, workdir))
+            if fmt == "tif":
+                add(pipeline, megapixels, width, height,
+                    [bench_tiled(path, pipeline, pipeline_params, memory_budget,
+                                 repeat, trace_memory)])
+        add("quick_snap", megapixels, width, height, bench_preview(path, repeat, trace_memory))
+
+    return {
+        "version": 1,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "cpu_count": os.cpu_count(),
+        "config": {"sizes_mp": list(sizes_mp), "pipelines": list(pipelines), "repeat": repeat,
+                   "format": fmt, "seed": seed, "export_rows": export_rows, "params": params,
+                   "threads": get_threads()},
+        "peak_rss_bytes": peak_rss_bytes(),
+        "results": results,
+    }
+
+
+def _record_key(record):
+    return record["group"], record["size_mp"], record["stage"]
+
+
+def compare(base, new, tolerance=1.2):
+    """Lines of 'new / base' wall-time ratios; second value lists the regressions."""
+    base_times = {_record_key(r): r["wall_s"] for r in base["results"]}
+    lines, regressions = [], []
+    for record in new["results"]:
+        key = _record_key(record)
+        if key not in base_times or base_times[key] <= 0:
+            continue
+        ratio = record["wall_s"] / base_times[key]
+        flag = ""
+        if ratio > tolerance and record["wall_s"] >= MIN_COMPARE_S:
+            flag = "  SLOWER"
+            regressions.append(key)
+        lines.append(f"{key[0]:>10} {key[1]:>5g} MP {key[2]:>15} "
+                     f"{base_times[key] * 1000:10.1f} → {record['wall_s'] * 1000:10.1f} ms "
+                     f"({ratio:5.2f}×){flag}")
+    return lines, regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic sections.")
+    parser.add_argument("-o", "--output", default="bench.json", help="JSON report path")
+    parser.add_argument("--sizes", type=float, nargs="+", default=list(DEFAULT_SIZES_MP),
+                        help="image sizes in megapixels")
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="timed runs per stage (the best is kept)")
+    parser.add_argument("--format", choices=("tif", "png", "jpg"), default="tif",
+                        help="synthetic file format (tif enables the tiled benchmarks)")
+    parser.add_argument("--workdir", default=None,
+                        help="where synthetic images are kept (reused between runs)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--export-rows", type=int, default=DEFAULT_EXPORT_ROWS,
+                        help="rows in the timed Excel export (0 = skip)")
+    parser.add_argument("--memory-mb", type=float, default=DEFAULT_MEMORY_BUDGET / 2**20,
+                        help="memory budget for the tiled benchmarks (MiB)")
+    parser.add_argument("--background-mode", default=None,
+                        help="background mode for the area pipeline (see background.py)")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="threads each image is split over (0 = every core); compare "
+                             "reports of different counts to see the speedup")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the tracemalloc pass")
+    parser.add_argument("--compare", metavar="BASE_JSON", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.2,
+                        help="slow-down ratio that counts as a regression with --compare")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    params = {}
+    if args.background_mode:
+        params["background_mode"] = args.background_mode
+    set_threads(args.threads)
+    report = run_benchmarks([s if s % 1 else int(s) for s in args.sizes], args.pipelines,
+                            args.repeat, args.format, args.workdir, args.seed,
+                            args.export_rows, not args.no_memory,
+                            int(args.memory_mb * 2**20), params, log=print)
+    with open(args.output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"{len(report['results'])} measurements written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            base = json.load(fh)
+        lines, regressions = compare(base, report, args.tolerance)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower than {args.tolerance}× baseline",
+                  file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
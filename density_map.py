@@ -0,0 +1,308 @@
+"""
+Sliding-window density maps
+ • % positive pixels and mean intensity in every window × window square
+   (quick_snap-sized ROIs) tiled across an image at a given stride, using the
+   same binary masks as the area pipelines (pipelines.py).
+ • Pixels are summed once into a grid of cells (cell = gcd(window, stride))
+   through integral images of the mask and of the grayscale values; every
+   window is then four look-ups in the integral of that grid, so the cost per
+   window is O(1) whatever its size.
+ • --tiled feeds the cells tile by tile from TIFF / .npy input (tiling.py),
+   so whole slides never have to fit in memory – only the cell grid does.
+ • Writes one heatmap PNG per measure (one pixel per window step) and a
+   per-window table (.csv, .parquet or .xlsx). The finished grid is written
+   column-wise in one call, not row by row through a sink; an .xlsx table is
+   refused before any compute when the windows would not fit on one sheet.
+Examples:
+    python density_map.py area section.png -o maps/
+    python density_map.py binary slide.tif -o maps/ --window 300 --stride 150 --threshold 100
+    python density_map.py area wsi.tif -o maps/ --tiled --memory-mb 512 --table parquet
+"""
+
+import argparse
+import csv
+import math
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from background import DEFAULT_MODE, DEFAULT_RADIUS, MODES
+from pipelines import DEFAULT_THRESHOLD, GRAPHS, PIPELINES, positive_mask
+from results_sink import to_excel
+from stages import StageGraph
+from tiling import (DEFAULT_MEMORY_BUDGET, iter_tiles, open_source, tile_size_for_budget,
+                    tiled_myelin_area)
+
+DEFAULT_WINDOW = 150
+COLORMAP = cv2.COLORMAP_VIRIDIS
+TABLE_FORMATS = ("csv", "parquet", "xlsx")
+EXCEL_MAX_ROWS = 1048576                    # per sheet, header included
+
+
+class CellGrid:
+    """Sums of positive pixels and gray values over a grid of cell × cell squares."""
+
+    def __init__(self, shape, cell):
+        self.shape = tuple(shape[:2])
+        self.cell = cell
+        rows, cols = (-(-n // cell) for n in self.shape)
+        self.positive = np.zeros((rows, cols), np.int64)
+        self.gray = np.zeros((rows, cols), np.float64)
+        self.has_positive = False
+
+    def _cell_sums(self, y0, x0, values, sdepth):
+        # integral of the tile, sampled at every cell edge inside it
+        h, w = values.shape
+        ys = np.unique(np.r_[0, np.arange(-y0 % self.cell, h, self.cell), h])
+        xs = np.unique(np.r_[0, np.arange(-x0 % self.cell, w, self.cell), w])
+        ii = cv2.integral(values, sdepth=sdepth)
+        sums = ii[np.ix_(ys, xs)]
+        sums = sums[1:, 1:] - sums[:-1, 1:] - sums[1:, :-1] + sums[:-1, :-1]
+        r0, c0 = y0 // self.cell, x0 // self.cell
+        return (slice(r0, r0 + sums.shape[0]), slice(c0, c0 + sums.shape[1])), sums
+
+    def add(self, y0, x0, gray=None, positive=None):
+        """Add a tile whose top-left pixel is (y0, x0); either array may be None."""
+        if gray is not None:
+            if gray.dtype not in (np.uint8, np.uint16, np.float32, np.float64):
+                gray = gray.astype(np.float32)
+            cells, sums = self._cell_sums(y0, x0, gray, cv2.CV_64F)
+            self.gray[cells] += sums
+        if positive is not None:
+            cells, sums = self._cell_sums(y0, x0, positive.view(np.uint8), cv2.CV_32S)
+            self.positive[cells] += sums
+            self.has_positive = True
+
+    def windows(self, window, stride):
+        """DensityMap of every window × window square at the given stride."""
+        if window % self.cell or stride % self.cell:
+            raise ValueError(f"window and stride must be multiples of the cell size {self.cell}")
+        h, w = self.shape
+        ys = np.arange(0, max(h - window, 0) + 1, stride)
+        xs = np.arange(0, max(w - window, 0) + 1, stride)
+        heights, widths = np.minimum(ys + window, h) - ys, np.minimum(xs + window, w) - xs
+        r0, c0 = ys // self.cell, xs // self.cell
+        r1 = np.minimum(r0 + window // self.cell, self.positive.shape[0])
+        c1 = np.minimum(c0 + window // self.cell, self.positive.shape[1])
+
+        def window_sums(grid):
+            ii = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), grid.dtype)
+            np.cumsum(np.cumsum(grid, axis=0), axis=1, out=ii[1:, 1:])
+            return (ii[np.ix_(r1, c1)] - ii[np.ix_(r0, c1)]
+                    - ii[np.ix_(r1, c0)] + ii[np.ix_(r0, c0)])
+
+        area = np.outer(heights, widths)
+        fraction = window_sums(self.positive) * 100 / area if self.has_positive else None
+        return DensityMap(ys, xs, heights, widths, fraction, window_sums(self.gray) / area)
+
+
+class DensityMap:
+    """Per-window results; fraction (% positive) and mean are rows × cols grids."""
+
+    def __init__(self, ys, xs, heights, widths, fraction, mean):
+        self.ys, self.xs = ys, xs
+        self.heights, self.widths = heights, widths
+        self.fraction = fraction
+        self.mean = mean
+
+    @property
+    def grid_shape(self):
+        return self.mean.shape
+
+    def rows(self, name):
+        """One result row per window, row by row."""
+        columns = self.columns(name)
+        for values in zip(*(c.tolist() for c in columns.values())):
+            yield dict(zip(columns, values))
+
+    def columns(self, name):
+        """Column name → flat array with one entry per window, row by row."""
+        rows, cols = self.grid_shape
+        columns = {"Image Name": np.full(rows * cols, name, object),
+                   "X": np.tile(self.xs, rows), "Y": np.repeat(self.ys, cols),
+                   "Width": np.tile(self.widths, rows), "Height": np.repeat(self.heights, cols)}
+        if self.fraction is not None:
+            columns["Positive (%)"] = self.fraction.ravel()
+        columns["Mean Intensity"] = self.mean.ravel()
+        return columns
+
+
+def window_count(shape, window, stride=None):
+    """Number of windows density_map lays over an image of this shape."""
+    stride = stride or window
+    h, w = shape[:2]
+    return (max(h - window, 0) // stride + 1) * (max(w - window, 0) // stride + 1)
+
+
+def image_shape(path):
+    """(height, width) of an image file from its header."""
+    try:
+        source = open_source(path)
+    except ValueError:                       # not streamable: Pillow reads the header only
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.height, img.width
+    try:
+        return source.shape[:2]
+    finally:
+        source.close()
+
+
+def check_table(path, table, window, stride=None):
+    """ValueError if the per-window table of path can't be written as table."""
+    if table != "xlsx":
+        return
+    count = window_count(image_shape(path), window, stride)
+    if count + 1 > EXCEL_MAX_ROWS:
+        raise ValueError(f"{count} windows don't fit on an Excel sheet "
+                         f"({EXCEL_MAX_ROWS - 1} rows); use --table csv or parquet, "
+                         "or a larger --stride")
+
+
+# ---------- building maps ----------
+def density_map(path, pipeline, window=DEFAULT_WINDOW, stride=None, memory_budget=None,
+                **params):
+    """DensityMap of one image file; memory_budget streams TIFF / .npy tile by tile."""
+    if pipeline not in GRAPHS:
+        raise ValueError(f"Unknown pipeline {pipeline!r}")
+    stride = stride or window
+    cell = math.gcd(window, stride)
+    if memory_budget:
+        grid = _tiled_cells(path, pipeline, cell, memory_budget, **params)
+    else:
+        graph = StageGraph(GRAPHS[pipeline], memory_budget=0)
+        params = {p: v for p, v in params.items() if p in graph.defaults()}
+        if "binary" in graph.stages:
+            gray, binary = graph.run(None, path, params, ("grayscale", "binary"))
+            positive = positive_mask(pipeline, binary)
+        else:
+            (gray,), positive = graph.run(None, path, params, ("grayscale",)), None
+        grid = CellGrid(gray.shape, cell)
+        grid.add(0, 0, gray, positive)
+    return grid.windows(window, stride)
+
+
+def _tiled_cells(path, pipeline, cell, memory_budget, background_mode=DEFAULT_MODE,
+                 background_radius=DEFAULT_RADIUS, threshold=DEFAULT_THRESHOLD):
+    source = open_source(path)
+    try:
+        grid = CellGrid(source.shape, cell)
+        tile = tile_size_for_budget(memory_budget)
+        for (y0, y1, x0, x1), _ in iter_tiles(source.shape, tile):
+            gray = source.read_region(y0, y1, x0, x1, depth8=pipeline != "intensity")
+            positive = gray > threshold if pipeline == "binary" else None
+            grid.add(y0, x0, gray, positive)
+        if pipeline == "area":
+            tiled_myelin_area(source, os.path.basename(path), background_mode,
+                              background_radius, memory_budget,
+                              mask_callback=lambda y0, x0, binary: grid.add(
+                                  y0, x0, positive=positive_mask("area", binary)))
+        return grid
+    finally:
+        source.close()
+
+
+# ---------- output ----------
+def heatmap(values, vmin=None, vmax=None, upscale=1):
+    """Colour-mapped BGR image of a grid (one pixel per window, upscale× larger)."""
+    vmin = float(np.min(values)) if vmin is None else vmin
+    vmax = float(np.max(values)) if vmax is None else vmax
+    scaled = (values - vmin) * (255 / (vmax - vmin)) if vmax > vmin else np.zeros_like(values)
+    image = cv2.applyColorMap(np.clip(scaled, 0, 255).astype(np.uint8), COLORMAP)
+    if upscale > 1:
+        image = cv2.resize(image, None, fx=upscale, fy=upscale, interpolation=cv2.INTER_NEAREST)
+    return image
+
+
+def write_density(result, out_dir, stem, table="csv", upscale=1):
+    """Write <stem>_positive.png, <stem>_intensity.png and <stem>_windows.<table>."""
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    images = [("intensity", result.mean, None, None)]
+    if result.fraction is not None:
+        images.insert(0, ("positive", result.fraction, 0, 100))
+    for measure, values, vmin, vmax in images:
+        path = os.path.join(out_dir, f"{stem}_{measure}.png")
+        if not cv2.imwrite(path, heatmap(values, vmin, vmax, upscale)):
+            raise ValueError(f"Could not write {path}")
+        written.append(path)
+    table_path = os.path.join(out_dir, f"{stem}_windows.{table}")
+    write_windows(result.columns(stem), table_path)
+    written.append(table_path)
+    return written
+
+
+def write_windows(columns, path):
+    """Write per-window columns in one go (.csv, .parquet or .xlsx)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)") from None
+        pq.write_table(pa.table(columns), path)
+    elif ext in (".xlsx", ".xls"):
+        if len(next(iter(columns.values()))) + 1 > EXCEL_MAX_ROWS:
+            raise ValueError(f"Too many windows for an Excel sheet ({EXCEL_MAX_ROWS - 1} rows)")
+        to_excel(columns, path)
+    else:
+        with open(path, "w", newline="") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(columns)
+            writer.writerows(zip(*(c.tolist() for c in columns.values())))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sliding-window % positive / mean intensity maps.")
+    parser.add_argument("pipeline", choices=PIPELINES,
+                        help="mask used for %% positive (intensity = mean intensity only)")
+    parser.add_argument("inputs", nargs="+", help="image files")
+    parser.add_argument("-o", "--out-dir", default="density_maps")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="window side (px)")
+    parser.add_argument("--stride", type=int, default=None,
+                        help="step between windows (px, default: the window side)")
+    parser.add_argument("--table", choices=TABLE_FORMATS, default="csv",
+                        help="per-window table format")
+    parser.add_argument("--upscale", type=int, default=1,
+                        help="heatmap pixels per window step")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="fixed threshold for the binary pipeline")
+    parser.add_argument("--background-mode", choices=MODES, default=DEFAULT_MODE)
+    parser.add_argument("--background-radius", type=int, default=DEFAULT_RADIUS)
+    parser.add_argument("--tiled", action="store_true",
+                        help="stream TIFF / .npy images tile by tile")
+    parser.add_argument("--memory-mb", type=float, default=DEFAULT_MEMORY_BUDGET / 2**20,
+                        help="memory budget for --tiled (MiB)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.window < 1 or (args.stride is not None and args.stride < 1):
+        print("--window and --stride must be positive", file=sys.stderr)
+        return 1
+    params = {"threshold": args.threshold, "background_mode": args.background_mode,
+              "background_radius": args.background_radius}
+    memory_budget = int(args.memory_mb * 2**20) if args.tiled else None
+    failed = 0
+    for path in args.inputs:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        try:
+            check_table(path, args.table, args.window, args.stride)
+            result = density_map(path, args.pipeline, args.window, args.stride,
+                                 memory_budget, **params)
+            written = write_density(result, args.out_dir, stem, args.table, args.upscale)
+        except Exception as e:
+            print(f"Skipped {path}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        rows, cols = result.grid_shape
+        print(f"{path}: {rows}×{cols} windows → {', '.join(written)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Fast sampled estimates for slide triage
+ • Estimates % positive (binary pipeline, fixed threshold) or mean intensity
+   (intensity pipeline) from randomly chosen tiles instead of every pixel.
+ • Tiles are drawn stratified: the slide is split into a grid of blocks and
+   each round samples one new tile from every block, so all regions are
+   covered early. For TIFFs a sample tile is one stored tile / strip
+   (tiling.TiffSource), so only sampled regions are ever decoded.
+ • After each round a ratio estimate and its confidence interval are
+   computed (tiles as clusters, finite-population corrected, which is
+   conservative for stratified draws); sampling stops once the interval's
+   half-width is within the tolerance (percentage points / intensity
+   units), or when every tile has been read – then the result is exact.
+ • With tissue=True only tiles holding tissue (tissue.py, detected on a
+   low-resolution level) are sampled, and only their tissue pixels count.
+ • Rows have the exact path's columns (pipelines.py) plus the interval,
+   the number of tiles and the share of pixels sampled.
+Examples:
+    python estimate.py binary slides/*.tif --tolerance 1 -o triage.csv
+    python estimate.py intensity section.tif --tolerance 2 --confidence 0.99 --tissue
+"""
+
+import argparse
+import math
+import os
+import sys
+from statistics import NormalDist
+
+import cv2
+import numpy as np
+
+from pipelines import (DEFAULT_THRESHOLD, fixed_threshold_row, intensity_row, reader_for,
+                       with_tissue_area)
+from quantify import Histogram
+from results_sink import write_table
+from tiling import STREAMABLE_EXTENSIONS, ArraySource, iter_tiles, open_source, stain_source
+from tissue import TissueMask
+
+ESTIMATE_PIPELINES = ("binary", "intensity")
+DEFAULT_TOLERANCE = 1.0           # ± percentage points (binary) / intensity units
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_STRATA = 16               # blocks per round (4 × 4)
+DEFAULT_SAMPLE_TILE = 256         # for sources without stored tiles
+MIN_ROUNDS = 2                    # the interval needs a few tiles to be meaningful
+
+
+def stratified_order(tiles, shape, strata=DEFAULT_STRATA, seed=0):
+    """tiles (y0, y1, x0, x1) reordered in rounds of one random tile per block."""
+    rng = np.random.default_rng(seed)
+    side = max(1, math.isqrt(strata))
+    h, w = shape
+    blocks = {}
+    for box in tiles:
+        key = (box[0] * side // h, box[2] * side // w)
+        blocks.setdefault(key, []).append(box)
+    for members in blocks.values():
+        rng.shuffle(members)
+    order, depth = [], max(len(m) for m in blocks.values())
+    for i in range(depth):
+        round_ = [m[i] for m in blocks.values() if i < len(m)]
+        rng.shuffle(round_)
+        order.append(round_)
+    return order
+
+
+class _Sample:
+    """Per-tile totals and the estimate they give."""
+
+    def __init__(self, population):
+        self.population = population      # tiles in the image
+        self.n = []                       # pixels per tile
+        self.y = []                       # positive pixels / intensity sum per tile
+        self.hist = None
+
+    def add(self, hist, value):
+        self.hist = hist if self.hist is None else self.hist + hist
+        self.n.append(hist.total)
+        self.y.append(value)
+
+    def interval(self, z):
+        """(ratio estimate, half-width) of sum(y) / sum(n)."""
+        n, y = np.array(self.n, np.float64), np.array(self.y, np.float64)
+        ratio = y.sum() / n.sum()
+        m = len(n)
+        if m == self.population:          # every tile read: the result is exact
+            return ratio, 0.0
+        if m < 2:
+            return ratio, math.inf
+        fpc = 1 - m / self.population
+        residuals = y - ratio * n
+        variance = fpc * residuals.var(ddof=1) / (m * n.mean() ** 2)
+        return ratio, z * math.sqrt(max(variance, 0.0))
+
+
+def estimate(source, name, pipeline, tolerance=DEFAULT_TOLERANCE, threshold=DEFAULT_THRESHOLD,
+             confidence=DEFAULT_CONFIDENCE, tile=None, strata=DEFAULT_STRATA, seed=0,
+             tissue=None):
+    """Sampled result row of a tiling source (same columns as the exact path, plus CI).
+
+    tissue (a tissue.TissueMask) restricts the sample to tissue pixels.
+    """
+    if pipeline not in ESTIMATE_PIPELINES:
+        raise ValueError(f"Estimates support {ESTIMATE_PIPELINES}, not {pipeline!r}")
+    h, w = source.shape
+    if tile is None and hasattr(source, "segment_shape"):
+        seg_h, seg_w = source.segment_shape      # one stored tile / strip per sample
+        tiles = [(y0, min(y0 + seg_h, h), x0, min(x0 + seg_w, w))
+                 for y0 in range(0, h, seg_h) for x0 in range(0, w, seg_w)]
+    else:
+        tiles = [core for core, _ in iter_tiles(source.shape, tile or DEFAULT_SAMPLE_TILE)]
+    if tissue is not None:
+        tiles = [box for box in tiles if tissue.any(*box)]
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    depth8 = pipeline == "binary"
+    sample = _Sample(len(tiles))
+
+    for rounds, boxes in enumerate(stratified_order(tiles, source.shape, strata, seed), 1):
+        for box in boxes:
+            mask = tissue.region(*box) if tissue is not None else None
+            hist = Histogram.of(source.read_region(*box, depth8), mask)
+            sample.add(hist, hist.count_above(threshold) if depth8 else hist.sum())
+        ratio, half = sample.interval(z)
+        if depth8:
+            ratio, half = ratio * 100, half * 100
+        if rounds >= MIN_ROUNDS and half <= tolerance:
+            break
+
+    hist = sample.hist
+    measured = h * w if tissue is None else tissue.pixels()
+    if depth8:
+        row = fixed_threshold_row(name, hist, threshold)
+        row["Total Pixels"] = measured
+        column = "Positive Pixels (%)"
+    else:
+        row = intensity_row(name, hist)
+        column = "Average Intensity"
+    if tissue is not None:
+        row = with_tissue_area(row, measured, h * w)
+    row.update({
+        f"{column} CI Low": ratio - half,
+        f"{column} CI High": ratio + half,
+        "Confidence": confidence,
+        "Sampled Tiles": len(sample.n),
+        "Sampled Pixels (%)": hist.total * 100 / measured,
+    })
+    return row
+
+
+def estimate_file(path, pipeline, tolerance=DEFAULT_TOLERANCE, threshold=DEFAULT_THRESHOLD,
+                  confidence=DEFAULT_CONFIDENCE, seed=0, tissue=False, **params):
+    """estimate() of a file; TIFF / .npy are read region by region, others decoded once.
+
+    A stain parameter (see stain_separation.py) estimates that stain instead
+    of the grayscale image; tissue=True samples only tissue, found as the
+    exact path finds it.
+    """
+    mask = None
+    if path.lower().endswith(STREAMABLE_EXTENSIONS):
+        source = open_source(path)
+        if tissue:
+            mask = TissueMask.of_source(source, depth8=pipeline == "binary")
+    else:
+        image = reader_for(pipeline, params)(path)
+        if image is None:
+            raise ValueError(f"Could not read image: {path}")
+        if image.ndim == 3 and pipeline == "intensity" and not params.get("stain"):
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4
+                                 else cv2.COLOR_BGR2GRAY)
+        if tissue:
+            mask = TissueMask.of(image if image.ndim == 2 else
+                                 cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4
+                                              else cv2.COLOR_BGR2GRAY))
+        source = ArraySource(image)
+    try:
+        source = stain_source(source, pipeline, **params)
+        return estimate(source, os.path.basename(path), pipeline, tolerance, threshold,
+                        confidence, seed=seed, tissue=mask)
+    finally:
+        source.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sampled % positive / mean intensity with a "
+                                                 "confidence interval, for triage.")
+    parser.add_argument("pipeline", choices=ESTIMATE_PIPELINES)
+    parser.add_argument("inputs", nargs="+", help="image files")
+    parser.add_argument("-o", "--output", default=None, help="results table (default: print)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="stop once the interval is within ± this "
+                             "(percentage points, or intensity units)")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="fixed threshold for the binary pipeline")
+    parser.add_argument("--tissue", action="store_true",
+                        help="sample only tissue detected at low resolution")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    column = "Positive Pixels (%)" if args.pipeline == "binary" else "Average Intensity"
+    rows = []
+    for path in args.inputs:
+        try:
+            row = estimate_file(path, args.pipeline, args.tolerance, args.threshold,
+                                args.confidence, args.seed, args.tissue)
+        except Exception as e:
+            print(f"Skipped {path}: {e}", file=sys.stderr)
+            continue
+        rows.append(row)
+        print(f"{row['Image Name']}: {row[column]:.2f} "
+              f"[{row[column + ' CI Low']:.2f}, {row[column + ' CI High']:.2f}] "
+              f"from {row['Sampled Pixels (%)']:.1f}% of the pixels")
+    if args.output and rows:
+        write_table(rows, args.output)
+    return 0 if len(rows) == len(args.inputs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,22 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
-import cv2
-import numpy as np
+from pipelines import read_gray, run_pipeline, BINARY_STAGES, DEFAULT_THRESHOLD
+from parallel_tiles import set_threads
+from stages import StageGraph
+from threshold_sweep import ThresholdSweep, preview_cache, threshold_preview
 
 class BinaryImageApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Binary Image Analyzer")
+        set_threads()   # split each large image over every core (parallel_tiles.py)
         
         self.image = None
         self.binary_image = None
+        self.curve = None      # % positive for every threshold (from the histogram)
+        self.preview = None    # downsampled copy for live threshold previews
+        self.graph = StageGraph(BINARY_STAGES)  # histogram reused across thresholds
 
         # Buttons
         btn_frame = tk.Frame(root)
@@ -19,6 +25,10 @@ class BinaryImageApp:
         tk.Button(btn_frame, text="Upload Image", command=self.upload_image).pack(side=tk.LEFT, padx=10)
         tk.Button(btn_frame, text="Convert to Binary", command=self.convert_to_binary).pack(side=tk.LEFT, padx=10)
 
+        # Threshold slider + % positive curve
+        self.sweep = ThresholdSweep(root, DEFAULT_THRESHOLD, command=self.on_threshold_change)
+        self.sweep.pack()
+
         # Image panel
         self.panel = tk.Label(root)
         self.panel.pack()
@@ -30,25 +40,36 @@ class BinaryImageApp:
     def upload_image(self):
         file_path = filedialog.askopenfilename(filetypes=[("Image files", "*.png *.jpg *.jpeg *.tif *.tiff")])
         if file_path:
-            self.image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+            self.image = read_gray(file_path)
             if self.image is not None:
+                self.graph.invalidate()
+                hist, = self.graph.run(0, self.image, targets=("histogram",))
+                self.curve = hist.percent_above_curve()
+                self.preview = preview_cache(self.image, (400, 400))
+                self.sweep.set_curve(0, self.curve)
                 self.display_image(self.image)
 
+    def on_threshold_change(self, threshold):
+        # live preview: only the downsampled cache is thresholded
+        if self.preview is None:
+            return
+        self.display_image(threshold_preview(self.preview, threshold))
+        self.show_stats(threshold, self.curve[threshold])
+
     def convert_to_binary(self):
         if self.image is None:
             messagebox.showwarning("No Image", "Please upload an image first.")
             return
-        _, self.binary_image = cv2.threshold(self.image, 127, 255, cv2.THRESH_BINARY)
+        self.binary_image, row = run_pipeline("binary", self.image, "",
+                                              {"threshold": self.sweep.threshold},
+                                              graph=self.graph, key=0)
         self.display_image(self.binary_image)
+        self.show_stats(row["Threshold"], row["Positive Pixels (%)"])
 
-        # Calculate pixel percentages
-        total_pixels = self.binary_image.size
-        positive_pixels = np.sum(self.binary_image == 255)
-        negative_pixels = np.sum(self.binary_image == 0)
-        pos_percent = (positive_pixels / total_pixels) * 100
-        neg_percent = (negative_pixels / total_pixels) * 100
-
-        self.stats_label.config(text=f"Positive Pixels: {pos_percent:.2f}%\nNegative Pixels: {neg_percent:.2f}%")
+    def show_stats(self, threshold, pos_percent):
+        neg_percent = 100 - pos_percent
+        self.stats_label.config(text=f"Threshold: {threshold}\n"
+                                     f"Positive Pixels: {pos_percent:.2f}%\nNegative Pixels: {neg_percent:.2f}%")
 
     def display_image(self, img_array):
         image = Image.fromarray(img_array)
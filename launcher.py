@@ -0,0 +1,183 @@
+"""
+One launcher for every GUI tool
+ • The window appears as soon as Tk is up; the tool's module (and with it
+   numpy, OpenCV, PIL, …) is imported on a worker thread while a "Loading"
+   line is shown, and the tool is built in the same window once it is ready.
+   pandas and scikit-image are imported later still, at export / conversion.
+ • Without a tool name a small chooser opens; each tool opens in its own
+   window.
+ • --import-times imports every tool in a fresh interpreter under
+   python -X importtime and reports its slowest direct imports; with
+   --budget-ms it exits 1 when any tool takes longer, so startup cost can be
+   checked like a test.
+Examples:
+    python launcher.py
+    python launcher.py area
+    python launcher.py --import-times --budget-ms 800
+"""
+
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import time
+import tkinter as tk
+from tkinter import messagebox
+
+from worker import BackgroundRunner
+
+_STARTED = time.perf_counter()
+
+DEFAULT_BUDGET_MS = 1000
+
+# name → (title, module, class, needs drag-and-drop)
+TOOLS = {
+    "snap": ("Square ROI grab", "quick_snap", "SquareSelectorApp", True),
+    "intensity": ("Fluorescence intensity", "stained_intensity_cal", "FluorescenceAnalyzer", False),
+    "area": ("Stained-area fraction", "stained_area_cal", "BinaryImageApp", False),
+    "threshold": ("Fixed-threshold area", "stained_area_cal2", "BinaryImageApp", False),
+    "binary": ("Binary preview", "just_binary", "BinaryImageApp", False),
+}
+
+
+def make_root(dnd=True):
+    """Tk root, drag-and-drop capable when tkinterdnd2 is installed."""
+    if dnd:
+        try:
+            from tkinterdnd2 import TkinterDnD
+            return TkinterDnD.Tk()
+        except ImportError:
+            pass
+    return tk.Tk()
+
+
+def _elapsed_ms():
+    return (time.perf_counter() - _STARTED) * 1000
+
+
+class Launcher:
+    def __init__(self, root, timing=False):
+        self.root = root
+        self.timing = timing
+        self.apps = []
+
+    def _log(self, message):
+        if self.timing:
+            print(f"{_elapsed_ms():8.1f} ms  {message}")
+
+    # ---------- chooser ----------
+    def show_chooser(self):
+        self.root.title("quick_Histo_Quant")
+        tk.Label(self.root, text="Choose a tool").pack(padx=20, pady=(10, 5))
+        for name, (title, *_rest) in TOOLS.items():
+            tk.Button(self.root, text=title, width=28,
+                      command=lambda n=name: self.open(n, tk.Toplevel(self.root))
+                      ).pack(padx=20, pady=2)
+        tk.Label(self.root, text="").pack(pady=5)
+        self._log("chooser shown")
+
+    # ---------- opening a tool ----------
+    def open(self, name, window):
+        """Show a loading line in window, then build tool name in it."""
+        title, module, cls, _dnd = TOOLS[name]
+        window.title(title)
+        loading = tk.Label(window, text=f"Loading {title}…", padx=40, pady=30)
+        loading.pack()
+        self._log(f"{name} window shown")
+
+        def done(_module, loaded):
+            loading.destroy()
+            self.apps.append(getattr(loaded, cls)(window))
+            self._log(f"{name} ready")
+
+        def failed(_module, exc):
+            loading.config(text=f"Could not load {title}")
+            messagebox.showerror("Error", f"{title} could not start:\n{exc}", parent=window)
+
+        BackgroundRunner(window).run([module], importlib.import_module,
+                                     on_result=done, on_error=failed)
+
+
+# ---------- import-time report ----------
+def import_times(module):
+    """(total µs, [(µs, package), …]) for importing module in a fresh interpreter.
+
+    The list holds the module's direct imports (cumulative time, their own
+    imports included), slowest first.
+    """
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    if out.returncode:
+        raise ImportError(out.stderr.strip().splitlines()[-1])
+    direct = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:                         # nested imports are listed before their parent
+            direct.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                return int(cumulative), sorted(direct, reverse=True)
+            direct = []
+    raise ImportError(f"{module} missing from the import-time log")
+
+
+def report_import_times(tools, budget_ms=None, top=5):
+    """Print the import cost of each tool; returns the tools over budget_ms."""
+    over = []
+    for name in tools:
+        title, module, _cls, _dnd = TOOLS[name]
+        try:
+            total, rows = import_times(module)
+        except ImportError as exc:
+            print(f"{name:>10}  could not import {module}: {exc}")
+            continue
+        flag = ""
+        if budget_ms is not None and total / 1000 > budget_ms:
+            flag = "  OVER BUDGET"
+            over.append(name)
+        print(f"{name:>10}  {total / 1000:8.1f} ms  {module}{flag}")
+        for us, package in rows[:top]:
+            print(f"{'':>10}  {us / 1000:8.1f} ms    {package}")
+    return over
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Open one of the quick_Histo_Quant tools.")
+    parser.add_argument("tool", nargs="?", choices=TOOLS,
+                        help="tool to open (default: show a chooser)")
+    parser.add_argument("--timing", action="store_true",
+                        help="print when the window appears and when the tool is ready")
+    parser.add_argument("--import-times", action="store_true",
+                        help="report the import cost of each tool instead of opening one")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help=f"with --import-times, exit 1 when a tool imports slower "
+                             f"than this (e.g. {DEFAULT_BUDGET_MS})")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.import_times:
+        over = report_import_times([args.tool] if args.tool else list(TOOLS), args.budget_ms)
+        if over:
+            print(f"{len(over)} tool(s) over the {args.budget_ms:g} ms budget", file=sys.stderr)
+            return 1
+        return 0
+
+    root = make_root(dnd=args.tool is None or TOOLS[args.tool][3])
+    launcher = Launcher(root, args.timing)
+    if args.tool:
+        launcher.open(args.tool, root)
+    else:
+        launcher.show_chooser()
+    root.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Bit-packed binary masks
+ • A PackedMask keeps one bit per pixel (np.packbits, row by row), 1 =
+   positive pixel of the pipeline that made it (black for area, white for
+   binary; pipelines.positive_mask), so it is 8× smaller than the 0/255
+   binary image.
+ • Areas are popcounts over the packed bytes (np.bitwise_count, or a
+   lookup table on NumPy < 2), never unpacking the mask.
+ • With a tissue mask (tissue=True runs) only positive pixels inside the
+   tissue are set, and the tissue mask is kept (packed) alongside, so the
+   area is measured against tissue pixels as in the original row.
+ • Masks save as deflate-compressed 1-bit TIFFs (the tissue mask, if any, as
+   a second page) and load back packed, so archived masks can be
+   re-measured without re-running a pipeline:
+       python packed_mask.py "masks/**/*_mask.tif" -o remeasured.csv
+ • Masks of a batch mirror the input folders below their common root, so
+   slideA/img001.tif and slideB/img001.tif keep separate masks.
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+
+from pipelines import GRAPHS, positive_mask
+from results_sink import write_table
+from stages import StageGraph
+
+MASK_SUFFIX = "_mask.tif"
+COMPRESSION = "zlib"
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(bits):
+        return int(np.bitwise_count(bits).sum(dtype=np.int64))
+else:
+    _BITS_SET = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+
+    def _popcount(bits):
+        return int(_BITS_SET[bits].sum(dtype=np.int64))
+
+
+class PackedMask:
+    def __init__(self, bits, shape, tissue=None):
+        self.bits = bits                     # H × ceil(W / 8) uint8, big-endian bit order
+        self.shape = tuple(shape)
+        self.tissue = tissue                 # PackedMask of the measured pixels, or None
+
+    @classmethod
+    def pack(cls, mask):
+        """PackedMask of a boolean (or nonzero = positive) array."""
+        return cls(np.packbits(mask.astype(bool, copy=False), axis=1), mask.shape)
+
+    @classmethod
+    def from_binary(cls, pipeline, binary, tissue=None):
+        """PackedMask of the positive pixels of a pipeline's 0/255 binary image.
+
+        tissue (uint8, nonzero = measured) limits the positives to the tissue
+        and is kept with the mask.
+        """
+        positive = positive_mask(pipeline, binary)
+        if tissue is None:
+            return cls.pack(positive)
+        inside = tissue > 0
+        positive &= inside
+        return cls(cls.pack(positive).bits, binary.shape, cls.pack(inside))
+
+    # ---------- measuring ----------
+    @property
+    def total(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def measured(self):
+        """Pixels the percentages refer to: the tissue, or the whole image."""
+        return self.total if self.tissue is None else self.tissue.count()
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes + (0 if self.tissue is None else self.tissue.nbytes)
+
+    def count(self, box=None):
+        """Positive pixels, optionally inside box = (y0, y1, x0, x1)."""
+        if box is None:
+            return _popcount(self.bits)      # padding bits of each row are 0
+        y0, y1, x0, x1 = box
+        bits = self.bits[y0:y1, x0 // 8:(x1 + 7) // 8]
+        if x0 % 8 or x1 % 8:                 # clear the bits outside [x0, x1)
+            edge = np.zeros(bits.shape[1] * 8, bool)
+            edge[x0 % 8:x0 % 8 + x1 - x0] = True
+            bits = bits & np.packbits(edge)
+        return _popcount(bits)
+
+    def fraction(self):
+        """% positive pixels (of the tissue, if there is one)."""
+        return self.count() * 100 / self.measured
+
+    # ---------- unpacking ----------
+    def unpack(self, rows=slice(None)):
+        """Boolean mask (of the selected rows)."""
+        return np.unpackbits(self.bits[rows], axis=1, count=self.shape[1]).view(bool)
+
+    def to_binary(self, positive=255):
+        """0/255 uint8 image with positive pixels set to positive (0 or 255)."""
+        mask = self.unpack()
+        return np.where(mask, np.uint8(positive), np.uint8(255 - positive))
+
+    # ---------- files ----------
+    def save(self, path):
+        """Write a compressed 1-bit TIFF (white = positive; page 2 = tissue)."""
+        import tifffile
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with tifffile.TiffWriter(path) as tif:
+            tif.write(self.unpack(), photometric="minisblack", compression=COMPRESSION)
+            if self.tissue is not None:
+                tif.write(self.tissue.unpack(), photometric="minisblack",
+                          compression=COMPRESSION, description="tissue")
+
+    @classmethod
+    def load(cls, path):
+        import tifffile
+        with tifffile.TiffFile(path) as tif:
+            pages = [page.asarray() for page in tif.pages[:2]]
+        if any(page.ndim != 2 for page in pages) or pages[1:] and \
+                pages[1].shape != pages[0].shape:
+            raise ValueError(f"{path} is not a single-plane mask")
+        tissue = cls.pack(pages[1]) if len(pages) > 1 else None
+        return cls(cls.pack(pages[0]).bits, pages[0].shape, tissue)
+
+
+def packed_result(pipeline, source, name, params=None, graph=None, key=None, profiler=None):
+    """(binary, row, PackedMask) of one image, like pipelines.run_pipeline.
+
+    With tissue=True the mask is limited to, and carries, the tissue mask the
+    row was measured in.
+    """
+    if graph is None:
+        graph = StageGraph(GRAPHS[pipeline], memory_budget=0)
+    params = dict(params or {}, name=name)
+    profile = profiler.image(name) if profiler is not None else None
+    binary, row, tissue = graph.run(key, source, params, ("binary", "measure", "tissue"), profile)
+    return binary, row, PackedMask.from_binary(pipeline, binary, tissue)
+
+
+def mask_path(out_dir, image_name, root=None):
+    """Where the mask of an image is archived.
+
+    With root (the folder the inputs were collected from) image_name is a
+    path, and its folders below root are kept, so equal basenames in
+    different folders get different masks.
+    """
+    if root is not None:
+        image_name = os.path.relpath(os.path.abspath(image_name), root)
+    return os.path.join(out_dir, os.path.splitext(image_name)[0] + MASK_SUFFIX)
+
+
+def mask_root(paths):
+    """Common folder of the input paths, for mask_path."""
+    return os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+
+
+def mask_row(name, mask):
+    """Result row of an archived mask."""
+    positive = mask.count()
+    measured = mask.measured
+    row = {
+        "Image Name": name,
+        "Total Pixels": measured,
+        "Positive Pixels": positive,
+        "Positive Pixels (%)": positive * 100 / measured,
+    }
+    if mask.tissue is not None:
+        row["Tissue Area (%)"] = measured * 100 / mask.total
+    return row
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Re-measure archived 1-bit mask TIFFs.")
+    parser.add_argument("inputs", nargs="+", help="mask files and/or glob patterns")
+    parser.add_argument("-o", "--output", default="masks.csv",
+                        help="results table (.csv, .parquet, or .xlsx)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    paths = sorted({p for pattern in args.inputs for p in glob.glob(pattern, recursive=True)
+                    if os.path.isfile(p)})
+    rows = []
+    for path in paths:
+        try:
+            rows.append(mask_row(os.path.basename(path), PackedMask.load(path)))
+        except Exception as e:
+            print(f"Skipped {path}: {e}", file=sys.stderr)
+    if not rows:
+        print("No masks measured.", file=sys.stderr)
+        return 1
+    write_table(rows, args.output)
+    print(f"{len(rows)} mask(s) written to {args.output}")
+    return 0 if len(rows) == len(paths) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
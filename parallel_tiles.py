@@ -0,0 +1,136 @@
+"""
+Tile-parallel execution of one large in-memory image
+ • The image is split into bands of rows (contiguous views, nothing is
+   copied); neighbourhood ops (the white top-hat) get a halo of 2 × radius
+   rows, so every output pixel sees exactly the neighbourhood it would see
+   in the whole image. Bands run on a thread pool – OpenCV and NumPy
+   release the GIL – and are stitched into one output array.
+ • Image-wide steps get a parallel pre-pass: per-band histograms are
+   summed, and the equalization LUT / Otsu threshold come from the merged
+   histogram (quantify.py) before the per-pixel step runs band by band.
+ • Results are bit-identical to the serial path: histograms are exact
+   counts and cv2.LUT with Histogram.equalize_lut() reproduces
+   cv2.equalizeHist.
+ • set_threads(n) sets the thread count used by the pipelines (pipelines.py);
+   the default of 1, or an image under MIN_PARALLEL_PIXELS, runs the plain
+   serial functions. The "downsample" background mode resamples the whole
+   image, so it always runs serially.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from background import subtract_background, DEFAULT_MODE, DEFAULT_RADIUS
+from quantify import Histogram
+
+BANDS_PER_THREAD = 4                 # more bands than threads evens out the load
+MIN_BAND_ROWS = 64
+MIN_PARALLEL_PIXELS = 2**21          # smaller images aren't worth splitting
+_TILE_LOCAL_MODES = ("exact", "opencv", "decomposed")
+
+_threads = 1
+_pool = None                         # (thread count, ThreadPoolExecutor)
+_pool_lock = threading.Lock()
+
+
+def set_threads(threads=None):
+    """Threads each image is split over (None or 0: every core; 1: serial)."""
+    global _threads
+    _threads = max(1, threads or os.cpu_count() or 1)
+
+
+def get_threads():
+    return _threads
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool[0] != _threads:
+            if _pool is not None:
+                _pool[1].shutdown(wait=False)
+            _pool = (_threads, ThreadPoolExecutor(_threads, thread_name_prefix="tile"))
+        return _pool[1]
+
+
+def _parallel(image):
+    return _threads > 1 and image.shape[0] * image.shape[1] >= MIN_PARALLEL_PIXELS
+
+
+def bands(height, halo=0, threads=None):
+    """(core, padded) row ranges as ((y0, y1), (py0, py1)) covering height rows.
+
+    With a halo there is one band per thread (each band at least halo rows),
+    since every band recomputes its halo rows.
+    """
+    threads = threads or _threads
+    count = threads if halo else threads * BANDS_PER_THREAD
+    rows = max(MIN_BAND_ROWS, halo, -(-height // count))
+    for y0 in range(0, height, rows):
+        y1 = min(y0 + rows, height)
+        yield (y0, y1), (max(0, y0 - halo), min(height, y1 + halo))
+
+
+def map_bands(func, image, halo=0):
+    """func applied to halo-padded bands of image, stitched into one array.
+
+    func(band) must return an array with the band's rows (a per-pixel or
+    neighbourhood op).
+    """
+    def run(ranges):
+        (y0, y1), (py0, py1) = ranges
+        return y0, func(image[py0:py1])[y0 - py0:y1 - py0]
+
+    out = None
+    for y0, result in _executor().map(run, list(bands(image.shape[0], halo))):
+        if out is None:
+            out = np.empty(image.shape[:1] + result.shape[1:], result.dtype)
+        out[y0:y0 + result.shape[0]] = result
+    return out
+
+
+def histogram(image, mask=None):
+    """Histogram.of(image, mask), from per-band histograms summed in parallel."""
+    if not _parallel(image):
+        return Histogram.of(image, mask)
+
+    def part(ranges):
+        y0, y1 = ranges[0]
+        return Histogram.of(image[y0:y1], None if mask is None else mask[y0:y1])
+
+    hists = list(_executor().map(part, list(bands(image.shape[0]))))
+    total = Histogram.empty(hists[0].bins)
+    for hist in hists:
+        total += hist
+    return total
+
+
+def apply_lut(image, lut):
+    if not _parallel(image):
+        return cv2.LUT(image, lut)
+    return map_bands(lambda band: cv2.LUT(band, lut), image)
+
+
+def equalize(gray, mask=None):
+    """Histogram equalization of gray (statistics inside mask, if given)."""
+    if mask is None and not _parallel(gray):
+        return cv2.equalizeHist(gray)
+    return apply_lut(gray, histogram(gray, mask).equalize_lut())
+
+
+def tophat(image, radius=DEFAULT_RADIUS, mode=DEFAULT_MODE):
+    """subtract_background(image, radius, mode), band-parallel with a 2 × radius halo."""
+    if not _parallel(image) or mode not in _TILE_LOCAL_MODES:
+        return subtract_background(image, radius, mode)
+    return map_bands(lambda band: subtract_background(band, radius, mode), image, 2 * radius)
+
+
+def binarize(image, threshold):
+    """0/255 image of the pixels above threshold."""
+    def run(band):
+        return cv2.threshold(band, threshold, 255, cv2.THRESH_BINARY)[1]
+    return map_bands(run, image) if _parallel(image) else run(image)
@@ -0,0 +1,310 @@
+"""
+Per-image analysis pipelines shared by the GUI apps and the batch CLI.
+Each function returns the same result row (column names included) that the
+corresponding GUI exports, so headless runs reproduce the GUI numbers.
+All statistics come from one histogram of the measured image (quantify.py).
+Each pipeline is a stage graph (stages.py): load → grayscale → … → measure,
+so callers holding a StageGraph only recompute the stages downstream of a
+changed parameter. With tissue=True every statistic is restricted to the
+tissue detected on a low-resolution level (tissue.py). With stain set
+(e.g. "dab") colour images are decoded in colour and the separated stain
+(stain_separation.py) is measured instead of the grayscale image; the
+binary pipeline measures it inverted, so its positive (white) pixels are
+the stained ones.
+Equalization, top-hat, histograms and thresholding of one image are split
+over parallel_tiles.set_threads() threads (serial by default).
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from background import DEFAULT_MODE, DEFAULT_RADIUS
+from parallel_tiles import binarize, equalize, histogram, tophat
+from stages import Stage, StageGraph
+from stain_separation import DEFAULT_MATRIX, StainSeparator
+from tissue import TissueMask
+
+PIPELINES = ("area", "binary", "intensity")
+DEFAULT_THRESHOLD = 127
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+# bump whenever a pipeline's numbers change; cached results (result_cache.py)
+# from other versions are discarded
+PIPELINE_VERSION = 2
+# pipelines whose positives are bright, so a separated stain is inverted for them
+STAIN_INVERTED = ("binary",)
+
+
+# ---------- loading ----------
+def read_gray(path):
+    """Grayscale read used by the area analyzers (None if unreadable)."""
+    return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+
+def read_color(path):
+    """Colour (BGR) read for stain separation (None if unreadable)."""
+    return cv2.imread(path, cv2.IMREAD_COLOR)
+
+
+def read_intensity_gray(path):
+    """Read as stained_intensity_cal does: keep depth, collapse colour to gray."""
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    return intensity_gray(img)
+
+
+def intensity_gray(img):
+    """Collapse a decoded colour image to gray, keeping its bit depth."""
+    if img.ndim == 3:                    # color or multichannel
+        if img.shape[2] == 3:            # BGR → Gray
+            return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if img.shape[2] == 4:            # BGRA → Gray
+            return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+        raise ValueError("Unsupported channel count > 4. Please supply standard RGB/RGBA images.")
+    return img                           # already grayscale
+
+
+# ---------- result rows (from a histogram of the measured image) ----------
+def myelin_row(name, hist, threshold):
+    """Row for stained_area_cal: pixels <= threshold (black) are myelin-positive."""
+    total_pixels = hist.total
+    positive_pixels = hist.count_at_or_below(threshold)   # myelin-positive (black)
+    negative_pixels = total_pixels - positive_pixels       # myelin-negative (white)
+    return {
+        "Image Name": name,
+        "Total Pixels": total_pixels,
+        "Myelin Positive (%) (black)": (positive_pixels / total_pixels) * 100,
+        "Myelin Negative (%) (white)": (negative_pixels / total_pixels) * 100,
+    }
+
+
+def fixed_threshold_row(name, hist, threshold):
+    """Row for stained_area_cal2 / just_binary: pixels > threshold (white) are positive."""
+    total_pixels = hist.total
+    positive_pixels = hist.count_above(threshold)
+    negative_pixels = total_pixels - positive_pixels
+    return {
+        "Image Name": name,
+        "Total Pixels": total_pixels,
+        "Positive Pixels (%)": (positive_pixels / total_pixels) * 100,
+        "Negative Pixels (%)": (negative_pixels / total_pixels) * 100,
+        "Threshold": threshold,
+    }
+
+
+def with_tissue_area(row, tissue_pixels, image_pixels):
+    """row plus the share of the image that was measured as tissue."""
+    return dict(row, **{"Tissue Area (%)": tissue_pixels / image_pixels * 100})
+
+
+def intensity_row(name, hist):
+    """Row for stained_intensity_cal."""
+    return {
+        "Image Name": name,
+        "Average Intensity": hist.mean(),
+        "Std Intensity": hist.std(),
+        "Min Intensity": hist.min(),
+        "Median Intensity": hist.percentile(50),
+        "Max Intensity": hist.max(),
+    }
+
+
+def positive_mask(pipeline, binary):
+    """Positive pixels of a pipeline's binary: black for area, white for binary."""
+    return binary == 0 if pipeline == "area" else binary > 0
+
+
+# ---------- stage functions ----------
+def _loader(reader, color_reader):
+    def load(source, stain=None):
+        if isinstance(source, np.ndarray):   # already decoded (GUI apps)
+            return source
+        image = (color_reader if stain else reader)(source)
+        if image is None:
+            raise ValueError(f"Could not read image: {source}")
+        return image
+    return load
+
+
+def _read_unchanged(path):
+    return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+
+def _as_gray(image):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _stain(image, gray, stain, stain_matrix):
+    # the image every statistic is taken from: grayscale, or one separated stain
+    if not stain:
+        return gray
+    return StainSeparator.named(stain_matrix).channel(image, stain)
+
+
+def _stain_inverted(image, gray, stain, stain_matrix):
+    # as _stain, but bright = much stain (for pipelines counting white as positive)
+    if not stain:
+        return gray
+    return StainSeparator.named(stain_matrix).channel(image, stain, inverted=True)
+
+
+def _tissue(gray, tissue):
+    # full-resolution uint8 mask, or None to measure the whole frame
+    return TissueMask.of(gray).full() if tissue else None
+
+
+def _equalize(gray, mask):
+    return equalize(gray, mask)
+
+
+def _background(image, background_mode, background_radius):
+    return tophat(image, background_radius, background_mode)
+
+
+def _otsu(hist):
+    return hist.otsu_threshold()
+
+
+def _fixed(hist, threshold):
+    return threshold
+
+
+def _binarize(image, threshold):
+    return binarize(image, threshold)
+
+
+def _tissue_measure(row, hist, mask):
+    return row if mask is None else with_tissue_area(row, hist.total, mask.size)
+
+
+def _myelin_measure(hist, threshold, mask, name):
+    return _tissue_measure(myelin_row(name, hist, threshold), hist, mask)
+
+
+def _fixed_threshold_measure(hist, threshold, mask, name):
+    return _tissue_measure(fixed_threshold_row(name, hist, threshold), hist, mask)
+
+
+def _intensity_histogram(gray, mask):
+    # float images have no finite histogram
+    return histogram(gray, mask) if gray.dtype in (np.uint8, np.uint16) else None
+
+
+def _intensity_measure(gray, hist, mask, name):
+    row = intensity_row(name, hist) if hist is not None else mean_intensity(gray, name, mask)
+    if mask is None:
+        return row
+    return with_tissue_area(row, cv2.countNonZero(mask), mask.size)
+
+
+# ---------- stage graphs ----------
+# stained_area_cal: equalize → top-hat → Otsu; black pixels are positive
+AREA_STAGES = {
+    "load":       Stage(_loader(read_gray, read_color), params={"stain": None}),
+    "grayscale":  Stage(_as_gray, ("load",)),
+    "stain":      Stage(_stain, ("load", "grayscale"),
+                        {"stain": None, "stain_matrix": DEFAULT_MATRIX}),
+    "tissue":     Stage(_tissue, ("grayscale",), {"tissue": False}),
+    "equalize":   Stage(_equalize, ("stain", "tissue")),
+    "background": Stage(_background, ("equalize",),
+                        {"background_mode": DEFAULT_MODE, "background_radius": DEFAULT_RADIUS}),
+    "histogram":  Stage(histogram, ("background", "tissue")),
+    "threshold":  Stage(_otsu, ("histogram",)),
+    "measure":    Stage(_myelin_measure, ("histogram", "threshold", "tissue"), {"name": ""}),
+    "binary":     Stage(_binarize, ("background", "threshold"), memoise=False),
+}
+
+# stained_area_cal2 / just_binary: fixed threshold; white pixels are positive
+BINARY_STAGES = {
+    "load":       Stage(_loader(read_gray, read_color), params={"stain": None}),
+    "grayscale":  Stage(_as_gray, ("load",)),
+    "stain":      Stage(_stain_inverted, ("load", "grayscale"),
+                        {"stain": None, "stain_matrix": DEFAULT_MATRIX}),
+    "tissue":     Stage(_tissue, ("grayscale",), {"tissue": False}),
+    "histogram":  Stage(histogram, ("stain", "tissue")),
+    "threshold":  Stage(_fixed, ("histogram",), {"threshold": DEFAULT_THRESHOLD}),
+    "measure":    Stage(_fixed_threshold_measure, ("histogram", "threshold", "tissue"),
+                        {"name": ""}),
+    "binary":     Stage(_binarize, ("stain", "threshold"), memoise=False),
+}
+
+# stained_intensity_cal: mean (plus spread) of grayscale intensity
+INTENSITY_STAGES = {
+    "load":       Stage(_loader(_read_unchanged, _read_unchanged), params={"stain": None}),
+    "grayscale":  Stage(intensity_gray, ("load",)),
+    "stain":      Stage(_stain, ("load", "grayscale"),
+                        {"stain": None, "stain_matrix": DEFAULT_MATRIX}),
+    "tissue":     Stage(_tissue, ("grayscale",), {"tissue": False}),
+    "histogram":  Stage(_intensity_histogram, ("stain", "tissue")),
+    "measure":    Stage(_intensity_measure, ("stain", "histogram", "tissue"), {"name": ""}),
+}
+
+GRAPHS = {"area": AREA_STAGES, "binary": BINARY_STAGES, "intensity": INTENSITY_STAGES}
+# what each graph's load stage decodes a path with (for callers that read ahead)
+READERS = {"area": read_gray, "binary": read_gray, "intensity": _read_unchanged}
+COLOR_READERS = {"area": read_color, "binary": read_color, "intensity": _read_unchanged}
+
+
+def reader_for(pipeline, params):
+    """The reader a pipeline's load stage uses with these parameters."""
+    return (COLOR_READERS if params.get("stain") else READERS)[pipeline]
+
+
+def run_pipeline(pipeline, source, name, params=None, with_binary=True, graph=None, key=None,
+                 profiler=None):
+    """(binary or None, row) for one image (path or array) through a stage graph.
+
+    Pass a long-lived StageGraph and a per-image key to reuse memoised stages
+    across runs; otherwise every stage is computed once for this call.
+    A profiling.Profiler records each computed stage under the image name.
+    """
+    if graph is None:
+        graph = StageGraph(GRAPHS[pipeline], memory_budget=0)
+    params = dict(params or {}, name=name)
+    profile = profiler.image(name) if profiler is not None else None
+    if with_binary and "binary" in graph.stages:
+        binary, row = graph.run(key, source, params, ("binary", "measure"), profile)
+        return binary, row
+    return None, graph.run(key, source, params, profile=profile)[0]
+
+
+# ---------- measurements ----------
+def myelin_area(image, name, background_mode=DEFAULT_MODE, background_radius=DEFAULT_RADIUS,
+                with_binary=True):
+    """stained_area_cal: equalize → top-hat → Otsu; black pixels are positive.
+
+    Returns (binary or None, row); the binary is only built when requested.
+    """
+    params = {"background_mode": background_mode, "background_radius": background_radius}
+    return run_pipeline("area", image, name, params, with_binary)
+
+
+def fixed_threshold_area(image, name, threshold=DEFAULT_THRESHOLD, with_binary=True):
+    """stained_area_cal2 / just_binary: fixed threshold; white pixels are positive."""
+    return run_pipeline("binary", image, name, {"threshold": threshold}, with_binary)
+
+
+def mean_intensity(gray, name, mask=None):
+    """stained_intensity_cal: mean (plus spread) of grayscale intensity.
+
+    mask (uint8, nonzero = measured) restricts every statistic to part of the image.
+    """
+    if gray.dtype in (np.uint8, np.uint16):
+        return intensity_row(name, histogram(gray, mask))
+    # float images have no finite histogram; fall back to a direct mean
+    return {
+        "Image Name": name,
+        "Average Intensity": float(np.mean(gray if mask is None else gray[mask > 0])),
+    }
+
+
+# ---------- file-level entry points (used by the batch CLI) ----------
+def analyze_file(path, pipeline, profiler=None, **params):
+    """Load one file and run the named pipeline on it; returns the result row."""
+    if pipeline not in GRAPHS:
+        raise ValueError(f"Unknown pipeline {pipeline!r}")
+    _, row = run_pipeline(pipeline, path, os.path.basename(path), params, with_binary=False,
+                          profiler=profiler)
+    return row
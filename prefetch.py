@@ -0,0 +1,106 @@
+"""
+Read-ahead for batch runs
+ • A Prefetcher reads and decodes the next images on I/O threads while the
+   caller processes the current one, so disk / network reads and decoding
+   overlap with compute instead of adding to it.
+ • Bounded twice: at most `depth` images are queued, and no further read is
+   started while queued images would hold more than `memory_budget` bytes
+   (reads still in progress count as the size of the last decoded image;
+   one image is always allowed, so a single huge image can't stall the run).
+ • Images come back in input order with their load time (on the I/O
+   thread) and how long the consumer had to wait for them – near-zero waits
+   mean I/O is fully hidden behind compute.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from stages import nbytes
+
+DEFAULT_DEPTH = 4
+DEFAULT_IO_THREADS = 2
+DEFAULT_PREFETCH_BUDGET = 256 * 2**20
+
+
+class Prefetched:
+    """One loaded image: exactly one of image / error is set."""
+
+    def __init__(self, path, image, error, load_s, load_cpu_s, wait_s, load_start, wait_start):
+        self.path = path
+        self.image = image
+        self.error = error
+        self.load_s = load_s                 # read + decode, on the I/O thread
+        self.load_cpu_s = load_cpu_s
+        self.wait_s = wait_s                 # consumer blocked waiting for it
+        self.load_start = load_start
+        self.wait_start = wait_start
+
+    def record(self, profiler, name):
+        """Add the load ("read") and the I/O wait ("read wait") as stages of name."""
+        profiler.record(name, "read", self.load_start, self.load_s, self.load_cpu_s, None)
+        profiler.record(name, "read wait", self.wait_start, self.wait_s, 0.0, None)
+
+
+class Prefetcher:
+    def __init__(self, paths, reader, depth=DEFAULT_DEPTH, memory_budget=DEFAULT_PREFETCH_BUDGET,
+                 io_threads=DEFAULT_IO_THREADS):
+        self.paths = list(paths)
+        self.reader = reader                 # path → decoded image (None if unreadable)
+        self.depth = max(1, depth)
+        self.memory_budget = memory_budget
+        self.io_threads = io_threads
+        self.total_wait_s = 0.0
+        self.total_load_s = 0.0
+        self._buffered = 0                   # bytes of queued images (estimated until decoded)
+        self._estimate = 0                   # size of the last decoded image
+        self._lock = threading.Lock()
+
+    def _load(self, path, reserved):
+        # runs on an I/O thread
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            image, error = self.reader(path), None
+            if image is None:
+                error = ValueError(f"Could not read image: {path}")
+        except Exception as e:
+            image, error = None, e
+        load_s, load_cpu_s = time.perf_counter() - start, time.thread_time() - cpu
+        with self._lock:
+            size = nbytes(image)
+            self._buffered += size - reserved
+            if size:
+                self._estimate = size
+        return image, error, load_s, load_cpu_s, start
+
+    def __iter__(self):
+        """Yield a Prefetched per path, in input order."""
+        todo = iter(self.paths)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.io_threads) as pool:
+            def fill():
+                while len(pending) < self.depth:
+                    with self._lock:
+                        reserved = self._estimate
+                        if pending and self._buffered + reserved > self.memory_budget:
+                            return           # backpressure: wait for the consumer
+                        path = next(todo, None)
+                        if path is None:
+                            return
+                        self._buffered += reserved
+                    pending.append((path, pool.submit(self._load, path, reserved)))
+
+            fill()
+            while pending:
+                path, future = pending.popleft()
+                wait_start = time.perf_counter()
+                image, error, load_s, load_cpu_s, load_start = future.result()
+                wait_s = time.perf_counter() - wait_start
+                with self._lock:
+                    self._buffered -= nbytes(image)
+                self.total_wait_s += wait_s
+                self.total_load_s += load_s
+                fill()
+                yield Prefetched(path, image, error, load_s, load_cpu_s, wait_s,
+                                 load_start, wait_start)
@@ -0,0 +1,111 @@
+"""
+Per-stage profiling of the analysis pipelines
+ • A Profiler records wall time, CPU time (of the running thread) and peak
+   traced allocation for every stage a StageGraph computes, per image.
+ • The numbers can be added to result rows as extra columns, and all events
+   written as a Chrome trace (open in chrome://tracing or Perfetto).
+ • Off by default: without a profiler the graph only tests for None.
+   Allocation peaks come from tracemalloc, which slows allocation-heavy code
+   while a profiler is active. Its peak counter is process-wide, so a stage
+   that overlapped another stage gets no peak (None); the GUI apps profile
+   one image at a time so that every stage keeps its peak.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import partial
+
+
+def trace_path(table_path):
+    """Where the GUI apps write the trace that goes with an exported table."""
+    return os.path.splitext(table_path)[0] + ".trace.json"
+
+
+class Profiler:
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.events = []
+        self._lock = threading.Lock()
+        self._active = []                    # [overlapped] flag of each running stage
+        self._owns_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, image, name):
+        """Time the enclosed block as stage name of image."""
+        overlapped = [False]
+        with self._lock:
+            for flag in self._active:
+                flag[0] = overlapped[0] = True
+            self._active.append(overlapped)
+            if self.trace_memory and not overlapped[0]:
+                tracemalloc.reset_peak()     # only when it can't cut into another stage
+                base = tracemalloc.get_traced_memory()[0]
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start, time.thread_time() - cpu
+            with self._lock:
+                self._active = [flag for flag in self._active if flag is not overlapped]
+                peak = None
+                if self.trace_memory and not overlapped[0]:
+                    peak = tracemalloc.get_traced_memory()[1] - base
+            self.record(image, name, start, wall, cpu, peak)
+
+    def image(self, image):
+        """stage(name) bound to one image – what StageGraph.run takes."""
+        return partial(self.stage, image)
+
+    def record(self, image, name, start, wall, cpu, peak):
+        event = {"image": image, "stage": name, "start": start, "wall_s": wall,
+                 "cpu_s": cpu, "peak_bytes": peak,
+                 "pid": os.getpid(), "tid": threading.get_ident()}
+        with self._lock:
+            self.events.append(event)
+
+    def merge(self, events):
+        """Add events recorded by another profiler (e.g. in a worker process)."""
+        with self._lock:
+            self.events.extend(events)
+
+    # ---------- output ----------
+    def columns(self, image):
+        """Extra result-table columns for image (latest run of each stage)."""
+        columns = {}
+        for event in self.events:
+            if event["image"] != image:
+                continue
+            stage = event["stage"].title()
+            columns[f"{stage} Wall (s)"] = event["wall_s"]
+            columns[f"{stage} CPU (s)"] = event["cpu_s"]
+            if event["peak_bytes"] is not None:
+                columns[f"{stage} Peak Alloc (bytes)"] = event["peak_bytes"]
+        return columns
+
+    def annotate(self, row):
+        """row plus the columns of the image it names."""
+        return dict(row, **self.columns(row["Image Name"]))
+
+    def write_trace(self, path):
+        """Chrome trace-event JSON of every recorded stage."""
+        events = [{
+            "name": e["stage"], "cat": "stage", "ph": "X",
+            "ts": e["start"] * 1e6, "dur": e["wall_s"] * 1e6,
+            "pid": e["pid"], "tid": e["tid"],
+            "args": {"image": e["image"], "cpu_s": e["cpu_s"], "peak_bytes": e["peak_bytes"]},
+        } for e in self.events]
+        with open(path, "w") as fh:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fh)
+
+    def close(self):
+        """Stop memory tracing; later stages are still timed."""
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+        self.trace_memory = False
@@ -0,0 +1,145 @@
+"""
+Histogram-based quantification shared by all analyzers
+ • One 256-bin (uint8) or 65536-bin (uint16) histogram per image or tile,
+   built by cv2.calcHist without full-size temporaries.
+ • Mean, std, percentiles, min/max, Otsu and fixed-threshold pixel counts
+   are all derived from the histogram, so every statistic costs one pass.
+ • Histograms of tiles merge by simple addition.
+ • percent_above_curve gives "% positive vs threshold" for all thresholds at
+   once, so threshold sweeps need no further image passes.
+ • equalize_lut / otsu_threshold reproduce cv2.equalizeHist and
+   cv2.THRESH_OTSU exactly, so histogram-derived results match OpenCV.
+"""
+
+import cv2
+import numpy as np
+
+_BINS = {np.dtype(np.uint8): 256, np.dtype(np.uint16): 65536}
+
+
+class Histogram:
+    """Pixel-value histogram of an image (or of several merged tiles)."""
+
+    def __init__(self, counts):
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def empty(cls, bins=256):
+        return cls(np.zeros(bins, np.int64))
+
+    @classmethod
+    def of(cls, image, mask=None):
+        """Histogram of a uint8/uint16 image, optionally restricted to a uint8 mask."""
+        bins = _BINS.get(image.dtype)
+        if bins is None:
+            raise TypeError(f"Histogram needs a uint8 or uint16 image, got {image.dtype}")
+        counts = cv2.calcHist([image], [0], mask, [bins], [0, bins])
+        return cls(counts.ravel().astype(np.int64))
+
+    # ---------- merging ----------
+    def __add__(self, other):
+        return Histogram(self.counts + other.counts)
+
+    def __iadd__(self, other):
+        self.counts += other.counts
+        return self
+
+    # ---------- statistics ----------
+    @property
+    def bins(self):
+        return len(self.counts)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def _values(self):
+        return np.arange(self.bins, dtype=np.int64)
+
+    def sum(self):
+        """Sum of all pixel values (integrated intensity), exact."""
+        return int(np.dot(self._values(), self.counts))
+
+    def mean(self):
+        # integer dot product is exact, so this equals np.mean(image)
+        return self.sum() / self.total
+
+    def std(self):
+        """Population standard deviation (same as np.std(image))."""
+        values = self._values().astype(np.float64)
+        mean = self.mean()
+        return float(np.sqrt(np.dot((values - mean) ** 2, self.counts) / self.total))
+
+    def min(self):
+        return int(np.flatnonzero(self.counts)[0])
+
+    def max(self):
+        return int(np.flatnonzero(self.counts)[-1])
+
+    def percentile(self, q):
+        """Smallest value with at least q % of pixels at or below it."""
+        cumulative = np.cumsum(self.counts)
+        rank = max(1, int(np.ceil(q / 100.0 * self.total)))
+        return int(np.searchsorted(cumulative, rank))
+
+    def count_at_or_below(self, threshold):
+        return int(self.counts[:threshold + 1].sum())
+
+    def count_above(self, threshold):
+        return int(self.counts[threshold + 1:].sum())
+
+    def cumulative(self):
+        return np.cumsum(self.counts)
+
+    def percent_above_curve(self):
+        """% of pixels above every possible threshold, from the cumulative histogram."""
+        return 100.0 * (self.total - self.cumulative()) / max(1, self.total)
+
+    def otsu_threshold(self):
+        return otsu_threshold(self.counts)
+
+    def equalize_lut(self):
+        return equalize_lut(self.counts)
+
+
+def equalize_lut(hist):
+    """Lookup table identical to the one cv2.equalizeHist builds from hist."""
+    total = int(hist.sum())
+    lut = np.zeros(256, np.uint8)
+    nonzero = np.flatnonzero(hist)
+    if not len(nonzero):
+        return lut
+    first = nonzero[0]
+    if hist[first] == total:
+        lut[:] = first
+        return lut
+    scale = np.float32(255.0) / np.float32(total - hist[first])
+    cumulative = np.cumsum(hist[first + 1:]).astype(np.float32)
+    lut[first + 1:] = np.clip(np.rint(cumulative * scale), 0, 255)
+    return lut
+
+
+def otsu_threshold(hist):
+    """Threshold cv2.threshold(..., THRESH_OTSU) would pick for this histogram."""
+    total = hist.sum()
+    if total == 0:
+        return 0
+    scale = 1.0 / total
+    mu = float(np.dot(np.arange(len(hist)), hist)) * scale
+    mu1 = q1 = max_sigma = 0.0
+    best = 0
+    eps = np.finfo(np.float32).eps
+    for i, count in enumerate(hist):
+        p_i = count * scale
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+        if min(q1, q2) < eps or max(q1, q2) > 1.0 - eps:
+            continue
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+        if sigma > max_sigma:
+            max_sigma = sigma
+            best = i
+    return best
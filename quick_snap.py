@@ -2,11 +2,19 @@
 Resizable Square‑Cropper
  • Drag‑and‑drop or load an image.
  • The preview automatically fills the window and rescales when the window
-   is resized (aspect ratio preserved).
+   is resized (aspect ratio preserved). Previews are drawn from a cached
+   half-resolution pyramid; while the window is being dragged a cheap
+   redraw is shown and the high-quality pass runs once resizing settles.
+ • Large images are never decoded whole: the preview comes from a
+   reduced-resolution decode and exports decode only the selected region
+   (see region_reader.py).
  • Slider (20 – 2000 px) sets the square crop size; default = 150 px.
  • Click once to preview a red square.
  • “Download Selection” saves the exact‑pixel patch from the full‑resolution
    image.
+ • “Multi‑select” accumulates squares; “Export All” writes every patch in one
+   pass with a manifest (coordinates, mean intensity, % positive) – see
+   roi_export.py.
 Requires:
     pip install pillow tkinterdnd2
 """
@@ -16,11 +24,15 @@ from tkinter import filedialog, messagebox
 from tkinterdnd2 import TkinterDnD, DND_FILES
 from PIL import Image, ImageTk, UnidentifiedImageError
 import os
+from region_reader import RegionReader, build_pyramid, pyramid_level
+from roi_export import export_patches, FORMATS
+from worker import BackgroundRunner
 
 # -------------------- constants --------------------
 DEFAULT_SIZE = 200            # default crop side length (pixels)
 MIN_SIZE, MAX_SIZE = 20, 2000 # slider limits
 START_W, START_H    = 800, 600
+RESIZE_DEBOUNCE_MS  = 150     # idle time before the high-quality redraw
 
 class SquareSelectorApp:
     def __init__(self, root: TkinterDnD.Tk):
@@ -29,12 +41,16 @@ class SquareSelectorApp:
         root.geometry(f"{START_W}x{START_H}")
 
         # ---------- internal state ----------
-        self.original_img   = None  # full‑resolution Pillow image
+        self.source         = None  # RegionReader over the full‑resolution file
         self.display_img    = None  # scaled preview
+        self.pyramid        = []    # preview levels, largest first
+        self.shown_key      = None  # (w, h, high_quality) of the current PhotoImage
+        self.resize_job     = None  # pending debounced high-quality redraw
         self.tk_img         = None  # PhotoImage for Tk
         self.scale_x = self.scale_y = 1  # display→original factors
         self.selected_coords = None      # (x1,y1,x2,y2) in original pixels
         self.last_click = None           # last click (display coords)
+        self.selections = []             # multi‑select squares (original pixels)
         self.crop_size  = DEFAULT_SIZE
 
         # ---------- UI ----------
@@ -48,6 +64,18 @@ class SquareSelectorApp:
                                   state=tk.DISABLED)
         self.save_btn.pack(side=tk.LEFT, padx=5)
 
+        self.multi_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(btn_frame, text="Multi‑select", variable=self.multi_var,
+                       command=self.update_info).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Clear Selections",
+                  command=self.clear_selections).pack(side=tk.LEFT, padx=5)
+        self.export_fmt = tk.StringVar(value="png")
+        tk.OptionMenu(btn_frame, self.export_fmt, *FORMATS).pack(side=tk.LEFT)
+        self.export_btn = tk.Button(btn_frame, text="Export All",
+                                    command=self.export_all, state=tk.DISABLED)
+        self.export_btn.pack(side=tk.LEFT, padx=5)
+        self.runner = BackgroundRunner(root)
+
         self.size_var = tk.IntVar(value=self.crop_size)
         tk.Scale(root, from_=MIN_SIZE, to=MAX_SIZE, orient="horizontal",
                  label="Square size (pixels)",
@@ -70,8 +98,10 @@ class SquareSelectorApp:
         # best Pillow resampling filter
         try:
             self.resample = Image.Resampling.LANCZOS
+            self.fast_resample = Image.Resampling.BILINEAR
         except AttributeError:
             self.resample = Image.LANCZOS
+            self.fast_resample = Image.BILINEAR
 
     # ---------- image loading ----------
     def open_dialog(self):
@@ -90,57 +120,89 @@ class SquareSelectorApp:
 
     def load_image(self, path):
         try:
-            self.original_img = Image.open(path)
+            source = RegionReader(path)
+            self.pyramid = build_pyramid(source.preview())
+            if self.source:
+                self.source.close()
+            self.source = source
+            self.shown_key = None
             self.selected_coords = None
             self.last_click = None
+            self.selections = []
             self.save_btn.config(state=tk.DISABLED)
+            self.export_btn.config(state=tk.DISABLED)
             self.update_display_image()
             self.update_info()
-        except UnidentifiedImageError:
+        except (UnidentifiedImageError, OSError, ValueError):
             messagebox.showerror("Error", f"Cannot open image: {path}")
 
     # ---------- display helpers ----------
-    def update_display_image(self):
-        if not self.original_img:
+    def update_display_image(self, high_quality=True):
+        if not self.source:
             return
         cw, ch = max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
-        ow, oh = self.original_img.size
+        ow, oh = self.source.size
         scale = min(cw / ow, ch / oh)  # ≤1 shrinks, >1 enlarges
         new_w, new_h = max(1, int(ow * scale)), max(1, int(oh * scale))
 
-        self.display_img = self.original_img.resize((new_w, new_h), self.resample)
+        # rebuild the PhotoImage only if the size changed (or to upgrade quality)
+        if self.shown_key and self.shown_key[:2] == (new_w, new_h) \
+                and (self.shown_key[2] or not high_quality):
+            return
+        self.shown_key = (new_w, new_h, high_quality)
+
+        resample = self.resample if high_quality else self.fast_resample
+        self.display_img = pyramid_level(self.pyramid, new_w, new_h).resize((new_w, new_h), resample)
         self.scale_x = ow / new_w
         self.scale_y = oh / new_h
 
-        show_img = (self.display_img.convert("RGB")
-                    if self.display_img.mode in ("RGBA", "P")
-                    else self.display_img)
-        self.tk_img = ImageTk.PhotoImage(show_img)
+        self.tk_img = ImageTk.PhotoImage(self.display_img)
 
         self.canvas.delete("all")
         self.canvas.create_image(0, 0, anchor=tk.NW, image=self.tk_img, tags="img")
 
-        if self.selected_coords:
+        if self.selected_coords or self.selections:
             self.draw_rectangle_overlay()
 
     def on_canvas_resize(self, event):
-        if self.original_img:
-            self.update_display_image()
+        if not self.source:
+            return
+        # cheap redraw now, high-quality pass once resize events stop
+        self.update_display_image(high_quality=False)
+        if self.resize_job:
+            self.root.after_cancel(self.resize_job)
+        self.resize_job = self.root.after(RESIZE_DEBOUNCE_MS, self.finish_resize)
+
+    def finish_resize(self):
+        self.resize_job = None
+        self.update_display_image()
 
     def draw_rectangle_overlay(self):
-        left, top, right, bottom = self.selected_coords
+        self.canvas.delete("rect")
+        for i, coords in enumerate(self.selections):
+            self.draw_box(coords, "blue", label=str(i + 1))
+        if self.selected_coords:
+            self.draw_box(self.selected_coords, "red")
+
+    def draw_box(self, coords, color, label=None):
+        left, top, right, bottom = coords
         disp_left   = left   / self.scale_x
         disp_top    = top    / self.scale_y
         disp_right  = right  / self.scale_x
         disp_bottom = bottom / self.scale_y
-        self.canvas.delete("rect")
         self.canvas.create_rectangle(disp_left, disp_top,
                                      disp_right, disp_bottom,
-                                     outline="red", width=2, tag="rect")
+                                     outline=color, width=2, tag="rect")
+        if label:
+            self.canvas.create_text(disp_left + 3, disp_top + 2, anchor=tk.NW,
+                                    text=label, fill=color, tag="rect")
 
     # ---------- interaction ----------
     def update_info(self):
-        if self.original_img:
+        if self.source and self.multi_var.get():
+            self.info_lbl.config(text=f"Click to add {self.crop_size}×{self.crop_size} px squares "
+                                      f"({len(self.selections)} selected)")
+        elif self.source:
             self.info_lbl.config(text=f"Click to select a {self.crop_size}×{self.crop_size} px square")
         else:
             self.info_lbl.config(text="Load an image to begin")
@@ -148,37 +210,52 @@ class SquareSelectorApp:
     def on_size_change(self, val):
         self.crop_size = int(float(val))
         self.update_info()
-        if self.last_click:
+        if self.last_click and not self.multi_var.get():
             self.draw_square_at(*self.last_click)
 
     def handle_click(self, event):
-        if not self.original_img:
+        if not self.source:
+            return
+        if self.multi_var.get():
+            self.selections.append(self.square_at(event.x, event.y))
+            self.export_btn.config(state=tk.NORMAL)
+            self.draw_rectangle_overlay()
+            self.update_info()
             return
         self.last_click = (event.x, event.y)
         self.draw_square_at(event.x, event.y)
 
-    def draw_square_at(self, x_disp, y_disp):
+    def clear_selections(self):
+        self.selections = []
+        self.export_btn.config(state=tk.DISABLED)
+        self.draw_rectangle_overlay()
+        self.update_info()
+
+    def square_at(self, x_disp, y_disp):
+        """Crop box (original pixels) of a square centred on a display point."""
         half = self.crop_size // 2
         cx_orig = int(x_disp * self.scale_x)
         cy_orig = int(y_disp * self.scale_y)
 
         left   = max(0, cx_orig - half)
         top    = max(0, cy_orig - half)
-        right  = min(self.original_img.width,  left + self.crop_size)
-        bottom = min(self.original_img.height, top  + self.crop_size)
+        right  = min(self.source.width,  left + self.crop_size)
+        bottom = min(self.source.height, top  + self.crop_size)
         left, top = right - self.crop_size, bottom - self.crop_size
+        return (left, top, right, bottom)
 
-        self.selected_coords = (left, top, right, bottom)
+    def draw_square_at(self, x_disp, y_disp):
+        self.selected_coords = self.square_at(x_disp, y_disp)
         self.save_btn.config(state=tk.NORMAL)
         self.draw_rectangle_overlay()
 
     # ---------- saving ----------
     def download_selection(self):
-        if not (self.original_img and self.selected_coords):
+        if not (self.source and self.selected_coords):
             messagebox.showerror("Error", "No selection or image available.")
             return
         x1, y1, x2, y2 = self.selected_coords
-        cropped = self.original_img.crop((x1, y1, x2, y2))
+        cropped = self.source.read_region((x1, y1, x2, y2))  # decodes only this patch
 
         save_path = filedialog.asksaveasfilename(
             defaultextension=".png",
@@ -194,6 +271,36 @@ class SquareSelectorApp:
             except Exception as e:
                 messagebox.showerror("Save Failed", str(e))
 
+    def export_all(self):
+        if not (self.source and self.selections):
+            messagebox.showerror("Error", "No selections to export.")
+            return
+        if self.runner.busy:
+            return
+        out_dir = filedialog.askdirectory(title="Export patches to …")
+        if not out_dir:
+            return
+        path = self.source.path
+        stem = os.path.splitext(os.path.basename(path))[0]
+        boxes, ext = list(self.selections), self.export_fmt.get()
+        self.info_lbl.config(text=f"Exporting {len(boxes)} patches …")
+
+        def export(out_dir):
+            # runs on a worker thread: its own reader, so the Tk thread can keep
+            # cropping from (or replace) self.source meanwhile
+            source = RegionReader(path)
+            try:
+                return export_patches(source, boxes, out_dir, stem, ext)
+            finally:
+                source.close()
+
+        self.runner.run(
+            [out_dir], export,
+            on_result=lambda d, rows: messagebox.showinfo(
+                "Saved", f"{len(rows)} patches + manifest saved to:\n{d}"),
+            on_error=lambda d, e: messagebox.showerror("Export Failed", str(e)),
+            on_done=lambda cancelled: self.update_info())
+
 # -------------------- main --------------------
 if __name__ == "__main__":
     root = TkinterDnD.Tk()
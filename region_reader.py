@@ -0,0 +1,143 @@
+"""
+Lazy image access for quick_snap: reduced-resolution previews and
+region-only decoding for crop export.
+ • Tiled/striped TIFF – only the segments covering a crop are decoded, so
+   crop memory is proportional to the patch, not the slide. Previews use a
+   stored pyramid level when the file has one, otherwise a strided decode
+   that holds one segment at a time.
+ • JPEG – previews use the decoder's DCT scaling (Image.draft).
+ • Everything else falls back to Pillow (decoded once, on first use).
+ • build_pyramid / pyramid_level give the half-resolution display levels
+   quick_snap (and bench.py) resize from.
+"""
+
+import math
+
+import numpy as np
+from PIL import Image
+
+PREVIEW_MAX_SIDE = 2048
+PYRAMID_MIN_SIZE = 256       # stop halving once the longest side is below this
+
+
+def _to_pil(array):
+    if array.ndim == 3 and array.dtype == np.uint16:
+        array = (array >> 8).astype(np.uint8)   # Pillow has no 16-bit RGB mode
+    return Image.fromarray(array)
+
+
+def build_pyramid(img):
+    """[img, 1/2, 1/4, …] display-ready copies of img (Image.reduce box filter)."""
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    levels = [img]
+    while max(levels[-1].size) >= 2 * PYRAMID_MIN_SIZE:
+        levels.append(levels[-1].reduce(2))
+    return levels
+
+
+def pyramid_level(pyramid, width, height):
+    """Smallest pyramid level that is still at least width × height."""
+    for level in reversed(pyramid):
+        if level.width >= width and level.height >= height:
+            return level
+    return pyramid[0]
+
+
+class _TiffBackend:
+    def __init__(self, path):
+        from tiling import TiffSource
+        self.source = TiffSource(path)
+        self.size = (self.source.shape[1], self.source.shape[0])
+        self.levels = self.source.tif.series[0].levels
+
+    def read_region(self, box):
+        return self.read_regions([box])[0]
+
+    def read_regions(self, boxes):
+        raw = self.source.read_raw_many([(y1, y2, x1, x2) for x1, y1, x2, y2 in boxes])
+        return [_to_pil(a) for a in raw]
+
+    def preview(self, max_side):
+        # smallest stored pyramid level that still covers max_side
+        for level in reversed(self.levels[1:]):
+            page = level.keyframe
+            if max(page.imagewidth, page.imagelength) >= max_side:
+                img = _to_pil(level.asarray())
+                img.thumbnail((max_side, max_side))
+                return img
+        return self._strided_preview(max_side)
+
+    def _strided_preview(self, max_side):
+        # every step-th pixel, decoding one segment at a time
+        h, w = self.source.shape
+        step = max(1, math.ceil(max(h, w) / max_side))
+        return _to_pil(self.source.read_raw_strided(step))
+
+    def close(self):
+        self.source.close()
+
+
+class _PillowBackend:
+    def __init__(self, path):
+        self.path = path
+        self.img = Image.open(path)          # header only until pixels are needed
+        self.size = self.img.size
+
+    def read_region(self, box):
+        return self.img.crop(box)
+
+    def read_regions(self, boxes):
+        self.img.load()                      # decode once, then crop every box
+        return [self.img.crop(box) for box in boxes]
+
+    def preview(self, max_side):
+        img = Image.open(self.path)
+        if img.format == "JPEG":
+            img.draft(img.mode, (max_side, max_side))   # DCT-scaled decode
+        img.thumbnail((max_side, max_side))
+        if img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        return img
+
+    def close(self):
+        self.img.close()
+
+
+class RegionReader:
+    """Opens an image without decoding it; decode previews and regions on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self.backend = None
+        if path.lower().endswith((".tif", ".tiff")):
+            try:
+                self.backend = _TiffBackend(path)
+            except Exception:
+                self.backend = None         # compression/layout tifffile can't segment
+        if self.backend is None:
+            self.backend = _PillowBackend(path)
+        self.size = self.backend.size
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def preview(self, max_side=PREVIEW_MAX_SIDE):
+        """Reduced-resolution decode whose longest side is at most max_side."""
+        return self.backend.preview(max_side)
+
+    def read_region(self, box):
+        """Exact full-resolution pixels of box = (left, top, right, bottom)."""
+        return self.backend.read_region(box)
+
+    def read_regions(self, boxes):
+        """read_region for many boxes with a single pass over the source."""
+        return self.backend.read_regions(boxes)
+
+    def close(self):
+        self.backend.close()
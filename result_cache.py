@@ -0,0 +1,181 @@
+"""
+Persistent result cache shared by the GUI apps and the batch CLI
+ • Entries are keyed by the image content hash (BLAKE2b of the file bytes)
+   plus the pipeline name, its full parameters and PIPELINE_VERSION, so
+   renamed or copied images still hit and any parameter or code change misses.
+ • Everything lives in one SQLite file. File hashes are memoised by
+   (path, size, mtime), so repeat runs don't even re-read unchanged images.
+ • Binaries (when the caller has one) are stored PNG-compressed next to the row.
+ • Size-bounded: least-recently-used entries are evicted past max_bytes.
+ • invalidate(pipeline, params) drops one parameter set; entries written by
+   another PIPELINE_VERSION are dropped on open.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from pipelines import PIPELINE_VERSION
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "quick_histo_quant")
+DEFAULT_MAX_BYTES = 512 * 2**20
+HASH_CHUNK = 2**20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key       TEXT PRIMARY KEY,
+    digest    TEXT NOT NULL,
+    pipeline  TEXT NOT NULL,
+    params    TEXT NOT NULL,
+    version   INTEGER NOT NULL,
+    row       TEXT NOT NULL,
+    binary    BLOB,
+    size      INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_lru ON results (last_used);
+CREATE TABLE IF NOT EXISTS digests (
+    path   TEXT PRIMARY KEY,
+    size   INTEGER NOT NULL,
+    mtime  INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+
+def file_digest(path):
+    """BLAKE2b hex digest of a file's bytes, read in chunks."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params_key(pipeline, params):
+    """Canonical text of one parameter set (what invalidate() matches on)."""
+    return json.dumps({"pipeline": pipeline, "params": params}, sort_keys=True)
+
+
+class ResultCache:
+    """On-disk cache of pipeline rows (and optional binaries) keyed by content."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "results.sqlite")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()       # GUI workers share one connection
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+            self._db.execute("DELETE FROM results WHERE version != ?", (PIPELINE_VERSION,))
+
+    # ---------- hashing ----------
+    def digest(self, path):
+        """Content hash of path, re-read only when its size or mtime changed."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            found = self._db.execute(
+                "SELECT digest FROM digests WHERE path = ? AND size = ? AND mtime = ?",
+                (path, st.st_size, st.st_mtime_ns)).fetchone()
+        if found:
+            return found[0]
+        digest = file_digest(path)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                             (path, st.st_size, st.st_mtime_ns, digest))
+        return digest
+
+    # ---------- lookup / store ----------
+    @staticmethod
+    def _key(digest, pipeline, params):
+        text = f"{digest}|{PIPELINE_VERSION}|{params_key(pipeline, params)}"
+        return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+    def get(self, digest, pipeline, params, name=None):
+        """(binary or None, row) for a cached result, or None on a miss.
+
+        name replaces the cached "Image Name" (the same content may have been
+        stored under another file name).
+        """
+        key = self._key(digest, pipeline, params)
+        with self._lock, self._db:
+            found = self._db.execute("SELECT row, binary FROM results WHERE key = ?",
+                                     (key,)).fetchone()
+            if found is None:
+                return None
+            self._db.execute("UPDATE results SET last_used = ? WHERE key = ?",
+                             (time.time(), key))
+        row = json.loads(found[0])
+        if name is not None:
+            row["Image Name"] = name
+        binary = None
+        if found[1] is not None:
+            binary = cv2.imdecode(np.frombuffer(found[1], np.uint8), cv2.IMREAD_UNCHANGED)
+        return binary, row
+
+    def put(self, digest, pipeline, params, row, binary=None):
+        key = self._key(digest, pipeline, params)
+        text = json.dumps(row)
+        blob = None
+        if binary is not None:
+            blob = cv2.imencode(".png", binary)[1].tobytes()
+        size = len(text) + (len(blob) if blob else 0)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (key, digest, pipeline, params_key(pipeline, params),
+                              PIPELINE_VERSION, text, blob, size, time.time()))
+            self._evict()
+
+    def _evict(self):
+        # caller holds the lock and the transaction
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute(
+                "SELECT key, size FROM results ORDER BY last_used").fetchall():
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    # ---------- maintenance ----------
+    def invalidate(self, pipeline=None, params=None):
+        """Drop one parameter set, every entry of a pipeline, or (no args) everything.
+
+        Returns the number of entries removed.
+        """
+        with self._lock, self._db:
+            if pipeline is None:
+                cur = self._db.execute("DELETE FROM results")
+            elif params is None:
+                cur = self._db.execute("DELETE FROM results WHERE pipeline = ?", (pipeline,))
+            else:
+                cur = self._db.execute("DELETE FROM results WHERE params = ?",
+                                       (params_key(pipeline, params),))
+            return cur.rowcount
+
+    def usage(self):
+        """(entries, bytes) currently stored."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_cache(directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """ResultCache, or None when the cache directory can't be used."""
+    try:
+        return ResultCache(directory, max_bytes)
+    except (OSError, sqlite3.Error):
+        return None
@@ -0,0 +1,228 @@
+"""
+Incremental result tables
+ • Sinks append one row per finished image instead of building a DataFrame
+   at the end, so memory stays flat and a crash loses nothing already done.
+ • CSV: every row is flushed (and fsynced) as it is written. Columns first
+   seen in later rows are appended to the header when the sink closes.
+ • Parquet (needs pyarrow): rows are written in row groups; until close()
+   writes the footer, every row is also journaled to <file>.journal.csv,
+   which is removed once the Parquet file is complete. A column first seen
+   after the first row group widens the schema: the groups written so far
+   are copied into a new file with the column null.
+ • Excel is an optional final step: an .xlsx target streams to
+   <table>.xlsx.csv (never to a .csv the user may already have) and
+   converts on close. pandas is imported only for that step.
+ • CSV sinks can append to an existing table (append=True), keeping its
+   header, so long-running jobs can be restarted onto the same file;
+   checkpoint() brings the header and the .xlsx up to date without closing.
+"""
+
+import csv
+import os
+
+DEFAULT_ROW_GROUP = 1000
+
+
+def from_excel(excel_path, csv_path):
+    """Write an existing Excel sheet back out as CSV."""
+    import pandas as pd
+    pd.read_excel(excel_path).to_csv(csv_path, index=False)
+
+
+def to_excel(rows_or_csv, out_path):
+    """Write rows (or an existing CSV file) as an Excel sheet."""
+    import pandas as pd
+    if isinstance(rows_or_csv, str):
+        frame = pd.read_csv(rows_or_csv)
+    else:
+        frame = pd.DataFrame(rows_or_csv)
+    frame.to_excel(out_path, index=False)
+
+
+class CsvSink:
+    def __init__(self, path, fsync=True, excel_path=None, append=False):
+        self.path = path
+        self.fsync = fsync
+        self.excel_path = excel_path         # converted on close; the CSV is then removed
+        self.append = append                 # … unless it is a running table appended to
+        self.count = 0
+        self.fieldnames = None
+        self._header = None
+        if append and os.path.exists(path) and os.path.getsize(path):
+            with open(path, newline="") as fh:
+                self.fieldnames = next(csv.reader(fh), None)
+            self._header = list(self.fieldnames or [])
+        self._fh = open(path, "a" if append else "w", newline="")
+        self._writer = csv.writer(self._fh)
+
+    def write(self, row):
+        if self.fieldnames is None:
+            self.fieldnames = list(row)
+            self._header = list(self.fieldnames)
+            self._writer.writerow(self.fieldnames)
+        self.fieldnames += [k for k in row if k not in self.fieldnames]
+        self._writer.writerow([row.get(k, "") for k in self.fieldnames])
+        self.count += 1
+        self.flush()
+
+    @property
+    def closed(self):
+        return self._fh.closed
+
+    def flush(self):
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+
+    def close(self):
+        if self.closed:
+            return
+        self._sync()
+        if self.excel_path and not self.append:
+            os.remove(self.path)
+
+    def _sync(self):
+        self._fh.close()
+        if self.fieldnames and self.fieldnames != self._header:
+            self._rewrite_header()
+        if self.excel_path and self.count:
+            to_excel(self.path, self.excel_path)
+
+    def checkpoint(self):
+        """Label new columns and refresh the .xlsx now, then keep appending.
+
+        For long-running writers (watch_folder.py) whose table is read while
+        it grows; each call rereads the whole CSV once.
+        """
+        if self.closed or not self.count:
+            return
+        self._sync()
+        self._header = list(self.fieldnames)
+        self._fh = open(self.path, "a", newline="")
+        self._writer = csv.writer(self._fh)
+
+    def _rewrite_header(self):
+        tmp = self.path + ".tmp"
+        with open(self.path, newline="") as src, open(tmp, "w", newline="") as dst:
+            src.readline()
+            csv.writer(dst).writerow(self.fieldnames)
+            for line in src:
+                dst.write(line)
+        os.replace(tmp, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetSink:
+    def __init__(self, path, row_group_size=DEFAULT_ROW_GROUP, fsync=True):
+        try:
+            import pyarrow                      # noqa: F401
+            import pyarrow.parquet              # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)") from None
+        self.path = path
+        self.row_group_size = row_group_size
+        self.count = 0
+        self._rows = []
+        self._schema = None
+        self._writer = None
+        self._writing = path                 # file the open writer writes (see _widen)
+        self.journal = CsvSink(path + ".journal.csv", fsync)
+
+    def write(self, row):
+        self.journal.write(row)
+        self._rows.append(row)
+        self.count += 1
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as one row group."""
+        if not self._rows:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._writer is None:
+            table = pa.Table.from_pylist(self._rows)
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        else:
+            names = set(self._schema.names)
+            extra = [k for k in dict.fromkeys(k for row in self._rows for k in row)
+                     if k not in names]
+            if extra:
+                self._widen(pa.Table.from_pylist(self._rows).schema, extra)
+            table = pa.Table.from_pylist(self._rows, schema=self._schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def _widen(self, schema, columns):
+        # Parquet schemas are fixed per file: copy the row groups written so
+        # far into a new file whose schema has the new columns (null there)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._writer.close()
+        widened = pa.schema(list(self._schema) + [schema.field(name) for name in columns])
+        target = self.path + (".widened" if self._writing == self.path else "")
+        writer = pq.ParquetWriter(target, widened)
+        done = pq.ParquetFile(self._writing)
+        for i in range(done.num_row_groups):
+            group = done.read_row_group(i)
+            for name in columns:
+                group = group.append_column(widened.field(name),
+                                            pa.nulls(len(group), widened.field(name).type))
+            writer.write_table(group)
+        done.close()
+        if target == self.path:              # the copy went back under the final name
+            os.remove(self._writing)
+        self._writer, self._writing, self._schema = writer, target, widened
+
+    def close(self):
+        if self.journal.closed:
+            return
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            if self._writing != self.path:
+                os.replace(self._writing, self.path)
+        self.journal.close()
+        os.remove(self.journal.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sink(path, row_group_size=DEFAULT_ROW_GROUP, fsync=True, append=False):
+    """Sink for path by extension: .parquet, .csv, or .xlsx (CSV + Excel on close).
+
+    append=True adds rows to an existing .csv (or the <table>.xlsx.csv behind
+    an .xlsx).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        if append:
+            raise ValueError("Parquet tables can't be appended to; use .csv or .xlsx")
+        return ParquetSink(path, row_group_size, fsync)
+    if ext in (".xlsx", ".xls"):
+        stream = path + ".csv"
+        if append and os.path.exists(path) and not os.path.exists(stream):
+            from_excel(path, stream)         # keep the rows of a table streamed elsewhere
+        return CsvSink(stream, fsync, excel_path=path, append=append)
+    return CsvSink(path, fsync, append=append)
+
+
+def write_table(rows, out_path):
+    """Write a finished list of rows (.csv, .parquet or .xlsx)."""
+    if out_path.lower().endswith((".xlsx", ".xls")):
+        to_excel(rows, out_path)
+        return
+    with open_sink(out_path, fsync=False) as sink:
+        for row in rows:
+            sink.write(row)
@@ -0,0 +1,77 @@
+"""
+Multi-ROI patch export (used by quick_snap's multi-select mode)
+ • Every patch comes from a single pass over the source image
+   (RegionReader.read_regions – each TIFF segment is decoded once).
+ • Patch files are encoded in parallel on a thread pool.
+ • Mean intensity and % positive (fixed threshold, white = positive as in
+   stained_area_cal2) are measured from the same decoded pixels.
+ • A manifest (CSV + JSON) records file names, coordinates and measurements.
+"""
+
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from pipelines import DEFAULT_THRESHOLD
+from quantify import Histogram
+
+FORMATS = {"png": "PNG", "tif": "TIFF", "jpg": "JPEG"}
+_GRAY_CODES = {"RGB": cv2.COLOR_RGB2GRAY, "RGBA": cv2.COLOR_RGBA2GRAY}
+
+
+def patch_gray(patch):
+    """Grayscale pixels of a Pillow patch (16-bit kept as uint16)."""
+    if patch.mode in _GRAY_CODES:
+        return cv2.cvtColor(np.asarray(patch), _GRAY_CODES[patch.mode])
+    if patch.mode in ("L", "I;16"):
+        return np.asarray(patch)
+    return np.asarray(patch.convert("L"))
+
+
+def measure_patch(patch, threshold=DEFAULT_THRESHOLD):
+    gray = patch_gray(patch)
+    gray8 = gray if gray.dtype == np.uint8 else (gray >> 8).astype(np.uint8)
+    hist8 = Histogram.of(gray8)
+    return {
+        "Mean Intensity": Histogram.of(gray).mean(),
+        "Positive Pixels (%)": hist8.count_above(threshold) / hist8.total * 100,
+    }
+
+
+def _save(patch, path, fmt):
+    if fmt == "JPEG" and patch.mode not in ("L", "RGB"):
+        patch = patch.convert("RGB")
+    patch.save(path, format=fmt)
+
+
+def export_patches(reader, boxes, out_dir, stem="patch", ext="png",
+                   threshold=DEFAULT_THRESHOLD, workers=None):
+    """Write one file per box plus manifest.csv / manifest.json; returns the rows."""
+    fmt = FORMATS[ext]
+    patches = reader.read_regions(boxes)
+    paths = [os.path.join(out_dir, f"{stem}_{i+1:03d}.{ext}") for i in range(len(boxes))]
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        saves = [pool.submit(_save, patch, path, fmt) for patch, path in zip(patches, paths)]
+        # measure while the encoders run
+        for i, (patch, path, box) in enumerate(zip(patches, paths, boxes)):
+            left, top, right, bottom = box
+            row = {"Patch": i + 1, "File": os.path.basename(path),
+                   "Left": left, "Top": top, "Right": right, "Bottom": bottom}
+            row.update(measure_patch(patch, threshold))
+            rows.append(row)
+        for future in saves:
+            future.result()                  # re-raise encoding errors
+
+    with open(os.path.join(out_dir, "manifest.csv"), "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(out_dir, "manifest.json"), "w") as fh:
+        json.dump({"source": reader.path, "threshold": threshold, "patches": rows}, fh, indent=2)
+    return rows
@@ -0,0 +1,490 @@
+"""
+Sharded batch runs across several machines
+ • `manifest` enumerates a study into a JSON manifest: the file list (paths
+   relative to the manifest, so every node can mount the share elsewhere),
+   the pipeline, its parameters and PIPELINE_VERSION. Every node runs
+   exactly these settings.
+ • `run` processes part of the manifest on one node, in one of two ways:
+     --shard k/N  files k, k + N, k + 2N, … (a fixed split, nodes known up front)
+     --claim      chunks of --chunk files, claimed by creating a lock file
+                  (O_EXCL) in the shared parts folder; nodes can join at any
+                  time; a heartbeat thread refreshes each held lock, and locks
+                  not refreshed for --stale seconds are taken over, so a
+                  crashed node's work is redone.
+   Each finished part is a .csv of rows plus a .json with the manifest
+   indices, the errors, and mergeable statistics: the summed histogram of
+   the measured image per bit depth and the positive / measured pixel counts.
+   The .json is written last (atomically), so a part without one is
+   unfinished and parts already done are skipped on re-runs.
+ • `merge` combines the parts into one table in manifest order, reports
+   files still missing, and writes a pooled row for the whole cohort
+   (<table>_pooled.csv) from the merged histograms.
+ • `local` runs N worker processes on this machine as stand-in nodes and
+   merges, to try a setup (or use every core) without a cluster.
+Examples:
+    python shards.py manifest binary /mnt/study -o /mnt/study/run.manifest.json --threshold 100
+    python shards.py run /mnt/study/run.manifest.json --shard 3/8          # on node 3
+    python shards.py run /mnt/study/run.manifest.json --claim              # on any node
+    python shards.py merge /mnt/study/run.manifest.json -o cohort.xlsx
+    python shards.py local /mnt/study/run.manifest.json -n 4 -o cohort.csv
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from batch_quant import add_pipeline_arguments, collect_inputs, pipeline_params
+from parallel_tiles import set_threads
+from pipelines import (GRAPHS, IMAGE_EXTENSIONS, PIPELINE_VERSION, fixed_threshold_row,
+                       intensity_row, reader_for)
+from prefetch import Prefetcher
+from quantify import Histogram
+from results_sink import open_sink, write_table
+from stages import StageGraph
+
+MANIFEST_VERSION = 1
+DEFAULT_CHUNK = 16                          # files per claimed chunk
+DEFAULT_STALE = 600.0                       # seconds without a heartbeat before a lock is taken over
+PARTS_SUFFIX = ".parts"
+
+
+# ---------- manifest ----------
+def write_manifest(path, pipeline, params, files):
+    """Write a manifest of files (paths stored relative to the manifest)."""
+    base = os.path.dirname(os.path.abspath(path))
+    entries = []
+    for f in files:
+        st = os.stat(f)
+        entries.append({"path": os.path.relpath(os.path.abspath(f), base),
+                        "size": st.st_size, "mtime": st.st_mtime})
+    manifest = {"version": MANIFEST_VERSION, "pipeline_version": PIPELINE_VERSION,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "pipeline": pipeline,
+                "params": params, "files": entries}
+    _write_json(path, manifest)
+    return manifest
+
+
+def load_manifest(path):
+    with open(path) as fh:
+        manifest = json.load(fh)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"{path}: unsupported manifest version {manifest.get('version')}")
+    if manifest["pipeline_version"] != PIPELINE_VERSION:
+        raise ValueError(f"{path} was made for pipeline version {manifest['pipeline_version']}, "
+                         f"this node runs {PIPELINE_VERSION}; update the nodes or re-create it")
+    return manifest
+
+
+def manifest_paths(manifest_path, manifest):
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    return [os.path.normpath(os.path.join(base, f["path"])) for f in manifest["files"]]
+
+
+def parts_dir(manifest_path):
+    return os.path.splitext(manifest_path)[0] + PARTS_SUFFIX
+
+
+def _write_json(path, value):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(value, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)                   # readers never see a half-written file
+
+
+# ---------- work units ----------
+def shard_units(count, shard, shards):
+    """The single unit (name, indices) of shard k of N."""
+    return [(f"shard-{shard:04d}-of-{shards:04d}", list(range(shard, count, shards)))]
+
+
+def chunk_units(count, chunk=DEFAULT_CHUNK):
+    return [(f"chunk-{start // chunk:06d}", list(range(start, min(start + chunk, count))))
+            for start in range(0, count, chunk)]
+
+
+class LockClaim:
+    """Claims a unit by creating <unit>.lock exclusively.
+
+    The lock file holds a per-claim owner token; while held, a heartbeat
+    thread refreshes its mtime every stale / 4 seconds, so a node busy on
+    one long image keeps its unit. refresh() and release() only touch a lock
+    that still carries this owner, so a node whose lock was taken over
+    neither revives nor removes the new owner's lock.
+    """
+
+    def __init__(self, directory, unit, stale=DEFAULT_STALE):
+        self.path = os.path.join(directory, unit + ".lock")
+        self.stale = stale
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}"
+        self.lost = False
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _create(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as fh:
+            fh.write(self.owner)
+        return True
+
+    @staticmethod
+    def _state(path):
+        # (mtime, owner) of a lock file; FileNotFoundError if it is gone
+        mtime = os.stat(path).st_mtime
+        with open(path) as fh:
+            return mtime, fh.read()
+
+    def _restore(self, aside):
+        # put a lock we moved aside back, unless someone has created a new one since
+        try:
+            os.link(aside, self.path)
+        except FileExistsError:
+            pass
+        except OSError:                      # no hard links on this filesystem
+            if not os.path.exists(self.path):
+                os.rename(aside, self.path)
+                return
+        os.remove(aside)
+
+    def acquire(self):
+        if not self._create():
+            try:
+                seen = self._state(self.path)
+            except FileNotFoundError:
+                return self._start() if self._create() else False
+            if time.time() - seen[0] < self.stale:
+                return False
+            # stale: move it aside atomically, so only one node takes it over
+            aside = f"{self.path}.stale-{self.owner.replace(':', '-')}"
+            try:
+                os.rename(self.path, aside)
+            except OSError:
+                return False
+            # another node may have taken it over (and re-created or refreshed
+            # it) between the stat and the rename: then hand it back and back off
+            try:
+                moved = self._state(aside)
+            except FileNotFoundError:
+                return False
+            if moved != seen:
+                self._restore(aside)
+                return False
+            os.remove(aside)
+            if not self._create():
+                return False
+        return self._start()
+
+    def _start(self):
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True,
+                                           name=f"heartbeat {os.path.basename(self.path)}")
+        self._heartbeat.start()
+        return True
+
+    def _beat(self):
+        while not self._stop.wait(self.stale / 4):
+            if not self.refresh():
+                return
+
+    def _owned(self):
+        try:
+            with open(self.path) as fh:
+                return fh.read() == self.owner
+        except FileNotFoundError:
+            return False
+
+    def refresh(self):
+        """Touch the lock; False (and lost set) once it belongs to someone else."""
+        if self.lost or not self._owned():
+            self.lost = True
+            return False
+        os.utime(self.path)
+        return True
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        # move it aside first, so a lock re-created by a new owner meanwhile is never removed
+        aside = f"{self.path}.release-{self.owner.replace(':', '-')}"
+        try:
+            os.rename(self.path, aside)
+        except FileNotFoundError:
+            return
+        with open(aside) as fh:
+            ours = fh.read() == self.owner
+        if ours:
+            os.remove(aside)
+        else:
+            self._restore(aside)
+
+
+def _is_done(directory, unit):
+    return os.path.exists(os.path.join(directory, unit + ".json"))
+
+
+# ---------- running ----------
+def run_unit(manifest, paths, unit, indices, directory, on_progress=None):
+    """Measure the files of one unit; writes <unit>.csv and then <unit>.json."""
+    pipeline, params = manifest["pipeline"], manifest["params"]
+    graph = StageGraph(GRAPHS[pipeline], memory_budget=0)
+    targets = ("measure", "histogram") + (("threshold",) if "threshold" in graph.stages else ())
+    csv_path = os.path.join(directory, unit + ".csv")
+    done, errors, histograms = [], {}, {}
+    positive = measured = 0
+    partial = f"{csv_path}.{os.getpid()}.partial"
+    by_path = {paths[i]: i for i in indices}
+    with open_sink(partial) as sink:
+        for item in Prefetcher([paths[i] for i in indices], reader_for(pipeline, params)):
+            index = by_path[item.path]
+            try:
+                if item.error:
+                    raise item.error
+                name = os.path.basename(item.path)
+                row, hist, *threshold = graph.run(None, item.image, dict(params, name=name),
+                                                  targets)
+            except Exception as e:
+                errors[str(index)] = f"{item.path}: {e}"
+                continue
+            finally:
+                if on_progress is not None:
+                    on_progress()
+            sink.write(row)
+            done.append(index)
+            if hist is not None:
+                merged = histograms.get(hist.bins)
+                histograms[hist.bins] = hist if merged is None else merged + hist
+                measured += hist.total
+                if threshold:
+                    positive += (hist.count_at_or_below(threshold[0]) if pipeline == "area"
+                                 else hist.count_above(threshold[0]))
+    if done:
+        os.replace(partial, csv_path)
+    else:
+        os.remove(partial)
+    _write_json(os.path.join(directory, unit + ".json"),
+                {"unit": unit, "node": socket.gethostname(), "finished": time.time(),
+                 "indices": done, "errors": errors,
+                 "histograms": {str(b): h.counts.tolist() for b, h in histograms.items()},
+                 "positive_pixels": positive, "measured_pixels": measured})
+    return len(done), len(errors)
+
+
+def run_node(manifest_path, shard=None, claim=False, chunk=DEFAULT_CHUNK, stale=DEFAULT_STALE,
+             force=False, log=print):
+    """Process a shard (shard = (k, N)) or claim chunks until none are left."""
+    manifest = load_manifest(manifest_path)
+    paths = manifest_paths(manifest_path, manifest)
+    directory = parts_dir(manifest_path)
+    os.makedirs(directory, exist_ok=True)
+    units = shard_units(len(paths), *shard) if shard else chunk_units(len(paths), chunk)
+    total_done = total_failed = 0
+    for unit, indices in units:
+        if not indices or (_is_done(directory, unit) and not force):
+            continue
+        lock = LockClaim(directory, unit, stale) if claim else None
+        if lock is not None and not lock.acquire():
+            continue
+        try:
+            if lock is not None and _is_done(directory, unit):
+                continue                     # finished while we were claiming it
+            done, failed = run_unit(manifest, paths, unit, indices, directory)
+        finally:
+            if lock is not None:
+                lock.release()
+        if lock is not None and lock.lost:
+            log(f"{unit}: lock was taken over by another node while running; "
+                "its part may have been written twice")
+        total_done += done
+        total_failed += failed
+        log(f"{unit}: {done} image(s), {failed} failed")
+    return total_done, total_failed
+
+
+# ---------- merging ----------
+def read_parts(directory):
+    """Every finished part's status (the .json) with its rows (the .csv)."""
+    import csv
+    parts = []
+    for entry in sorted(os.listdir(directory)):
+        if not entry.endswith(".json"):
+            continue
+        with open(os.path.join(directory, entry)) as fh:
+            part = json.load(fh)
+        csv_path = os.path.join(directory, entry[:-5] + ".csv")
+        part["rows"] = []
+        if part["indices"]:
+            with open(csv_path, newline="") as fh:
+                part["rows"] = [_parse_row(r) for r in csv.DictReader(fh)]
+        parts.append(part)
+    return parts
+
+
+def _parse_row(row):
+    # CSV text back to numbers, so merged tables keep numeric columns
+    parsed = {}
+    for key, value in row.items():
+        if value == "":
+            parsed[key] = None
+            continue
+        for kind in (int, float):
+            try:
+                parsed[key] = kind(value)
+                break
+            except ValueError:
+                pass
+        else:
+            parsed[key] = value
+    return parsed
+
+
+def pooled_rows(pipeline, params, histograms, positive, measured, images):
+    """One cohort row per bit depth from the merged histograms."""
+    rows = []
+    for bins, hist in sorted(histograms.items(), key=lambda kv: int(kv[0])):
+        name = f"All images ({images})" if len(histograms) == 1 else \
+            f"All {'8' if int(bins) == 256 else '16'}-bit images"
+        if pipeline == "intensity":
+            row = intensity_row(name, hist)
+        elif pipeline == "binary":
+            row = fixed_threshold_row(name, hist, params.get("threshold"))
+        else:                                # each image had its own Otsu threshold
+            row = {"Image Name": name, "Total Pixels": measured,
+                   "Myelin Positive (%) (black)": positive * 100 / measured,
+                   "Myelin Negative (%) (white)": (measured - positive) * 100 / measured}
+        rows.append(row)
+    return rows
+
+
+def merge(manifest_path, output, log=print):
+    """Write the merged table (and <output>_pooled.csv); returns missing indices."""
+    manifest = load_manifest(manifest_path)
+    paths = manifest_paths(manifest_path, manifest)
+    rows, errors, histograms = {}, {}, {}
+    positive = measured = 0
+    for part in read_parts(parts_dir(manifest_path)):
+        fresh = [i not in rows for i in part["indices"]]
+        for index, row, new in zip(part["indices"], part["rows"], fresh):
+            if new:                          # an image in several parts counts once
+                rows[index] = row
+        if not all(fresh):
+            log(f"{part['unit']} overlaps other parts (shards and chunks mixed?); "
+                "its images are left out of the pooled statistics")
+            continue
+        for bins, counts in part["histograms"].items():
+            merged = histograms.get(bins)
+            histograms[bins] = Histogram(counts) if merged is None else merged + Histogram(counts)
+        positive += part["positive_pixels"]
+        measured += part["measured_pixels"]
+        for index, error in part["errors"].items():
+            errors.setdefault(int(index), error)
+    for index in rows:
+        errors.pop(index, None)
+    missing = [i for i in range(len(paths)) if i not in rows and i not in errors]
+
+    if rows:
+        write_table([rows[i] for i in sorted(rows)], output)
+        pooled = pooled_rows(manifest["pipeline"], manifest["params"], histograms,
+                             positive, measured, len(rows))
+        if pooled:
+            write_table(pooled, os.path.splitext(output)[0] + "_pooled.csv")
+    log(f"{len(rows)} image(s) merged into {output}; {len(errors)} failed, "
+        f"{len(missing)} not processed yet")
+    for index in sorted(errors):
+        log(f"Skipped {errors[index]}")
+    return missing
+
+
+# ---------- command line ----------
+def _shard(text):
+    k, _, n = text.partition("/")
+    try:
+        k, n = int(k), int(n)
+    except ValueError:
+        raise argparse.ArgumentTypeError("use k/N, e.g. 0/4") from None
+    if not 0 <= k < n:
+        raise argparse.ArgumentTypeError("k must be in 0 … N-1")
+    return k, n
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Manifest-driven batch runs over several nodes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    make = commands.add_parser("manifest", help="enumerate a study into a manifest")
+    add_pipeline_arguments(make)
+    make.add_argument("inputs", nargs="+", help="image folders and/or glob patterns")
+    make.add_argument("-o", "--output", required=True, help="manifest path (.json)")
+
+    run = commands.add_parser("run", help="process a shard, or claim chunks, on this node")
+    run.add_argument("manifest")
+    which = run.add_mutually_exclusive_group(required=True)
+    which.add_argument("--shard", type=_shard, metavar="k/N", help="process shard k of N")
+    which.add_argument("--claim", action="store_true",
+                       help="claim chunks through lock files until none are left")
+    run.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="files per claimed chunk")
+    run.add_argument("--stale", type=float, default=DEFAULT_STALE,
+                     help="seconds after which another node's lock is taken over")
+    run.add_argument("--threads", type=int, default=None,
+                     help="threads each image is split over (default: every core)")
+    run.add_argument("--force", action="store_true", help="redo parts that are already done")
+
+    join = commands.add_parser("merge", help="combine finished parts into one table")
+    join.add_argument("manifest")
+    join.add_argument("-o", "--output", default="results.csv",
+                      help="merged table (.csv, .parquet, or .xlsx)")
+
+    local = commands.add_parser("local", help="run N local worker processes, then merge")
+    local.add_argument("manifest")
+    local.add_argument("-n", "--nodes", type=int, default=os.cpu_count() or 1)
+    local.add_argument("--claim", action="store_true",
+                       help="workers claim chunks instead of taking shard k of N")
+    local.add_argument("--chunk", type=int, default=DEFAULT_CHUNK)
+    local.add_argument("-o", "--output", default="results.csv")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == "manifest":
+            paths = collect_inputs(args.inputs, IMAGE_EXTENSIONS)
+            if not paths:
+                print("No image files found.", file=sys.stderr)
+                return 1
+            write_manifest(args.output, args.pipeline, pipeline_params(args), paths)
+            print(f"{len(paths)} file(s) listed in {args.output}")
+            return 0
+        if args.command == "run":
+            set_threads(args.threads)
+            _, failed = run_node(args.manifest, args.shard, args.claim, args.chunk, args.stale,
+                                 args.force)
+            return 1 if failed else 0
+        if args.command == "merge":
+            return 1 if merge(args.manifest, args.output) else 0
+    except (OSError, ValueError, ImportError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    # local: stand-in nodes sharing this machine's cores
+    threads = max(1, (os.cpu_count() or 1) // args.nodes)
+    command = [sys.executable, os.path.abspath(__file__), "run", args.manifest,
+               "--threads", str(threads)]
+    workers = [subprocess.Popen(command + (["--claim", "--chunk", str(args.chunk)] if args.claim
+                                           else ["--shard", f"{k}/{args.nodes}"]))
+               for k in range(args.nodes)]
+    failed = sum(worker.wait() != 0 for worker in workers)
+    missing = merge(args.manifest, args.output)
+    return 1 if failed or missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Multi-page / multi-channel fluorescence stacks
+ • Reads ImageJ hyperstacks, OME-TIFF, plain multi-page TIFF and TIFFs with
+   many samples per pixel (one channel per sample) through tifffile, one
+   page at a time – the whole stack is never held in memory. Other formats
+   are read as a single plane with one channel per colour component.
+ • One pass gives, per time point / z-plane / channel, the pixel count,
+   mean, integrated intensity, spread and range (from a histogram,
+   quantify.py), plus the same statistics of the maximum-intensity
+   projection over z for every channel (only the running projections are
+   kept).
+ • Rows are long-format (one per plane and channel, then one per
+   projection, marked Projection = "max") and can be streamed to .csv,
+   .parquet or .xlsx with results_sink.py.
+Example:
+    python stacks.py confocal/*.tif -o planes.csv
+"""
+
+import argparse
+import glob
+import math
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from quantify import Histogram
+from results_sink import open_sink
+
+STACK_EXTENSIONS = (".tif", ".tiff")
+PROJECTION = "max"
+
+
+def plane_row(name, t, z, c, plane, projection=""):
+    """Long-format statistics row of one 2-D plane (z is None for projections)."""
+    row = {"Image Name": name, "Time": t, "Z": z, "Channel": c, "Projection": projection,
+           "Pixels": plane.size}
+    if plane.dtype in (np.uint8, np.uint16):
+        hist = Histogram.of(plane)
+        row.update({
+            "Mean Intensity": hist.mean(),
+            "Integrated Intensity": hist.sum(),
+            "Std Intensity": hist.std(),
+            "Min Intensity": hist.min(),
+            "Max Intensity": hist.max(),
+        })
+    else:
+        plane = plane.astype(np.float64, copy=False)
+        row.update({
+            "Mean Intensity": float(plane.mean()),
+            "Integrated Intensity": float(plane.sum()),
+            "Std Intensity": float(plane.std()),
+            "Min Intensity": float(plane.min()),
+            "Max Intensity": float(plane.max()),
+        })
+    return row
+
+
+class StackReader:
+    """Streams (t, z, c, plane) from an image file, one decoded page at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.tif = None
+        if path.lower().endswith(STACK_EXTENSIONS):
+            import tifffile
+            self.tif = tifffile.TiffFile(path)
+            series = self.tif.series[0]
+            axes, shape = series.get_axes(False), series.get_shape(False)
+            split = axes.index("Y")
+            self._page_axes, self._page_shape = axes[:split], shape[:split]
+            samples = shape[axes.index("S")] if "S" in axes else 1
+            # planar configuration (SYX): each page holds its samples before Y
+            self._planar = "S" in self._page_axes
+            if self._planar:
+                s = self._page_axes.index("S")
+                self._page_axes = self._page_axes[:s] + self._page_axes[s + 1:]
+                self._page_shape = self._page_shape[:s] + self._page_shape[s + 1:]
+            self._series = series
+            self.dtype = series.dtype
+            self.sizes = {
+                "T": self._size("T"),
+                "Z": math.prod(n for a, n in zip(self._page_axes, self._page_shape)
+                               if a not in "TC"),
+                "C": self._size("C") * samples,
+            }
+        else:
+            self._image = self._read_other(path)
+            self.dtype = self._image.dtype
+            channels = self._image.shape[2] if self._image.ndim == 3 else 1
+            self.sizes = {"T": 1, "Z": 1, "C": channels}
+
+    @staticmethod
+    def _read_other(path):
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError(f"Could not read image: {path}")
+        if image.ndim == 3 and image.shape[2] in (3, 4):   # BGR(A) → RGB(A) channel order
+            image = image[..., [2, 1, 0, 3][:image.shape[2]]]
+        return image
+
+    def _size(self, axis):
+        return self._page_shape[self._page_axes.index(axis)] if axis in self._page_axes else 1
+
+    @property
+    def is_stack(self):
+        """More than one plane, or more channels than a colour image has."""
+        return self.sizes["T"] * self.sizes["Z"] > 1 or self.sizes["C"] > 4
+
+    def _pages(self):
+        # (page index, pixels as Y×X[×S]), one page decoded at a time
+        for i, page in self._raw_pages():
+            yield i, np.moveaxis(page, 0, -1) if self._planar else page
+
+    def _raw_pages(self):
+        # pages listed in the series are decoded one by one; stacks the series
+        # lists fewer pages for (ImageJ hyperstacks) are memory-mapped in place
+        # when uncompressed and contiguous, else read page by page from the file
+        import tifffile
+        pages = self._series.pages
+        count = math.prod(self._page_shape)
+        if len(pages) == count and all(p is not None for p in pages):
+            for i, page in enumerate(pages):
+                yield i, page.asarray()
+        elif self._series.dataoffset is not None:
+            data = tifffile.memmap(self.path, series=0, mode="r")
+            data = data.reshape((count,) + pages[0].shape)
+            for i in range(count):
+                yield i, data[i]
+        else:
+            first = pages[0].index
+            for i in range(count):
+                yield i, self.tif.pages[first + i].asarray()
+
+    def planes(self):
+        """Yield (t, z, c, 2-D plane) for every plane and channel, in file order."""
+        if self.tif is None:
+            image = self._image if self._image.ndim == 3 else self._image[..., None]
+            for c in range(image.shape[2]):
+                yield 0, 0, c, image[..., c]
+            return
+        channels_per_page = self.sizes["C"] // self._size("C")
+        for i, page in self._pages():
+            index = dict(zip(self._page_axes, np.unravel_index(i, self._page_shape)))
+            t, c0 = int(index.get("T", 0)), int(index.get("C", 0))
+            z_index = [index[a] for a in self._page_axes if a not in "TC"]
+            z_shape = [n for a, n in zip(self._page_axes, self._page_shape) if a not in "TC"]
+            z = int(np.ravel_multi_index(z_index, z_shape)) if z_index else 0
+            page = page if page.ndim == 3 else page[..., None]
+            for s in range(channels_per_page):
+                yield t, z, c0 * channels_per_page + s, page[..., s]
+
+    def preview(self, channel=0):
+        """First plane of a channel (for thumbnails)."""
+        for _, _, c, plane in self.planes():
+            if c == channel:
+                return np.ascontiguousarray(plane)
+        raise ValueError(f"{self.name} has no channel {channel}")
+
+    def close(self):
+        if self.tif is not None:
+            self.tif.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stack_rows(path, name=None, projection=True):
+    """Yield long-format rows for every plane and channel, then the projections.
+
+    Projections over z are kept per (time, channel) and emitted as soon as
+    a time point is complete, so time series don't accumulate planes.
+    """
+    with StackReader(path) as reader:
+        name = name or reader.name
+        project = projection and reader.sizes["Z"] > 1
+        maxima = {}                          # (t, c) → running max projection
+
+        def finish(t):
+            for key in sorted(k for k in maxima if k[0] == t):
+                yield plane_row(name, t, None, key[1], maxima.pop(key), PROJECTION)
+
+        current = None
+        for t, z, c, plane in reader.planes():
+            if project and current is not None and t != current:
+                yield from finish(current)
+            current = t
+            plane = np.ascontiguousarray(plane)
+            yield plane_row(name, t, z, c, plane)
+            if project:
+                if (t, c) in maxima:
+                    np.maximum(maxima[t, c], plane, out=maxima[t, c])
+                else:
+                    maxima[t, c] = plane.copy()
+        for t in sorted({t for t, _ in maxima}):
+            yield from finish(t)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Per-plane, per-channel intensity of image stacks.")
+    parser.add_argument("inputs", nargs="+", help="stack files and/or glob patterns")
+    parser.add_argument("-o", "--output", default="planes.csv",
+                        help="long-format table (.csv, .parquet, or .xlsx)")
+    parser.add_argument("--no-projection", action="store_true",
+                        help="skip the max-projection rows")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    paths = sorted({p for pattern in args.inputs for p in glob.glob(pattern) if os.path.isfile(p)})
+    if not paths:
+        print("No image files found.", file=sys.stderr)
+        return 1
+    try:
+        sink = open_sink(args.output)
+    except ImportError as e:
+        print(e, file=sys.stderr)
+        return 1
+    failed = 0
+    with sink:
+        for path in paths:
+            try:
+                for row in stack_rows(path, projection=not args.no_projection):
+                    sink.write(row)
+            except Exception as e:
+                print(f"Skipped {path}: {e}", file=sys.stderr)
+                failed += 1
+    if sink.count:
+        print(f"{sink.count} row(s) written to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Stage graph with per-image memoisation
+ • A pipeline is a dict of named stages; each stage lists the stages it
+   consumes and the parameters (with defaults) it depends on.
+ • Stage outputs are memoised per image, keyed by the parameters of the stage
+   and of everything upstream, so changing a parameter only recomputes the
+   stages that depend on it (e.g. a new threshold reuses the top-hat).
+ • The memo is LRU-bounded by the bytes of the arrays it holds; a budget of 0
+   keeps nothing between runs (values are still shared within one run).
+   Stages made with memoise=False (cheap, full-size outputs such as the
+   0/255 binary) are never kept.
+ • run(..., profile=...) times every computed stage (see profiling.py).
+ • The graphs themselves live in pipelines.py and are shared by the GUI apps,
+   the batch CLI and the benchmarks.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MEMO_BUDGET = 512 * 2**20
+_ENTRY_BYTES = 1024                         # charged per entry on top of its arrays
+
+
+class Stage:
+    """func(*outputs of inputs, **params); a stage with no inputs gets the source.
+
+    Outputs may be memoised and shared, so func must not modify its inputs.
+    memoise=False recomputes the stage on every run.
+    """
+
+    def __init__(self, func, inputs=(), params=None, memoise=True):
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = dict(params or {})
+        self.memoise = memoise
+
+
+def nbytes(value):
+    """Bytes held by the arrays in a stage output (tuples/lists/dicts searched)."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    return 0
+
+
+class StageGraph:
+    def __init__(self, stages, memory_budget=DEFAULT_MEMO_BUDGET):
+        self.stages = stages
+        self.memory_budget = memory_budget
+        self.hits = self.misses = 0
+        self._memo = OrderedDict()           # (key, stage, params) → (value, size)
+        self._used = 0
+        self._lock = threading.Lock()
+        self._depends = {name: self._param_names(name) for name in stages}
+
+    def _param_names(self, name):
+        names = set(self.stages[name].params)
+        for upstream in self.stages[name].inputs:
+            names.update(self._param_names(upstream))
+        return tuple(sorted(names))
+
+    def defaults(self):
+        """Every parameter of the graph with its default value."""
+        merged = {}
+        for stage in self.stages.values():
+            merged.update(stage.params)
+        return merged
+
+    # ---------- running ----------
+    def run(self, key, source, params=None, targets=("measure",), profile=None):
+        """Outputs of the target stages for one image, as a tuple.
+
+        key identifies the image in the memo (None disables memoisation);
+        source is whatever the first stage reads (a path or an array);
+        profile(stage_name), if given, is a context manager wrapped around
+        every stage that is computed rather than taken from the memo.
+        """
+        params = dict(self.defaults(), **(params or {}))
+        computed = {}
+        return tuple(self._value(name, key, source, params, computed, profile)
+                     for name in targets)
+
+    def _value(self, name, key, source, params, computed, profile=None):
+        if name in computed:
+            return computed[name]
+        memo_key = None
+        if key is not None and self.stages[name].memoise:
+            memo_key = (key, name, tuple(params[p] for p in self._depends[name]))
+            with self._lock:
+                found = self._memo.get(memo_key)
+                if found is not None:
+                    self._memo.move_to_end(memo_key)
+                    self.hits += 1
+                    computed[name] = found[0]
+                    return found[0]
+
+        stage = self.stages[name]
+        args = [self._value(i, key, source, params, computed, profile)
+                for i in stage.inputs] or [source]
+        kwargs = {p: params[p] for p in stage.params}
+        if profile is None:
+            value = stage.func(*args, **kwargs)
+        else:
+            with profile(name):
+                value = stage.func(*args, **kwargs)
+        computed[name] = value
+        with self._lock:
+            self.misses += 1
+            if memo_key is not None:
+                self._store(memo_key, value)
+        return value
+
+    def _store(self, memo_key, value):
+        # caller holds the lock
+        size = nbytes(value) + _ENTRY_BYTES
+        if size > self.memory_budget:
+            return
+        old = self._memo.pop(memo_key, None)
+        if old is not None:
+            self._used -= old[1]
+        self._memo[memo_key] = (value, size)
+        self._used += size
+        while self._used > self.memory_budget:
+            _, (_, evicted) = self._memo.popitem(last=False)
+            self._used -= evicted
+
+    # ---------- maintenance ----------
+    def invalidate(self, key=None):
+        """Forget memoised outputs of one image (or of all images)."""
+        with self._lock:
+            for memo_key in [k for k in self._memo if key is None or k[0] == key]:
+                self._used -= self._memo.pop(memo_key)[1]
+
+    @property
+    def memory_used(self):
+        return self._used
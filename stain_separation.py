@@ -0,0 +1,185 @@
+"""
+Colour deconvolution (stain separation) for bright-field images
+ • Ruifrok & Johnston's method: every pixel's optical density
+   OD = -log10(I / I_max) is a mix of a few stain OD vectors, so multiplying
+   by the inverse stain matrix gives each stain's amount.
+ • Built-in matrices: "hdab" (haematoxylin / DAB), "he" (haematoxylin /
+   eosin) and "hed" (haematoxylin / eosin / DAB). A matrix can also be given
+   as "r,g,b;r,g,b[;r,g,b]" (one OD vector per stain, e.g. measured with
+   ImageJ's Colour Deconvolution); a missing third stain is the cross
+   product of the first two.
+ • A separated stain comes back as a single-stain transmitted-light image
+   (same depth as the input, dark = much stain), so it drops into the
+   area / binary / intensity pipelines in place of the grayscale image.
+   The binary pipeline counts pixels above its threshold as positive, so it
+   takes the inverted image (inverted=True: bright = much stain).
+ • The transform is float32 and runs in chunks of rows: OD comes from a
+   lookup table and the matrix product from cv2.transform, so temporaries
+   are bounded by CHUNK_PIXELS whatever the image size.
+Example (write the DAB image of a slide next to it):
+    python stain_separation.py slide.png --stain dab
+"""
+
+import argparse
+import math
+import os
+import sys
+
+import cv2
+import numpy as np
+
+DEFAULT_MATRIX = "hdab"
+CHUNK_PIXELS = 1 << 20
+# stain OD vectors (R, G, B) from Ruifrok & Johnston (2001) / ImageJ and skimage
+MATRICES = {
+    "hdab": {"hematoxylin": (0.650, 0.704, 0.286), "dab": (0.268, 0.570, 0.776)},
+    "he":   {"hematoxylin": (0.644211, 0.716556, 0.266844),
+             "eosin": (0.092789, 0.954111, 0.283111)},
+    "hed":  {"hematoxylin": (0.65, 0.70, 0.29), "eosin": (0.07, 0.99, 0.11),
+             "dab": (0.27, 0.57, 0.78)},
+}
+
+
+def parse_matrix(text):
+    """Stain names → OD vectors of a built-in name or an "r,g,b;r,g,b[;r,g,b]" string."""
+    if text in MATRICES:
+        return MATRICES[text]
+    try:
+        vectors = [tuple(float(v) for v in row.split(",")) for row in text.split(";")]
+    except ValueError:
+        vectors = []
+    if not 2 <= len(vectors) <= 3 or any(len(v) != 3 for v in vectors):
+        raise ValueError(f"Unknown stain matrix {text!r}: use one of {sorted(MATRICES)} "
+                         "or 'r,g,b;r,g,b[;r,g,b]'")
+    return {f"stain{i + 1}": v for i, v in enumerate(vectors)}
+
+
+_SEPARATORS = {}                            # matrix text → StainSeparator
+
+
+class StainSeparator:
+    """Inverse of a stain matrix, applied chunk by chunk."""
+
+    def __init__(self, stains):
+        self.names = list(stains)
+        matrix = np.array([stains[n] for n in self.names], np.float64)
+        if np.any(np.linalg.norm(matrix, axis=1) == 0):
+            raise ValueError("Stain vectors must not be zero")
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        if len(matrix) == 2:                 # complete with the orthogonal stain
+            matrix = np.vstack([matrix, np.cross(matrix[0], matrix[1])])
+            self.names.append("residual")
+        if abs(np.linalg.det(matrix)) < 1e-6:
+            raise ValueError("Stain vectors are linearly dependent")
+        self.matrix = matrix
+        self.inverse = np.linalg.inv(matrix)   # OD (row) @ inverse → stain amounts
+        self._luts = {}
+
+    @classmethod
+    def named(cls, matrix=DEFAULT_MATRIX):
+        """Separator of a built-in or "r,g,b;…" matrix (built once per matrix)."""
+        if matrix not in _SEPARATORS:
+            _SEPARATORS[matrix] = cls(parse_matrix(matrix))
+        return _SEPARATORS[matrix]
+
+    def index(self, stain):
+        """Column of a stain given by name or 1-based number."""
+        if stain in self.names:
+            return self.names.index(stain)
+        if str(stain).isdigit() and 1 <= int(stain) <= len(self.names):
+            return int(stain) - 1
+        raise ValueError(f"Unknown stain {stain!r}; this matrix has {self.names}")
+
+    def _od_lut(self, dtype):
+        # optical density of every possible value (0 is clamped to 1)
+        if dtype not in self._luts:
+            peak = np.iinfo(dtype).max
+            values = np.maximum(np.arange(peak + 1, dtype=np.float64), 1)
+            self._luts[dtype] = (-np.log10(values / peak)).astype(np.float32)
+        return self._luts[dtype]
+
+    def amount(self, image, stain, bgr=True, out=None):
+        """float32 amount (OD units) of one stain in an 8/16-bit colour image."""
+        if image.ndim != 3 or image.shape[2] < 3:
+            raise ValueError("Stain separation needs a colour (RGB) image")
+        if image.dtype not in (np.uint8, np.uint16):
+            raise ValueError(f"Unsupported image depth {image.dtype}; use 8 or 16 bit")
+        column = self.inverse[:, self.index(stain)]
+        weights = np.float32(column[::-1] if bgr else column).reshape(1, 3)
+        lut = self._od_lut(image.dtype.type)
+        h, w = image.shape[:2]
+        if out is None:
+            out = np.empty((h, w), np.float32)
+        rows = max(1, CHUNK_PIXELS // max(1, w))
+        for y in range(0, h, rows):
+            od = lut[image[y:y + rows, :, :3]]            # float32 chunk × 3
+            out[y:y + rows] = cv2.transform(od, weights).reshape(od.shape[:2])
+        return out
+
+    def channel(self, image, stain, bgr=True, inverted=False):
+        """Single-stain image I_max · 10^-amount, same depth as image (dark = stained).
+
+        inverted gives I_max minus that image instead (bright = stained).
+        """
+        dtype = image.dtype
+        peak = float(np.iinfo(dtype).max)
+        h, w = image.shape[:2]
+        result = np.empty((h, w), dtype)
+        rows = max(1, CHUNK_PIXELS // max(1, w))
+        for y in range(0, h, rows):
+            amount = self.amount(image[y:y + rows], stain, bgr)
+            amount *= -math.log(10)
+            cv2.exp(amount, amount)
+            amount *= peak
+            np.clip(amount, 0, peak, out=amount)
+            result[y:y + rows] = amount + 0.5   # round to the nearest level
+        if inverted:
+            np.invert(result, out=result)     # I_max - value for unsigned ints
+        return result
+
+
+def separate(image, stain, matrix=DEFAULT_MATRIX, bgr=True):
+    """Single-stain image of a decoded colour image (cv2's BGR order by default)."""
+    return StainSeparator.named(matrix).channel(image, stain, bgr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Colour deconvolution: write one stain's image.")
+    parser.add_argument("inputs", nargs="+", help="colour image files")
+    parser.add_argument("--stain", default="dab", help="stain name or 1-based number")
+    parser.add_argument("--matrix", default=DEFAULT_MATRIX,
+                        help=f"{' / '.join(MATRICES)} or 'r,g,b;r,g,b[;r,g,b]'")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="where to write <stem>_<stain>.png (default: next to the input)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        separator = StainSeparator.named(args.matrix)
+        separator.index(args.stain)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    failed = 0
+    for path in args.inputs:
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        try:
+            if image is None:
+                raise ValueError("could not read image")
+            stain = separator.channel(image, args.stain)
+        except ValueError as e:
+            print(f"Skipped {path}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        stem = os.path.splitext(os.path.basename(path))[0]
+        out_dir = args.output_dir or os.path.dirname(path)
+        out = os.path.join(out_dir, f"{stem}_{args.stain}.png")
+        cv2.imwrite(out, stain)
+        print(f"{path} → {out}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
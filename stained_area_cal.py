@@ -1,20 +1,33 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
-import cv2
-import numpy as np
-import pandas as pd
 import os
-from skimage.morphology import white_tophat, disk
+from background import DEFAULT_MODE, DEFAULT_RADIUS, MODES
+from pipelines import read_gray, AREA_STAGES
+from result_cache import open_cache
+from parallel_tiles import set_threads
+from stages import StageGraph
+from profiling import Profiler, trace_path
+from results_sink import write_table
+from packed_mask import PackedMask, mask_path, packed_result
+from worker import BackgroundRunner
 
 class BinaryImageApp:
-    def __init__(self, root):
+    def __init__(self, root, background_mode=DEFAULT_MODE, background_radius=DEFAULT_RADIUS):
         self.root = root
         self.root.title("Enhanced Binary Analyzer")
+        set_threads()   # split each large image over every core (parallel_tiles.py)
+
+        self.background_mode = tk.StringVar(value=background_mode)
+        self.background_radius = background_radius
 
         self.images = [None, None, None]
-        self.binaries = [None, None, None]
+        self.binaries = [None, None, None]   # PackedMask per slot (1 bit per pixel)
+        self.results = [None, None, None]
+        self.digests = [None, None, None]   # content hashes for the result cache
         self.stats = []
+        self.cache = open_cache()
+        self.graph = StageGraph(AREA_STAGES)   # memoised stages per image slot
 
         # Buttons to load images
         btn_frame = tk.Frame(root)
@@ -24,9 +37,31 @@ class BinaryImageApp:
         tk.Button(btn_frame, text="Upload Image 2", command=lambda: self.upload_image(1)).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Upload Image 3", command=lambda: self.upload_image(2)).pack(side=tk.LEFT, padx=5)
 
+        # Background subtraction mode (speed/accuracy trade-off, see background.py)
+        mode_frame = tk.Frame(root)
+        mode_frame.pack(pady=5)
+        tk.Label(mode_frame, text="Background mode:").pack(side=tk.LEFT)
+        tk.OptionMenu(mode_frame, self.background_mode, *MODES).pack(side=tk.LEFT)
+        # Measure only inside tissue detected at low resolution (see tissue.py)
+        self.tissue_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(mode_frame, text="Tissue only", variable=self.tissue_var).pack(side=tk.LEFT, padx=5)
+
         # Buttons to process and export
         tk.Button(root, text="Convert All to Binary", command=self.convert_all_to_binary).pack(pady=5)
         tk.Button(root, text="Download XLS", command=self.download_xls).pack(pady=5)
+        tk.Button(root, text="Save Masks", command=self.save_masks).pack(pady=5)
+
+        # Background processing: progress + cancel
+        progress_frame = tk.Frame(root)
+        progress_frame.pack(pady=5)
+        self.progress = ttk.Progressbar(progress_frame, length=300, mode="determinate")
+        self.progress.pack(side=tk.LEFT, padx=5)
+        tk.Button(progress_frame, text="Cancel", command=self.cancel).pack(side=tk.LEFT)
+        self.runner = BackgroundRunner(root, self.progress)
+        # Optional per-stage timing / memory columns (see profiling.py)
+        self.profile_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(progress_frame, text="Profile stages", variable=self.profile_var).pack(side=tk.LEFT, padx=5)
+        self.profiler = None
 
         # Image preview panels
         self.panels = []
@@ -44,14 +79,67 @@ class BinaryImageApp:
     def upload_image(self, idx):
         file_path = filedialog.askopenfilename(filetypes=[("Image files", "*.png *.jpg *.jpeg *.tif *.tiff")])
         if file_path:
-            image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+            image = read_gray(file_path)
             if image is not None:
                 self.images[idx] = (image, os.path.basename(file_path))
+                self.binaries[idx] = None
+                self.digests[idx] = self.cache.digest(file_path) if self.cache else None
+                self.graph.invalidate(idx)
                 self.display_image(image, self.panels[idx])
                 self.stats = []
 
     def convert_all_to_binary(self):
+        if self.is_busy():
+            return
         self.stats = []
+        self.results = [None, None, None]
+        mode, radius = self.background_mode.get(), self.background_radius
+        params = {"background_mode": mode, "background_radius": radius}
+        if self.tissue_var.get():
+            params["tissue"] = True
+        jobs = [(i, item[0], item[1]) for i, item in enumerate(self.images) if item is not None]
+        profiler = self.profiler = Profiler() if self.profile_var.get() else None
+
+        def process(job):
+            # runs on a worker thread
+            i, image, name = job
+            # profiling measures every stage: skip the result cache and stage memo
+            digest = None if profiler else self.digests[i]
+            key = None if profiler else i
+            if digest:
+                hit = self.cache.get(digest, "area", params, name)
+                if hit is not None and hit[0] is not None:
+                    binary, row = hit
+                    tissue = None
+                    if params.get("tissue"):   # cheap: found on a low-resolution level
+                        tissue, = self.graph.run(key, image, params, ("tissue",))
+                    return binary, row, PackedMask.from_binary("area", binary, tissue)
+            # Equalize → background subtraction (white tophat) → Otsu → pixel analysis;
+            # only stages downstream of a changed parameter are recomputed.
+            # The area comes from the histogram Otsu already needs (one lookup);
+            # the packed mask (limited to the tissue) is kept for Save Masks
+            binary, row, mask = packed_result("area", image, name, params, graph=self.graph,
+                                              key=key, profiler=profiler)
+            if digest:
+                self.cache.put(digest, "area", params, row, binary)
+            return binary, row, mask
+
+        self.stats_label.config(text="Processing…")
+        # profiled images run one at a time: allocation peaks are process-wide
+        self.runner.run(jobs, process, on_result=self.on_image_done,
+                        on_error=self.on_image_error, on_done=self.on_conversion_done,
+                        workers=1 if profiler else None)
+
+    def on_image_done(self, job, result):
+        i = job[0]
+        binary, row, self.binaries[i] = result
+        self.display_image(binary, self.panels[i])
+        self.results[i] = row
+
+    def on_image_error(self, job, error):
+        messagebox.showerror("Error", f"Image {job[0]+1} ({job[2]}) failed:\n{error}")
+
+    def on_conversion_done(self, cancelled):
         summary = ""
 
         for i, item in enumerate(self.images):
@@ -59,50 +147,68 @@ class BinaryImageApp:
                 summary += f"Image {i+1}: Not loaded\n"
                 continue
 
-            image, name = item
-
-            # Step 1: Enhance contrast
-            image = cv2.equalizeHist(image)
-
-            # Step 2: Background subtraction using rolling ball simulation (white tophat)
-            image = white_tophat(image, disk(50))
-
-            # Step 3: Apply Otsu thresholding
-            _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            self.binaries[i] = binary
-            self.display_image(binary, self.panels[i])
-
-            # Step 4: Pixel analysis
-            total_pixels = binary.size
-            positive_pixels = np.sum(binary == 0)      # myelin-positive (black)
-            negative_pixels = np.sum(binary == 255)    # myelin-negative (white)
-            pos_percent = (positive_pixels / total_pixels) * 100
-            neg_percent = (negative_pixels / total_pixels) * 100
+            name = item[1]
+            row = self.results[i]
+            if row is None:
+                summary += f"Image {i+1} ({name}): {'Cancelled' if cancelled else 'Failed'}\n"
+                continue
+            if self.profiler:
+                row = self.profiler.annotate(row)
+            self.stats.append(row)
 
-            self.stats.append({
-                "Image Name": name,
-                "Total Pixels": total_pixels,
-                "Myelin Positive (%) (black)": pos_percent,
-                "Myelin Negative (%) (white)": neg_percent
-            })
+            total_pixels = row["Total Pixels"]
+            pos_percent = row["Myelin Positive (%) (black)"]
+            neg_percent = row["Myelin Negative (%) (white)"]
 
             summary += f"Image {i+1} ({name}):\n  Total: {total_pixels}, Myelin+: {pos_percent:.2f}%, Myelin-: {neg_percent:.2f}%\n"
+            if "Tissue Area (%)" in row:
+                summary += f"  Tissue: {row['Tissue Area (%)']:.2f}% of the image\n"
 
         self.stats_label.config(text=summary)
+        if self.profiler:
+            self.profiler.close()
 
     def download_xls(self):
         if not self.stats:
             messagebox.showwarning("No Data", "Please convert images first.")
             return
 
-        save_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx")])
-        if save_path:
-            df = pd.DataFrame(self.stats)
-            try:
-                df.to_excel(save_path, index=False)
-                messagebox.showinfo("Success", f"Excel file saved to:\n{save_path}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not save file:\n{e}")
+        save_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+        if save_path and not self.is_busy():
+            stats = list(self.stats)
+            self.runner.run([save_path], lambda path: self.save_table(path, stats),
+                            on_result=lambda path, _: messagebox.showinfo("Success", f"Results saved to:\n{path}"),
+                            on_error=lambda path, e: messagebox.showerror("Error", f"Could not save file:\n{e}"))
+
+    def save_masks(self):
+        masks = [(self.images[i][1], mask) for i, mask in enumerate(self.binaries) if mask is not None]
+        if not masks:
+            messagebox.showwarning("No Data", "Please convert images first.")
+            return
+
+        out_dir = filedialog.askdirectory(title="Save masks (1-bit TIFF) to")
+        if out_dir and not self.is_busy():
+            self.runner.run(masks, lambda item: item[1].save(mask_path(out_dir, item[0])),
+                            on_error=lambda item, e: messagebox.showerror("Error", f"Could not save mask of {item[0]}:\n{e}"),
+                            on_done=lambda cancelled: cancelled or messagebox.showinfo("Success", f"Masks saved to:\n{out_dir}"))
+
+    def save_table(self, path, stats):
+        # runs on a worker thread; with profiling on, the export is timed too
+        # and the stage trace is written next to the table
+        if self.profiler is None:
+            write_table(stats, path)
+            return
+        with self.profiler.stage("export", "export"):
+            write_table(stats, path)
+        self.profiler.write_trace(trace_path(path))
+
+    def is_busy(self):
+        if self.runner.busy:
+            messagebox.showwarning("Busy", "Please wait for the current job to finish or cancel it.")
+        return self.runner.busy
+
+    def cancel(self):
+        self.runner.cancel()
 
     def display_image(self, img_array, panel):
         image = Image.fromarray(img_array)
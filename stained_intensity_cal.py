@@ -1,19 +1,28 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
 import cv2
-import numpy as np
-import pandas as pd
 import os
+from pipelines import read_intensity_gray, run_pipeline, INTENSITY_STAGES
+from parallel_tiles import set_threads
+from stages import StageGraph
+from profiling import Profiler, trace_path
+from results_sink import write_table
+from stacks import STACK_EXTENSIONS, StackReader, stack_rows
+from worker import BackgroundRunner
 
 class FluorescenceAnalyzer:
     def __init__(self, root):
         self.root = root
         self.root.title("Fluorescence Image Intensity Analyzer")
+        set_threads()   # split each large image over every core (parallel_tiles.py)
 
         # Hold originals + metadata
         self.images = [None, None, None]      # (gray_array, filename) or None
-        self.stats  = []                      # list of {"Image Name": str, "Average Intensity": float}
+        self.stats  = []                      # list of rows from pipelines.intensity_row
+        self.results = [None, None, None]     # per-slot rows of the running job
+        self.stack_paths = [None, None, None] # z-stacks / many-channel files (see stacks.py)
+        self.graph = StageGraph(INTENSITY_STAGES)   # memoised stages per slot
 
         # ── UI: buttons ──────────────────────────────────────────
         btn_frame = tk.Frame(root)
@@ -26,11 +35,31 @@ class FluorescenceAnalyzer:
         tk.Button(btn_frame, text="Upload Image 3",
                   command=lambda: self.upload_image(2)).pack(side=tk.LEFT, padx=5)
 
+        # measure only inside tissue detected at low resolution (see tissue.py)
+        self.tissue_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(root, text="Tissue only (ignore empty background)",
+                       variable=self.tissue_var).pack()
+
         tk.Button(root, text="Compute Average Intensity",
                   command=self.compute_intensities).pack(pady=5)
         tk.Button(root, text="Download XLS",
                   command=self.download_xls).pack(pady=5)
 
+        # ── UI: background progress + cancel ────────────────────
+        progress_frame = tk.Frame(root)
+        progress_frame.pack(pady=5)
+        self.progress = ttk.Progressbar(progress_frame, length=300,
+                                        mode="determinate")
+        self.progress.pack(side=tk.LEFT, padx=5)
+        tk.Button(progress_frame, text="Cancel",
+                  command=self.cancel).pack(side=tk.LEFT)
+        self.runner = BackgroundRunner(root, self.progress)
+        # optional per-stage timing / memory columns (see profiling.py)
+        self.profile_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(progress_frame, text="Profile stages",
+                       variable=self.profile_var).pack(side=tk.LEFT, padx=5)
+        self.profiler = None
+
         # ── UI: preview panels ───────────────────────────────────
         self.panels = []
         img_frame = tk.Frame(root)
@@ -52,27 +81,40 @@ class FluorescenceAnalyzer:
         if not file_path:
             return
 
-        # Read with OpenCV (keeps alpha if present)
-        img = cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
-        if img is None:
-            messagebox.showerror("Error", f"Could not read image:\n{file_path}")
+        # z-stacks and many-channel TIFFs are measured plane by plane;
+        # the preview shows the first plane of the first channel
+        self.stack_paths[idx] = None
+        if file_path.lower().endswith(STACK_EXTENSIONS):
+            try:
+                with StackReader(file_path) as reader:
+                    if reader.is_stack:
+                        self.stack_paths[idx] = file_path
+                        sizes = reader.sizes
+                        gray = reader.preview()
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not read stack:\n{e}")
+                return
+        if self.stack_paths[idx]:
+            self.images[idx] = (gray, os.path.basename(file_path))
+            self.show_preview(gray, self.panels[idx])
+            self.stats = []
+            self.stats_label.config(
+                text=f"Stack: {sizes['T']} time point(s), {sizes['Z']} plane(s), "
+                     f"{sizes['C']} channel(s)")
             return
 
-        # Convert to single‑channel grayscale if needed
-        if img.ndim == 3:                    # color or multichannel
-            if img.shape[2] == 3:            # BGR → Gray
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            elif img.shape[2] == 4:          # BGRA → Gray
-                gray = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
-            else:
-                messagebox.showerror(
-                    "Unsupported",
-                    "Unsupported channel count > 4. Please supply standard RGB/RGBA images.")
-                return
-        else:
-            gray = img                       # already grayscale
+        # Read with OpenCV, convert to single‑channel grayscale if needed
+        try:
+            gray = read_intensity_gray(file_path)
+        except ValueError as e:
+            messagebox.showerror("Unsupported", str(e))
+            return
+        if gray is None:
+            messagebox.showerror("Error", f"Could not read image:\n{file_path}")
+            return
 
         self.images[idx] = (gray, os.path.basename(file_path))
+        self.graph.invalidate(idx)
         self.show_preview(gray, self.panels[idx])
 
         # Reset previous calculations
@@ -81,8 +123,46 @@ class FluorescenceAnalyzer:
 
     # ─────────────────────────────────────────────────────────────
     def compute_intensities(self):
-        """Calculate mean grayscale intensity per image."""
+        """Calculate mean grayscale intensity per image (in the background)."""
+        if self.is_busy():
+            return
         self.stats = []
+        self.results = [None, None, None]
+        jobs = [(i, item[0], item[1])
+                for i, item in enumerate(self.images) if item is not None]
+
+        if not jobs:
+            messagebox.showinfo(
+                "No images",
+                "Please upload at least one image before computing.")
+            return
+
+        profiler = self.profiler = Profiler() if self.profile_var.get() else None
+        params = {"tissue": True} if self.tissue_var.get() else None
+
+        def measure(job):
+            # runs on a worker thread; stacks give a list of long-format rows
+            i, gray, name = job
+            if self.stack_paths[i]:
+                return list(stack_rows(self.stack_paths[i], name))
+            return run_pipeline("intensity", gray, name, params, graph=self.graph,
+                                key=None if profiler else i, profiler=profiler)[1]
+
+        # profiled images run one at a time: allocation peaks are process-wide
+        self.runner.run(jobs, measure,
+                        on_result=self.on_image_done,
+                        on_error=self.on_image_error,
+                        on_done=self.on_compute_done,
+                        workers=1 if profiler else None)
+
+    def on_image_done(self, job, row):
+        self.results[job[0]] = row
+
+    def on_image_error(self, job, error):
+        messagebox.showerror("Error",
+                             f"Image {job[0]+1} ({job[2]}) failed:\n{error}")
+
+    def on_compute_done(self, cancelled):
         summary_lines = []
 
         for i, item in enumerate(self.images):
@@ -90,22 +170,42 @@ class FluorescenceAnalyzer:
                 summary_lines.append(f"Image {i+1}: Not loaded")
                 continue
 
-            gray, name = item
-            mean_val = float(np.mean(gray))          # 0‑255
+            name = item[1]
+            row = self.results[i]
+            if row is None:
+                summary_lines.append(
+                    f"Image {i+1} ({name}): {'Cancelled' if cancelled else 'Failed'}")
+                continue
+            if isinstance(row, list):                # stack: one row per plane / channel
+                self.stats.extend(row)
+                shown = [r for r in row if r["Projection"] and r["Time"] == 0] or row[:4]
+                means = ", ".join(f"ch{r['Channel']} {r['Mean Intensity']:.2f}" for r in shown)
+                label = "max projection" if shown[0]["Projection"] else "plane 0"
+                summary_lines.append(
+                    f"Image {i+1} ({name}): {len(row)} rows; {label}: {means}")
+                continue
+            mean_val = row["Average Intensity"]      # 0‑255
 
-            self.stats.append({
-                "Image Name": name,
-                "Average Intensity": mean_val
-            })
+            if self.profiler:
+                row = self.profiler.annotate(row)
+            self.stats.append(row)
+            tissue = (f" (tissue {row['Tissue Area (%)']:.1f}%)"
+                      if "Tissue Area (%)" in row else "")
             summary_lines.append(
-                f"Image {i+1} ({name}): {mean_val:.2f}")
+                f"Image {i+1} ({name}): {mean_val:.2f}{tissue}")
 
         self.stats_label.config(text="\n".join(summary_lines))
+        if self.profiler:
+            self.profiler.close()
 
-        if not self.stats:
-            messagebox.showinfo(
-                "No images",
-                "Please upload at least one image before computing.")
+    def is_busy(self):
+        if self.runner.busy:
+            messagebox.showwarning(
+                "Busy", "Please wait for the current job to finish or cancel it.")
+        return self.runner.busy
+
+    def cancel(self):
+        self.runner.cancel()
 
     # ─────────────────────────────────────────────────────────────
     def download_xls(self):
@@ -116,19 +216,32 @@ class FluorescenceAnalyzer:
 
         save_path = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
-            filetypes=[("Excel files", "*.xlsx")],
+            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")],
             title="Save results as …")
-        if not save_path:
+        if not save_path or self.is_busy():
             return
 
-        try:
-            df = pd.DataFrame(self.stats)
-            df.to_excel(save_path, index=False)
-            messagebox.showinfo("Success",
-                                f"Excel file saved to:\n{save_path}")
-        except Exception as e:
-            messagebox.showerror("Error",
-                                 f"Could not save file:\n{e}")
+        stats = list(self.stats)
+        self.runner.run(
+            [save_path],
+            lambda path: self.save_table(path, stats),
+            on_result=lambda path, _: messagebox.showinfo(
+                "Success", f"Results saved to:\n{path}"),
+            on_error=lambda path, e: messagebox.showerror(
+                "Error", f"Could not save file:\n{e}"))
+
+    def save_table(self, path, stats):
+        """Write the Excel table (on a worker thread).
+
+        With profiling on, the export is timed as well and the stage trace
+        is written next to the table.
+        """
+        if self.profiler is None:
+            write_table(stats, path)
+            return
+        with self.profiler.stage("export", "export"):
+            write_table(stats, path)
+        self.profiler.write_trace(trace_path(path))
 
     # ─────────────────────────────────────────────────────────────
     def show_preview(self, img_array, panel):
@@ -0,0 +1,106 @@
+"""
+Deterministic synthetic stained sections for benchmarks
+ • Dark, brown-tinted blobs (cells / fibre cross-sections) on a bright,
+   unevenly lit background with sensor noise – enough structure for equalize,
+   top-hat and Otsu to do representative work.
+ • Every pixel is a function of (seed, position), so any region can be
+   rendered on its own: whole-slide TIFFs are written tile by tile without
+   ever holding the full image.
+ • Same seed + size → identical pixels on every machine.
+"""
+
+import math
+import os
+
+import cv2
+import numpy as np
+
+DEFAULT_SEED = 0
+BLOBS_PER_MP = 400
+TILE = 512
+_STAIN_RGB = np.array([0.55, 0.35, 0.20], np.float32)   # DAB-like brown absorbance
+
+
+def size_for_megapixels(megapixels, aspect=4 / 3):
+    """(width, height) with about megapixels·10⁶ pixels at the given aspect."""
+    height = int(round(math.sqrt(megapixels * 1e6 / aspect)))
+    return int(round(height * aspect)), height
+
+
+def _blobs(width, height, seed):
+    rng = np.random.default_rng(seed)
+    n = max(1, int(BLOBS_PER_MP * width * height / 1e6))
+    cx = rng.uniform(0, width, n)
+    cy = rng.uniform(0, height, n)
+    radius = rng.uniform(3, 25, n)
+    density = rng.uniform(60, 160, n)
+    return cx, cy, radius, density
+
+
+def synthetic_region(width, height, box, seed=DEFAULT_SEED, blobs=None):
+    """RGB uint8 pixels of box = (left, top, right, bottom) of a width×height section."""
+    left, top, right, bottom = box
+    cx, cy, radius, density = blobs if blobs is not None else _blobs(width, height, seed)
+
+    # uneven illumination: linear ramp plus a soft vignette
+    ys, xs = np.mgrid[top:bottom, left:right].astype(np.float32)
+    u, v = xs / width - 0.5, ys / height - 0.5
+    background = 215 + 20 * u - 10 * v - 60 * (u * u + v * v)
+
+    # stain optical density, one anti-aliased disc per blob touching the box
+    stain = np.zeros((bottom - top, right - left), np.float32)
+    reach = radius + 2                       # anti-aliased edge spills past r
+    near = ((cx + reach >= left) & (cx - reach < right) &
+            (cy + reach >= top) & (cy - reach < bottom))
+    for x, y, r, d in zip(cx[near], cy[near], radius[near], density[near]):
+        cv2.circle(stain, (int(x) - left, int(y) - top), int(r), float(d), -1, cv2.LINE_AA)
+
+    # per-tile noise stream, so a region renders the same however it is split
+    noise = np.empty_like(stain)
+    for ty in range(top // TILE, (bottom - 1) // TILE + 1):
+        for tx in range(left // TILE, (right - 1) // TILE + 1):
+            rng = np.random.default_rng([seed, ty, tx])
+            tile = rng.normal(0, 6, (TILE, TILE)).astype(np.float32)
+            y0, x0 = ty * TILE, tx * TILE
+            sy, sx = max(top, y0), max(left, x0)
+            ey, ex = min(bottom, y0 + TILE), min(right, x0 + TILE)
+            noise[sy - top:ey - top, sx - left:ex - left] = tile[sy - y0:ey - y0, sx - x0:ex - x0]
+
+    rgb = background[..., None] - stain[..., None] * _STAIN_RGB / _STAIN_RGB.max() + noise[..., None]
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+def synthetic_section(width, height, seed=DEFAULT_SEED):
+    """Whole width×height section as an RGB uint8 array."""
+    return synthetic_region(width, height, (0, 0, width, height), seed)
+
+
+def write_synthetic(path, width, height, seed=DEFAULT_SEED):
+    """Write a section to path (.tif/.tiff as a tiled TIFF, else via OpenCV).
+
+    Existing files are kept, since their contents are fully determined by the
+    name the caller chose for them.
+    """
+    if os.path.exists(path):
+        return path
+    if path.lower().endswith((".tif", ".tiff")):
+        import tifffile
+        blobs = _blobs(width, height, seed)
+
+        def tiles():
+            for top in range(0, height, TILE):
+                for left in range(0, width, TILE):
+                    tile = np.zeros((TILE, TILE, 3), np.uint8)
+                    region = synthetic_region(width, height,
+                                              (left, top, min(width, left + TILE),
+                                               min(height, top + TILE)), seed, blobs)
+                    tile[:region.shape[0], :region.shape[1]] = region
+                    yield tile
+
+        tifffile.imwrite(path, tiles(), shape=(height, width, 3), dtype=np.uint8,
+                         tile=(TILE, TILE), photometric="rgb")
+    else:
+        rgb = synthetic_section(width, height, seed)
+        if not cv2.imwrite(path, cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)):
+            raise ValueError(f"Could not write {path}")
+    return path
@@ -0,0 +1,53 @@
+"""Density maps: the window table is written in one go; oversized .xlsx is refused early."""
+
+import csv
+import os
+import sys
+
+import cv2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import density_map  # noqa: E402
+from synthetic import synthetic_section  # noqa: E402
+
+
+@pytest.fixture
+def section(tmp_path):
+    path = str(tmp_path / "section.png")
+    cv2.imwrite(path, synthetic_section(700, 500))
+    return path
+
+
+def test_csv_table_has_one_row_per_window(tmp_path, section):
+    result = density_map.density_map(section, "binary", 100, 50, threshold=100)
+    out = str(tmp_path / "maps")
+    density_map.write_density(result, out, "section")
+    with open(os.path.join(out, "section_windows.csv"), newline="") as fh:
+        table = list(csv.DictReader(fh))
+    rows = list(result.rows("section"))
+    assert len(table) == len(rows) == density_map.window_count((500, 700), 100, 50)
+    for written, row in zip(table, rows):
+        assert written == {k: str(v) for k, v in row.items()}
+
+
+def test_parquet_table_matches_rows(tmp_path, section):
+    pq = pytest.importorskip("pyarrow.parquet")
+    result = density_map.density_map(section, "area", 100, 100, background_radius=8)
+    out = str(tmp_path / "maps")
+    density_map.write_density(result, out, "section", table="parquet")
+    table = pq.read_table(os.path.join(out, "section_windows.parquet")).to_pylist()
+    assert table == list(result.rows("section"))
+
+
+def test_oversized_xlsx_is_refused_before_computing(tmp_path, section, monkeypatch):
+    monkeypatch.setattr(density_map, "EXCEL_MAX_ROWS", 10)
+
+    def never(*args, **kwargs):
+        raise AssertionError("computed a map that can't be written")
+
+    monkeypatch.setattr(density_map, "density_map", never)
+    out = str(tmp_path / "maps")
+    assert density_map.main(["binary", section, "-o", out, "--table", "xlsx"]) == 1
+    assert not os.path.exists(out)
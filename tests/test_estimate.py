@@ -0,0 +1,46 @@
+"""Sampled estimates: exact when every tile is read, tissue handled like the exact path."""
+
+import os
+import sys
+
+import cv2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from estimate import estimate_file  # noqa: E402
+from pipelines import analyze_file  # noqa: E402
+from synthetic import synthetic_section  # noqa: E402
+
+
+def _write(path, width, height, glass=False):
+    bgr = cv2.cvtColor(synthetic_section(width, height, seed=5), cv2.COLOR_RGB2BGR)
+    if glass:                                # tissue in the middle, empty glass around it
+        section = bgr[height // 4:-height // 4, width // 4:-width // 4].copy()
+        bgr[:] = 235
+        bgr[height // 4:-height // 4, width // 4:-width // 4] = section
+    cv2.imwrite(str(path), bgr)
+    return str(path)
+
+
+def test_single_tile_interval_is_exact(tmp_path):
+    path = _write(tmp_path / "small.png", 200, 150)
+    row = estimate_file(path, "binary", threshold=150)
+    exact = analyze_file(path, "binary", threshold=150)
+    assert row["Sampled Tiles"] == 1
+    assert row["Positive Pixels (%)"] == pytest.approx(exact["Positive Pixels (%)"])
+    assert row["Positive Pixels (%) CI Low"] == pytest.approx(row["Positive Pixels (%)"])
+    assert row["Positive Pixels (%) CI High"] == pytest.approx(row["Positive Pixels (%)"])
+
+
+@pytest.mark.parametrize("pipeline, params", [("binary", {"threshold": 150}),
+                                              ("intensity", {})])
+def test_tissue_matches_exact_schema(tmp_path, pipeline, params):
+    path = _write(tmp_path / "glass.png", 900, 600, glass=True)
+    # a tolerance of 0 reads every tile, so the estimate equals the exact result
+    row = estimate_file(path, pipeline, 0.0, tissue=True, **params)
+    exact = analyze_file(path, pipeline, tissue=True, **params)
+    assert set(exact) <= set(row)
+    for key, value in exact.items():
+        assert row[key] == pytest.approx(value), key
+    assert exact["Tissue Area (%)"] < 80
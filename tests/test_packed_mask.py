@@ -0,0 +1,46 @@
+"""Archived masks: one per input path, and re-measured like the original rows."""
+
+import glob
+import os
+import sys
+
+import cv2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_quant import run_batch  # noqa: E402
+from packed_mask import PackedMask, mask_row  # noqa: E402
+from synthetic import synthetic_section  # noqa: E402
+
+
+def _write(path, seed):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    bgr = cv2.cvtColor(synthetic_section(400, 300, seed=seed), cv2.COLOR_RGB2BGR)
+    section = bgr[75:-75, 100:-100].copy()
+    bgr[:] = 235                             # tissue in the middle, glass around it
+    bgr[75:-75, 100:-100] = section
+    cv2.imwrite(path, bgr)
+    return path
+
+
+@pytest.mark.parametrize("tissue", [False, True])
+def test_masks_per_path_and_remeasured(tmp_path, tissue):
+    paths = [_write(str(tmp_path / "study" / slide / "img001.png"), seed)
+             for seed, slide in enumerate(("slideA", "slideB"))]
+    params = {"threshold": 150, "tissue": True} if tissue else {"threshold": 150}
+    masks = str(tmp_path / "masks")
+    rows, errors = run_batch(paths, "binary", workers=1, mask_dir=masks, **params)
+    assert not errors
+
+    saved = sorted(glob.glob(os.path.join(masks, "**", "*_mask.tif"), recursive=True))
+    assert [os.path.relpath(p, masks) for p in saved] == [
+        os.path.join("slideA", "img001_mask.tif"), os.path.join("slideB", "img001_mask.tif")]
+    for row, path in zip(rows, saved):
+        remeasured = mask_row(row["Image Name"], PackedMask.load(path))
+        for key in ("Total Pixels", "Positive Pixels (%)", "Tissue Area (%)"):
+            assert (key in remeasured) == (key in row)
+            if key in row:
+                assert remeasured[key] == pytest.approx(row[key])
+    if tissue:
+        assert rows[0]["Tissue Area (%)"] < 100
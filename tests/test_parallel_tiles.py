@@ -0,0 +1,60 @@
+"""Band-parallel pipelines must be bit-identical to the serial ones."""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parallel_tiles  # noqa: E402
+from pipelines import run_pipeline  # noqa: E402
+from synthetic import synthetic_section  # noqa: E402
+
+WIDTH, HEIGHT = 1800, 1200
+
+
+@pytest.fixture(scope="module")
+def section():
+    assert WIDTH * HEIGHT > parallel_tiles.MIN_PARALLEL_PIXELS
+    gray = cv2.cvtColor(synthetic_section(WIDTH, HEIGHT, seed=3), cv2.COLOR_RGB2GRAY)
+    gray[:, :WIDTH // 4] = 240               # a strip of empty glass for the tissue mask
+    return gray
+
+
+@pytest.fixture(autouse=True)
+def serial_afterwards():
+    yield
+    parallel_tiles.set_threads(1)
+
+
+def _area(gray, threads, mode, tissue):
+    parallel_tiles.set_threads(threads)
+    params = {"background_mode": mode, "background_radius": 8, "tissue": tissue}
+    return run_pipeline("area", gray, "section", params)
+
+
+@pytest.mark.parametrize("tissue", [False, True])
+@pytest.mark.parametrize("mode", ["exact", "opencv", "decomposed"])
+def test_threads_bit_identical(section, mode, tissue):
+    serial_binary, serial_row = _area(section, 1, mode, tissue)
+    parallel_binary, parallel_row = _area(section, 4, mode, tissue)
+    assert np.array_equal(serial_binary, parallel_binary)
+    assert serial_row == parallel_row
+    assert ("Tissue Area (%)" in serial_row) == tissue
+
+
+@pytest.mark.parametrize("tissue", [False, True])
+def test_binary_and_intensity_bit_identical(section, tissue):
+    rows = []
+    for threads in (1, 4):
+        parallel_tiles.set_threads(threads)
+        binary, row = run_pipeline("binary", section, "section",
+                                   {"threshold": 120, "tissue": tissue})
+        _, intensity = run_pipeline("intensity", section, "section", {"tissue": tissue})
+        rows.append((binary, row, intensity))
+    (b1, r1, i1), (b4, r4, i4) = rows
+    assert np.array_equal(b1, b4)
+    assert r1 == r4 and i1 == i4
@@ -0,0 +1,45 @@
+"""Profiler: allocation peaks are kept only for stages that ran alone."""
+
+import os
+import sys
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profiling import Profiler  # noqa: E402
+
+
+def test_peak_of_a_stage_running_alone():
+    profiler = Profiler()
+    with profiler.stage("a", "load"):
+        block = np.ones(4 * 2**20, np.uint8)
+        del block
+    profiler.close()
+    peak = profiler.columns("a")["Load Peak Alloc (bytes)"]
+    assert 4 * 2**20 <= peak < 8 * 2**20
+
+
+def test_overlapping_stages_get_no_peak():
+    profiler = Profiler()
+    started, finish = threading.Event(), threading.Event()
+
+    def other():
+        with profiler.stage("b", "load"):
+            started.set()
+            finish.wait(5)
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    started.wait(5)
+    with profiler.stage("a", "load"):
+        np.ones(2**20, np.uint8)
+    finish.set()
+    thread.join()
+    with profiler.stage("a", "measure"):
+        pass
+    profiler.close()
+    assert "Load Peak Alloc (bytes)" not in profiler.columns("a")
+    assert "Load Peak Alloc (bytes)" not in profiler.columns("b")
+    assert profiler.columns("a")["Measure Peak Alloc (bytes)"] >= 0
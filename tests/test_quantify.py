@@ -0,0 +1,69 @@
+"""Histogram-derived Otsu and equalization must match OpenCV exactly."""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quantify import Histogram  # noqa: E402
+from synthetic import synthetic_section  # noqa: E402
+
+
+def _images8():
+    rng = np.random.default_rng(5)
+    section = cv2.cvtColor(synthetic_section(640, 480, seed=1), cv2.COLOR_RGB2GRAY)
+    bimodal = np.where(rng.random((240, 320)) < 0.3, 60, 190).astype(np.uint8)
+    bimodal = cv2.add(bimodal, rng.integers(0, 25, bimodal.shape, dtype=np.uint8))
+    narrow = rng.integers(100, 104, (200, 300), dtype=np.uint8)
+    two_levels = np.zeros((50, 80), np.uint8)
+    two_levels[:, 60:] = 255
+    constant = np.full((40, 40), 77, np.uint8)
+    return {"section": section, "bimodal": bimodal, "narrow": narrow,
+            "two_levels": two_levels, "constant": constant}
+
+
+IMAGES8 = _images8()
+
+
+def _otsu(image):
+    return int(cv2.threshold(image, 0, np.iinfo(image.dtype).max,
+                             cv2.THRESH_BINARY + cv2.THRESH_OTSU)[0])
+
+
+@pytest.mark.parametrize("name", sorted(IMAGES8))
+def test_otsu_matches_opencv_8bit(name):
+    image = IMAGES8[name]
+    assert Histogram.of(image).otsu_threshold() == _otsu(image)
+
+
+@pytest.mark.parametrize("name", sorted(IMAGES8))
+def test_equalize_lut_matches_opencv(name):
+    image = IMAGES8[name]
+    lut = Histogram.of(image).equalize_lut()
+    assert np.array_equal(cv2.LUT(image, lut), cv2.equalizeHist(image))
+
+
+def test_masked_otsu_matches_opencv_on_masked_pixels():
+    image = IMAGES8["section"]
+    mask = np.zeros(image.shape, np.uint8)
+    mask[100:400, 150:500] = 255
+    inside = np.ascontiguousarray(image[mask > 0]).reshape(1, -1)
+    assert Histogram.of(image, mask).otsu_threshold() == _otsu(inside)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_16bit_matches_opencv_and_numpy(seed):
+    rng = np.random.default_rng(seed)
+    image = rng.normal(20000, 8000, (300, 400)).clip(0, 65535).astype(np.uint16)
+    image[:100] += 15000
+    hist = Histogram.of(image)
+    assert hist.bins == 65536
+    assert hist.otsu_threshold() == _otsu(image)
+    assert hist.sum() == int(image.sum(dtype=np.int64))
+    assert hist.mean() == pytest.approx(image.mean())
+    assert hist.std() == pytest.approx(image.std())
+    assert (hist.min(), hist.max()) == (image.min(), image.max())
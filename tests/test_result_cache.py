@@ -0,0 +1,86 @@
+"""Result cache: keyed by content, parameters and PIPELINE_VERSION; LRU by bytes."""
+
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import result_cache  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+
+PARAMS = {"threshold": 100}
+ROW = {"Image Name": "a.png", "Total Pixels": 4, "Positive Pixels (%)": 50.0}
+
+
+def _image(tmp_path, name="a.png", content=b"pixels"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_copied_image_hits_under_its_own_name(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    original = _image(tmp_path)
+    copy = str(tmp_path / "b.png")
+    shutil.copy(original, copy)
+    binary = np.array([[0, 255], [255, 0]], np.uint8)
+    cache.put(cache.digest(original), "binary", PARAMS, ROW, binary)
+    hit_binary, row = cache.get(cache.digest(copy), "binary", PARAMS, "b.png")
+    assert row == dict(ROW, **{"Image Name": "b.png"})
+    assert np.array_equal(hit_binary, binary)
+    cache.close()
+
+
+def test_changed_content_params_or_pipeline_miss(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    path = _image(tmp_path)
+    digest = cache.digest(path)
+    cache.put(digest, "binary", PARAMS, ROW)
+    assert cache.get(digest, "binary", {"threshold": 101}) is None
+    assert cache.get(digest, "area", PARAMS) is None
+    time.sleep(0.01)
+    _image(tmp_path, content=b"other pixels")         # new size and mtime: hashed again
+    assert cache.digest(path) != digest
+    assert cache.get(cache.digest(path), "binary", PARAMS) is None
+    assert cache.get(digest, "binary", PARAMS) is not None
+    cache.close()
+
+
+def test_other_pipeline_version_is_dropped(tmp_path, monkeypatch):
+    directory = str(tmp_path / "cache")
+    cache = ResultCache(directory)
+    digest = cache.digest(_image(tmp_path))
+    cache.put(digest, "binary", PARAMS, ROW)
+    cache.close()
+    monkeypatch.setattr(result_cache, "PIPELINE_VERSION", result_cache.PIPELINE_VERSION + 1)
+    cache = ResultCache(directory)
+    assert cache.usage() == (0, 0)
+    assert cache.get(digest, "binary", PARAMS) is None
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=2 * len(str(ROW)) + 40)
+    cache.put("d1", "binary", PARAMS, ROW)
+    cache.put("d2", "binary", PARAMS, ROW)
+    time.sleep(0.01)
+    assert cache.get("d1", "binary", PARAMS) is not None   # d2 is now the oldest
+    cache.put("d3", "binary", PARAMS, ROW)
+    assert cache.get("d2", "binary", PARAMS) is None
+    assert cache.get("d1", "binary", PARAMS) is not None
+    assert cache.get("d3", "binary", PARAMS) is not None
+    cache.close()
+
+
+def test_invalidate_one_parameter_set(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    cache.put("d1", "binary", PARAMS, ROW)
+    cache.put("d1", "binary", {"threshold": 50}, ROW)
+    assert cache.invalidate("binary", PARAMS) == 1
+    assert cache.get("d1", "binary", PARAMS) is None
+    assert cache.get("d1", "binary", {"threshold": 50}) is not None
+    cache.close()
@@ -0,0 +1,49 @@
+"""Result sinks: late columns in Parquet, and .xlsx never clobbers a sibling .csv."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results_sink import open_sink  # noqa: E402
+
+
+def test_parquet_accepts_columns_after_first_row_group(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "table.parquet")
+    with open_sink(path, row_group_size=2) as sink:
+        sink.write({"Image Name": "a", "Total Pixels": 1})
+        sink.write({"Image Name": "b", "Total Pixels": 2})
+        sink.write({"Image Name": "c", "Total Pixels": 3, "Tissue Area (%)": 40.0})
+        sink.write({"Image Name": "d", "Total Pixels": 4})
+        sink.flush()
+        sink.write({"Image Name": "e", "Total Pixels": 5, "Stage Seconds": 0.5})
+    table = pq.read_table(path).to_pydict()
+    assert table["Image Name"] == ["a", "b", "c", "d", "e"]
+    assert table["Tissue Area (%)"] == [None, None, 40.0, None, None]
+    assert table["Stage Seconds"] == [None, None, None, None, 0.5]
+    assert sorted(os.listdir(tmp_path)) == ["table.parquet"]
+
+
+def test_xlsx_leaves_sibling_csv_alone(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    (tmp_path / "table.csv").write_text("mine\n1\n")
+    path = str(tmp_path / "table.xlsx")
+    with open_sink(path) as sink:
+        sink.write({"Image Name": "a", "Total Pixels": 1})
+    assert (tmp_path / "table.csv").read_text() == "mine\n1\n"
+    assert sorted(os.listdir(tmp_path)) == ["table.csv", "table.xlsx"]
+    assert list(pd.read_excel(path)["Image Name"]) == ["a"]
+
+
+def test_xlsx_append_keeps_earlier_rows(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    path = str(tmp_path / "table.xlsx")
+    pd.DataFrame({"Image Name": ["a"], "Total Pixels": [1]}).to_excel(path, index=False)
+    with open_sink(path, append=True) as sink:
+        sink.write({"Image Name": "b", "Total Pixels": 2})
+    assert list(pd.read_excel(path)["Image Name"]) == ["a", "b"]
@@ -0,0 +1,106 @@
+"""Sharded runs on one box: `local -n 3` must merge to the batch_quant table."""
+
+import csv
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shards  # noqa: E402
+from batch_quant import run_batch  # noqa: E402
+from synthetic import write_synthetic  # noqa: E402
+
+
+@pytest.fixture
+def study(tmp_path):
+    folder = tmp_path / "study"
+    folder.mkdir()
+    paths = [write_synthetic(str(folder / f"img{i:02d}.png"), 160, 120, seed=i)
+             for i in range(7)]
+    return folder, sorted(paths)
+
+
+def _read(path):
+    with open(path, newline="") as fh:
+        return [shards._parse_row(row) for row in csv.DictReader(fh)]
+
+
+@pytest.mark.parametrize("pipeline, params", [("binary", {"threshold": 100}), ("area", {})])
+@pytest.mark.parametrize("mode", [[], ["--claim", "--chunk", "2"]])
+def test_local_merge_matches_run_batch(study, pipeline, params, mode):
+    folder, paths = study
+    manifest = str(folder / "run.manifest.json")
+    argv = ["manifest", pipeline, str(folder), "-o", manifest]
+    if "threshold" in params:
+        argv += ["--threshold", str(params["threshold"])]
+    assert shards.main(argv) == 0
+    output = str(folder / "merged.csv")
+    assert shards.main(["local", manifest, "-n", "3", "-o", output] + mode) == 0
+
+    expected, errors = run_batch(paths, pipeline, workers=1, **params)
+    assert not errors
+    merged = _read(output)
+    assert [row["Image Name"] for row in merged] == [row["Image Name"] for row in expected]
+    for got, want in zip(merged, expected):
+        assert got.keys() == want.keys()
+        for key, value in want.items():
+            assert got[key] == pytest.approx(value)
+
+
+def test_stale_lock_is_taken_over_once(tmp_path):
+    first = shards.LockClaim(str(tmp_path), "chunk-000000", stale=0.5)
+    assert first.acquire()
+    first._stop.set()                        # a crashed node: no more heartbeats
+    first._heartbeat.join()
+    old = time.time() - 10
+    os.utime(first.path, (old, old))
+
+    second = shards.LockClaim(str(tmp_path), "chunk-000000", stale=0.5)
+    third = shards.LockClaim(str(tmp_path), "chunk-000000", stale=0.5)
+    assert second.acquire()
+    assert not third.acquire()
+    # the crashed node neither refreshes nor removes the new owner's lock
+    assert not first.refresh()
+    first.release()
+    with open(second.path) as fh:
+        assert fh.read() == second.owner
+    second.release()
+    assert not os.path.exists(second.path)
+    assert not [f for f in os.listdir(tmp_path) if ".stale-" in f or ".release-" in f]
+
+
+def test_heartbeat_keeps_a_busy_lock(tmp_path):
+    lock = shards.LockClaim(str(tmp_path), "chunk-000000", stale=0.4)
+    assert lock.acquire()
+    time.sleep(1.0)                          # one long image, no progress callbacks
+    other = shards.LockClaim(str(tmp_path), "chunk-000000", stale=0.4)
+    assert not other.acquire()
+    lock.release()
+    assert not lock.lost
+
+
+def test_takeover_race_backs_off(tmp_path, monkeypatch):
+    crashed = shards.LockClaim(str(tmp_path), "chunk-000000", stale=0.5)
+    crashed._create()
+    old = time.time() - 10
+    os.utime(crashed.path, (old, old))
+    winner = shards.LockClaim(str(tmp_path), "chunk-000000", stale=0.5)
+    late = shards.LockClaim(str(tmp_path), "chunk-000000", stale=0.5)
+
+    rename = os.rename
+
+    def winner_first(src, dst):
+        # the winner takes the stale lock over between late's stat and rename
+        monkeypatch.setattr(shards.os, "rename", rename)
+        assert winner.acquire()
+        rename(src, dst)
+
+    monkeypatch.setattr(shards.os, "rename", winner_first)
+    assert not late.acquire()
+    with open(winner.path) as fh:
+        assert fh.read() == winner.owner
+    assert winner.refresh()
+    winner.release()
@@ -0,0 +1,43 @@
+"""Stacks: planar-configuration and multi-page TIFFs stream the right planes."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stacks import StackReader  # noqa: E402
+
+
+def _planes(path):
+    with StackReader(path) as reader:
+        return reader.sizes, {(t, z, c): plane.copy() for t, z, c, plane in reader.planes()}
+
+
+@pytest.mark.parametrize("planarconfig", ["separate", "contig"])
+def test_rgb_planar_and_contig(tmp_path, planarconfig):
+    import tifffile
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 255, (4, 3, 40, 50), np.uint8)     # Z, C, Y, X
+    stored = data if planarconfig == "separate" else np.moveaxis(data, 1, -1)
+    path = str(tmp_path / "stack.tif")
+    tifffile.imwrite(path, stored, photometric="rgb", planarconfig=planarconfig)
+    sizes, planes = _planes(path)
+    assert sizes == {"T": 1, "Z": 4, "C": 3}
+    for (t, z, c), plane in planes.items():
+        assert np.array_equal(plane, data[z, c])
+
+
+def test_imagej_hyperstack(tmp_path):
+    import tifffile
+    rng = np.random.default_rng(1)
+    data = rng.integers(0, 4095, (2, 3, 2, 30, 40), np.uint16)  # T, Z, C, Y, X
+    path = str(tmp_path / "hyper.tif")
+    tifffile.imwrite(path, data, imagej=True, metadata={"axes": "TZCYX"})
+    sizes, planes = _planes(path)
+    assert sizes == {"T": 2, "Z": 3, "C": 2}
+    assert len(planes) == 12
+    for (t, z, c), plane in planes.items():
+        assert np.array_equal(plane, data[t, z, c])
@@ -0,0 +1,97 @@
+"""Stage graph memo: only stages downstream of a changed parameter are recomputed."""
+
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipelines import BINARY_STAGES  # noqa: E402
+from stages import Stage, StageGraph  # noqa: E402
+
+calls = Counter()
+
+
+def _counted(name, func):
+    def stage(*args, **kwargs):
+        calls[name] += 1
+        return func(*args, **kwargs)
+    return stage
+
+
+STAGES = {
+    "load":    Stage(_counted("load", lambda source: np.full(1000, source, np.float64))),
+    "scale":   Stage(_counted("scale", lambda a, factor: a * factor), ("load",), {"factor": 2}),
+    "measure": Stage(_counted("measure", lambda a, offset: float(a.sum()) + offset),
+                     ("scale",), {"offset": 0}),
+    "binary":  Stage(_counted("binary", lambda a: a > 1), ("scale",), memoise=False),
+}
+
+
+def setup_function():
+    calls.clear()
+
+
+def test_changed_param_recomputes_only_downstream():
+    graph = StageGraph(STAGES)
+    assert graph.run("img", 1) == (2000.0,)
+    assert graph.run("img", 1, {"offset": 5}) == (2005.0,)
+    assert calls == {"load": 1, "scale": 1, "measure": 2}
+    assert graph.run("img", 1, {"factor": 3}) == (3000.0,)
+    assert calls == {"load": 1, "scale": 2, "measure": 3}
+    assert graph.run("img", 1) == (2000.0,)                 # earlier parameters still held
+    assert calls == {"load": 1, "scale": 2, "measure": 3}
+
+
+def test_keys_separate_images_and_none_disables_memo():
+    graph = StageGraph(STAGES)
+    graph.run("a", 1)
+    graph.run("b", 2)
+    graph.run(None, 1)
+    graph.run(None, 1)
+    assert calls["load"] == 4
+    graph.invalidate("a")
+    graph.run("a", 1)
+    graph.run("b", 2)
+    assert calls["load"] == 5
+
+
+def test_zero_budget_keeps_nothing_but_shares_within_a_run():
+    graph = StageGraph(STAGES, memory_budget=0)
+    graph.run("img", 1, targets=("measure", "binary"))
+    graph.run("img", 1, targets=("measure", "binary"))
+    assert calls == {"load": 2, "scale": 2, "measure": 2, "binary": 2}
+    assert graph.memory_used == 0
+
+
+def test_memo_is_bounded_by_bytes_lru():
+    one_image = 2 * (8000 + 1024)                # load + scale arrays and entry overhead
+    graph = StageGraph(STAGES, memory_budget=2 * one_image + 2048)
+    for key in ("a", "b", "c"):
+        graph.run(key, 1)
+    assert graph.memory_used <= graph.memory_budget
+    graph.run("c", 1)
+    graph.run("b", 1)
+    assert calls["load"] == 3                     # b and c still held
+    graph.run("a", 1)
+    assert calls["load"] == 4                     # a was the least recently used
+
+
+def test_memoise_false_is_never_kept():
+    graph = StageGraph(STAGES)
+    for _ in range(3):
+        graph.run("img", 1, targets=("binary",))
+    assert calls["binary"] == 3 and calls["scale"] == 1
+    assert not any(name == "binary" for _, name, _ in graph._memo)
+
+
+def test_new_threshold_reuses_the_histogram():
+    graph = StageGraph(BINARY_STAGES)
+    gray = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    graph.run(0, gray, {"threshold": 100})
+    misses = graph.misses
+    row, = graph.run(0, gray, {"threshold": 200})
+    assert graph.misses - misses == 2             # threshold and measure only
+    assert row["Positive Pixels (%)"] == 55 / 256 * 100
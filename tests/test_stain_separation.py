@@ -0,0 +1,39 @@
+"""Stain separation: the binary pipeline counts stained pixels as positive."""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import tifffile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipelines import analyze_file  # noqa: E402
+from tiling import analyze_file_tiled  # noqa: E402
+
+
+def _dab_slide(path):
+    # white glass with a brown (DAB) block covering a quarter of the image
+    rgb = np.full((256, 512, 3), 245, np.uint8)
+    rgb[:128, :256] = (120, 75, 40)
+    tifffile.imwrite(path, rgb, tile=(64, 64), photometric="rgb")
+    cv2.imwrite(path.replace(".tif", ".png"), cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+
+
+def test_binary_dab_positive_is_stained(tmp_path):
+    path = str(tmp_path / "slide.tif")
+    _dab_slide(path)
+    params = {"stain": "dab", "threshold": 100}
+    row = analyze_file(path.replace(".tif", ".png"), "binary", **params)
+    assert abs(row["Positive Pixels (%)"] - 25.0) < 0.5
+    tiled = analyze_file_tiled(path, "binary", memory_budget=64 * 1024, **params)
+    assert tiled["Positive Pixels (%)"] == row["Positive Pixels (%)"]
+
+
+def test_area_dab_tiled_matches_in_memory(tmp_path):
+    path = str(tmp_path / "slide.tif")
+    _dab_slide(path)
+    row = analyze_file(path.replace(".tif", ".png"), "area", stain="dab")
+    tiled = analyze_file_tiled(path, "area", memory_budget=2**20, stain="dab")
+    assert tiled["Myelin Positive (%) (black)"] == row["Myelin Positive (%) (black)"]
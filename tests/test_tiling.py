@@ -0,0 +1,106 @@
+"""Tiled pipelines must reproduce the in-memory ones: halo, tile edges, tissue skipping."""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background import MODES  # noqa: E402
+from pipelines import run_pipeline  # noqa: E402
+from synthetic import synthetic_section  # noqa: E402
+from tiling import (_BUFFERS_PER_PIXEL, _tissue_tiles, analyze_file_tiled,  # noqa: E402
+                    iter_tiles, open_source, tile_size_for_budget, tiled_myelin_area)
+from tissue import TissueMask  # noqa: E402
+
+WIDTH, HEIGHT = 700, 530                     # not a multiple of the tile: ragged edge tiles
+TILE, RADIUS = 100, 8
+
+
+def _budget(tile=TILE, halo=2 * RADIUS):
+    return _BUFFERS_PER_PIXEL * (tile + 2 * halo) ** 2
+
+
+@pytest.fixture(scope="module")
+def slide(tmp_path_factory):
+    import tifffile
+    rgb = synthetic_section(WIDTH, HEIGHT, seed=2)
+    section = rgb[100:-130, 150:-200].copy()
+    rgb[:] = 236                             # tissue in the middle, glass around it
+    rgb[100:-130, 150:-200] = section
+    path = str(tmp_path_factory.mktemp("slides") / "slide.tif")
+    tifffile.imwrite(path, rgb, tile=(64, 64), photometric="rgb")
+    return path
+
+
+def test_budget_gives_several_tiles():
+    assert tile_size_for_budget(_budget(), 2 * RADIUS) == TILE
+    assert tile_size_for_budget(_budget(halo=0)) == TILE
+
+
+def test_tissue_skips_glass_tiles(slide):
+    source = open_source(slide)
+    try:
+        tissue = TissueMask.of_source(source)
+        kept = len(list(_tissue_tiles(source.shape, TILE, tissue)))
+    finally:
+        source.close()
+    assert 0 < kept < len(list(iter_tiles((HEIGHT, WIDTH), TILE)))
+
+
+@pytest.mark.parametrize("tissue", [False, True])
+@pytest.mark.parametrize("mode", [m for m in MODES if m != "downsample"])
+def test_area_matches_in_memory(slide, mode, tissue):
+    params = {"background_mode": mode, "background_radius": RADIUS, "tissue": tissue}
+    _, in_memory = run_pipeline("area", slide, "slide.tif", params, with_binary=False)
+    assert analyze_file_tiled(slide, "area", _budget(), **params) == in_memory
+
+
+def test_downsample_area_is_close(slide):
+    params = {"background_mode": "downsample", "background_radius": RADIUS}
+    _, in_memory = run_pipeline("area", slide, "slide.tif", params, with_binary=False)
+    tiled = analyze_file_tiled(slide, "area", _budget(), **params)
+    key = "Myelin Positive (%) (black)"
+    assert tiled[key] == pytest.approx(in_memory[key], abs=2.0)
+
+
+@pytest.mark.parametrize("tissue", [False, True])
+def test_binary_and_intensity_match_in_memory(slide, tissue):
+    for pipeline, params in (("binary", {"threshold": 150}), ("intensity", {})):
+        params = dict(params, tissue=tissue)
+        _, in_memory = run_pipeline(pipeline, slide, "slide.tif", params, with_binary=False)
+        tiled = analyze_file_tiled(slide, pipeline, _budget(halo=0), **params)
+        assert tiled.keys() == in_memory.keys()
+        for key, value in in_memory.items():
+            assert tiled[key] == pytest.approx(value), (pipeline, key)
+
+
+def test_area_mask_tiles_match_in_memory_binary(slide):
+    params = {"background_radius": RADIUS}
+    binary, _ = run_pipeline("area", slide, "slide.tif", params)
+    assembled = np.full(binary.shape, 7, np.uint8)
+
+    def place(y0, x0, tile):
+        assembled[y0:y0 + tile.shape[0], x0:x0 + tile.shape[1]] = tile
+
+    source = open_source(slide)
+    try:
+        tiled_myelin_area(source, "slide.tif", background_radius=RADIUS,
+                          memory_budget=_budget(), mask_callback=place)
+    finally:
+        source.close()
+    assert np.array_equal(assembled, binary)
+
+
+def test_16bit_intensity_from_npy(tmp_path):
+    rng = np.random.default_rng(4)
+    gray = rng.normal(30000, 9000, (HEIGHT, WIDTH)).clip(0, 65535).astype(np.uint16)
+    path = str(tmp_path / "gray.npy")
+    np.save(path, gray)
+    tiled = analyze_file_tiled(path, "intensity", _budget(halo=0))
+    _, in_memory = run_pipeline("intensity", gray, "gray.npy", with_binary=False)
+    assert tiled == pytest.approx(in_memory)
+    assert cv2.mean(gray)[0] == pytest.approx(tiled["Average Intensity"])
@@ -0,0 +1,51 @@
+"""Tissue masks: the tiled path finds the same tissue as the in-memory path."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipelines import analyze_file  # noqa: E402
+from synthetic import synthetic_section  # noqa: E402
+from tiling import analyze_file_tiled  # noqa: E402
+from tissue import TissueMask, detect_tissue  # noqa: E402
+
+WIDTH, HEIGHT = 2300, 1500                   # longer than LEVEL_MAX_SIDE: the level is strided
+
+
+@pytest.fixture(scope="module")
+def slide(tmp_path_factory):
+    import tifffile
+    rgb = synthetic_section(WIDTH, HEIGHT, seed=7)
+    section = rgb[300:-400, 500:-600].copy()
+    rgb[:] = 236                             # tissue in the middle, glass around it
+    rgb[300:-400, 500:-600] = section
+    path = str(tmp_path_factory.mktemp("slides") / "slide.tif")
+    tifffile.imwrite(path, rgb, tile=(256, 256), photometric="rgb")
+    return path
+
+
+@pytest.mark.parametrize("pipeline, params", [("area", {"background_radius": 8}),
+                                              ("binary", {"threshold": 150}),
+                                              ("intensity", {})])
+def test_tiled_tissue_matches_in_memory(slide, pipeline, params):
+    in_memory = analyze_file(slide, pipeline, tissue=True, **params)
+    tiled = analyze_file_tiled(slide, pipeline, 8 * 2**20, tissue=True, **params)
+    assert 20 < in_memory["Tissue Area (%)"] < 40
+    assert tiled.keys() == in_memory.keys()
+    for key, value in in_memory.items():
+        assert tiled[key] == pytest.approx(value), key
+
+
+def test_region_matches_nearest_upsampling():
+    rng = np.random.default_rng(0)
+    mask = TissueMask(detect_tissue(rng.integers(0, 255, (90, 130), np.uint8)), (1001, 1707))
+    rows = np.arange(1001) * 90 // 1001
+    cols = np.arange(1707) * 130 // 1707
+    expected = mask.level[rows][:, cols].astype(np.uint8) * 255
+    assert np.array_equal(mask.full(), expected)
+    assert np.array_equal(mask.region(37, 512, 250, 999), expected[37:512, 250:999])
+    assert mask.pixels() == np.count_nonzero(expected)
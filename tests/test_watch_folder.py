@@ -0,0 +1,57 @@
+"""Watch folder: the running table stays labelled, also when stopped by SIGTERM."""
+
+import csv
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from results_sink import CsvSink  # noqa: E402
+from synthetic import synthetic_section  # noqa: E402
+
+
+def _header(path):
+    with open(path, newline="") as fh:
+        return next(csv.reader(fh))
+
+
+def test_checkpoint_labels_new_columns(tmp_path):
+    path = str(tmp_path / "table.csv")
+    sink = CsvSink(path)
+    sink.write({"Image Name": "a", "Total Pixels": 1})
+    sink.write({"Image Name": "b", "Total Pixels": 2, "Tissue Area (%)": 50.0})
+    sink.checkpoint()
+    assert _header(path) == ["Image Name", "Total Pixels", "Tissue Area (%)"]
+    sink.write({"Image Name": "c", "Total Pixels": 3, "Tissue Area (%)": 25.0})
+    sink.close()
+    with open(path, newline="") as fh:
+        assert [row["Image Name"] for row in csv.DictReader(fh)] == ["a", "b", "c"]
+
+
+def test_sigterm_closes_the_table(tmp_path):
+    folder = tmp_path / "exports"
+    folder.mkdir()
+    table = tmp_path / "daily.csv"
+    with open(table, "w", newline="") as fh:    # an older table without the tissue column
+        fh.write("Image Name,Total Pixels,Positive Pixels (%),Negative Pixels (%),Threshold\r\n")
+    cv2.imwrite(str(folder / "img.png"), synthetic_section(300, 200, seed=2))
+
+    daemon = subprocess.Popen([sys.executable, os.path.join(ROOT, "watch_folder.py"), "binary",
+                               str(folder), "-o", str(table), "--tissue", "--poll",
+                               "--interval", "0.2", "--settle", "0.2", "--no-cache"],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        deadline = time.time() + 60
+        while "new image(s) processed" not in daemon.stdout.readline():
+            assert time.time() < deadline and daemon.poll() is None
+    finally:
+        daemon.send_signal(signal.SIGTERM)
+        assert daemon.wait(30) == 0          # left through main()'s finally, not killed
+    assert "Tissue Area (%)" in _header(table)
+    assert os.path.exists(str(table.with_suffix("")) + ".index.sqlite")
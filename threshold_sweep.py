@@ -0,0 +1,71 @@
+"""
+Threshold slider with a live "% positive vs threshold" curve.
+The curves come from cached cumulative histograms (quantify.Histogram), so
+moving the slider is a table lookup; callers refresh their previews from
+small downsampled caches only.
+"""
+
+import tkinter as tk
+
+import cv2
+
+CURVE_W, CURVE_H = 256, 90
+CURVE_COLORS = ("red", "green", "blue")
+PREVIEW_SIZE = (200, 200)
+
+
+def preview_cache(image, size=PREVIEW_SIZE):
+    """Downsampled copy of an image used for fast threshold previews."""
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def threshold_preview(preview, threshold):
+    _, binary = cv2.threshold(preview, threshold, 255, cv2.THRESH_BINARY)
+    return binary
+
+
+class ThresholdSweep(tk.Frame):
+    """Slider (0–255) plus a canvas plotting % positive for every threshold."""
+
+    def __init__(self, master, threshold=127, command=None):
+        super().__init__(master)
+        self.command = command
+        self.curves = {}                # key → array of 256 percentages
+
+        self.var = tk.IntVar(value=threshold)
+        tk.Scale(self, from_=0, to=255, orient="horizontal", length=CURVE_W,
+                 label="Threshold", variable=self.var,
+                 command=self._on_move).pack()
+
+        self.canvas = tk.Canvas(self, width=CURVE_W, height=CURVE_H, bg="white")
+        self.canvas.pack(pady=2)
+        self._draw()
+
+    @property
+    def threshold(self):
+        return self.var.get()
+
+    def set_curve(self, key, curve):
+        """Add/replace the curve for key (e.g. an image slot)."""
+        self.curves[key] = curve
+        self._draw()
+
+    def clear(self):
+        self.curves = {}
+        self._draw()
+
+    def _on_move(self, _val):
+        self._draw()
+        if self.command:
+            self.command(self.threshold)
+
+    def _draw(self):
+        self.canvas.delete("all")
+        for i, (key, curve) in enumerate(sorted(self.curves.items())):
+            points = []
+            for t, pct in enumerate(curve[:CURVE_W]):
+                points += [t, CURVE_H - pct / 100.0 * (CURVE_H - 1)]
+            self.canvas.create_line(*points, fill=CURVE_COLORS[i % len(CURVE_COLORS)])
+        t = self.threshold
+        self.canvas.create_line(t, 0, t, CURVE_H, fill="gray", dash=(2, 2))
+        self.canvas.create_text(CURVE_W - 4, 4, anchor="ne", text="% positive", fill="gray")
@@ -0,0 +1,352 @@
+"""
+Tiled, memory-bounded execution of the analysis pipelines
+ • Streams an image tile by tile from a tiled/striped TIFF (only the TIFF
+   segments covering a tile are decoded), a memory-mapped .npy / raw array,
+   or an in-memory array.
+ • Tile size is derived from a user-set memory budget.
+ • Neighbourhood ops (white top-hat) run on tiles padded with a halo of
+   2 × radius, so every output pixel sees exactly the neighbourhood it
+   would see in the full image (the approximate "downsample" background
+   mode shrinks each tile on its own, so it only comes close).
+ • Image-wide statistics (equalization CDF, Otsu threshold) are gathered in
+   streaming passes first, so results match the in-memory path in
+   pipelines.py.
+ • tissue=True detects tissue first, on the same strided low-resolution
+   level the in-memory path uses (tissue.py; one segment decoded at a
+   time); tiles without tissue are then skipped by every pass.
+ • stain="dab" (etc.) wraps the source in a StainSource, so every tile is
+   colour-deconvolved as it is read (stain_separation.py); the binary
+   pipeline reads it inverted (bright = stained), as pipelines.py does.
+"""
+
+import math
+import os
+
+import cv2
+import numpy as np
+
+from background import subtract_background, DEFAULT_MODE, DEFAULT_RADIUS
+from pipelines import (DEFAULT_THRESHOLD, STAIN_INVERTED, analyze_file, myelin_row,
+                       fixed_threshold_row, intensity_row, with_tissue_area)
+from quantify import Histogram
+from stain_separation import DEFAULT_MATRIX, StainSeparator
+from tissue import TissueMask
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024   # bytes
+MIN_TILE = 64
+STREAMABLE_EXTENSIONS = (".tif", ".tiff", ".npy")
+# working buffers per (padded) tile pixel: source, equalized, top-hat, cv2 scratch
+_BUFFERS_PER_PIXEL = 6
+
+
+# ---------- sources ----------
+def _imread_gray8(rgb):
+    """cv2.imread's own fixed-point RGB → gray (differs from cvtColor by ±1)."""
+    rgb = rgb.astype(np.int32)
+    gray = (rgb[..., 0] * 4899 + rgb[..., 1] * 9617 + rgb[..., 2] * 1868 + (1 << 13)) >> 14
+    return gray.astype(np.uint8)
+
+
+def _to_gray(region, rgb_order, depth8=True):
+    """Collapse a region to grayscale; depth8 mimics cv2.IMREAD_GRAYSCALE."""
+    if region.ndim == 3 and region.shape[2] == 1:
+        region = region[..., 0]
+    if region.ndim == 3:
+        if depth8 and rgb_order and region.dtype == np.uint8:
+            return _imread_gray8(region)
+        code = {(3, True): cv2.COLOR_RGB2GRAY, (3, False): cv2.COLOR_BGR2GRAY,
+                (4, True): cv2.COLOR_RGBA2GRAY, (4, False): cv2.COLOR_BGRA2GRAY}
+        region = cv2.cvtColor(np.ascontiguousarray(region), code[(region.shape[2], rgb_order)])
+    if depth8 and region.dtype == np.uint16:
+        region = (region >> 8).astype(np.uint8)
+    return np.ascontiguousarray(region)
+
+
+class ArraySource:
+    """In-memory or memory-mapped array (H×W gray or H×W×C BGR)."""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape[:2]
+
+    def read_region(self, y0, y1, x0, x1, depth8=True):
+        return _to_gray(np.asarray(self.array[y0:y1, x0:x1]), False, depth8)
+
+    def read_strided(self, step, depth8=True):
+        """Grayscale of every step-th row and column (low-resolution level)."""
+        return _to_gray(np.asarray(self.array[::step, ::step]), False, depth8)
+
+    def read_color(self, y0, y1, x0, x1):
+        """(native H×W×C region, whether it is in RGB order)."""
+        return np.asarray(self.array[y0:y1, x0:x1]), False
+
+    def close(self):
+        pass
+
+
+class TiffSource:
+    """Decodes only the TIFF tiles/strips that intersect the requested region."""
+
+    def __init__(self, path, page=0):
+        import tifffile
+        self.tif = tifffile.TiffFile(path)
+        self.page = self.tif.pages[page]
+        self.shape = self.page.shape[:2] if self.page.planarconfig == 1 else self.page.shape[1:3]
+        if self.page.planarconfig != 1 and self.page.samplesperpixel > 1:
+            raise ValueError("Planar (separate) TIFF sample layout is not supported in tiled mode")
+        seg_h, seg_w = self.page.chunks[:2]
+        self.segment_shape = (seg_h, seg_w)
+        self.grid_cols = math.ceil(self.shape[1] / seg_w)
+
+    def segment_indices(self, y0, y1, x0, x1):
+        """Indices of the segments intersecting a region."""
+        seg_h, seg_w = self.segment_shape
+        y1, x1 = min(y1, self.shape[0]), min(x1, self.shape[1])
+        return [row * self.grid_cols + col
+                for row in range(y0 // seg_h, (y1 - 1) // seg_h + 1)
+                for col in range(x0 // seg_w, (x1 - 1) // seg_w + 1)]
+
+    def decode_segment(self, index):
+        """(sy, sx, pixels) of one segment; pixels is H×W×samples cropped to the image."""
+        fh = self.tif.filehandle
+        fh.seek(self.page.dataoffsets[index])
+        data = fh.read(self.page.databytecounts[index])
+        segment, indices, _ = self.page.decode(data, index, jpegtables=self.page.jpegtables)
+        sy, sx = indices[-3], indices[-2]
+        return sy, sx, segment[0, :self.shape[0] - sy, :self.shape[1] - sx]
+
+    def segments(self, y0, y1, x0, x1):
+        """Yield (sy, sx, pixels) for each segment intersecting the region."""
+        for index in self.segment_indices(y0, y1, x0, x1):
+            yield self.decode_segment(index)
+
+    def read_raw(self, y0, y1, x0, x1):
+        """Native samples of a region (H×W or H×W×S, RGB order); zero outside the image."""
+        return self.read_raw_many([(y0, y1, x0, x1)])[0]
+
+    def read_raw_many(self, boxes):
+        """read_raw for several (y0, y1, x0, x1) boxes, decoding each segment once."""
+        samples = self.page.samplesperpixel
+        extra = (samples,) if samples > 1 else ()
+        outs = [np.zeros((y1 - y0, x1 - x0) + extra, self.page.dtype) for y0, y1, x0, x1 in boxes]
+        wanted = {}                          # segment index → boxes that need it
+        for k, box in enumerate(boxes):
+            for index in self.segment_indices(*box):
+                wanted.setdefault(index, []).append(k)
+
+        for index in sorted(wanted):         # file order
+            sy, sx, segment = self.decode_segment(index)
+            if samples == 1:
+                segment = segment[..., 0]
+            for k in wanted[index]:
+                y0, y1, x0, x1 = boxes[k]
+                # overlap of this segment with the requested region
+                ty0, ty1 = max(y0, sy), min(y1, sy + segment.shape[0])
+                tx0, tx1 = max(x0, sx), min(x1, sx + segment.shape[1])
+                outs[k][ty0 - y0:ty1 - y0, tx0 - x0:tx1 - x0] = \
+                    segment[ty0 - sy:ty1 - sy, tx0 - sx:tx1 - sx]
+        return outs
+
+    def read_raw_strided(self, step):
+        """Native samples of every step-th row and column, decoding one segment at a time."""
+        h, w = self.shape
+        samples = self.page.samplesperpixel
+        extra = (samples,) if samples > 1 else ()
+        out = np.empty((math.ceil(h / step), math.ceil(w / step)) + extra, self.page.dtype)
+        for sy, sx, segment in self.segments(0, h, 0, w):
+            if samples == 1:
+                segment = segment[..., 0]
+            r0, c0 = (-sy) % step, (-sx) % step
+            part = segment[r0::step, c0::step]
+            oy, ox = (sy + r0) // step, (sx + c0) // step
+            out[oy:oy + part.shape[0], ox:ox + part.shape[1]] = part
+        return out
+
+    def read_region(self, y0, y1, x0, x1, depth8=True):
+        return _to_gray(self.read_raw(y0, y1, x0, x1), True, depth8)
+
+    def read_strided(self, step, depth8=True):
+        """Grayscale of every step-th row and column (low-resolution level)."""
+        return _to_gray(self.read_raw_strided(step), True, depth8)
+
+    def read_color(self, y0, y1, x0, x1):
+        return self.read_raw(y0, y1, x0, x1), True
+
+    def close(self):
+        self.tif.close()
+
+
+class StainSource:
+    """A source whose regions are one separated stain instead of grayscale."""
+
+    def __init__(self, source, stain, stain_matrix=DEFAULT_MATRIX, inverted=False):
+        self.source = source
+        self.stain = stain
+        self.inverted = inverted
+        self.separator = StainSeparator.named(stain_matrix)
+        self.separator.index(stain)          # unknown stains fail before any tile is read
+        self.shape = source.shape
+
+    def __getattr__(self, name):             # segment_shape etc. of the wrapped source
+        return getattr(self.source, name)
+
+    def read_region(self, y0, y1, x0, x1, depth8=True):
+        region, rgb_order = self.source.read_color(y0, y1, x0, x1)
+        return _to_gray(self.separator.channel(region, self.stain, bgr=not rgb_order,
+                                               inverted=self.inverted), rgb_order, depth8)
+
+    def close(self):
+        self.source.close()
+
+
+def open_source(path, raw_shape=None, raw_dtype=np.uint8, raw_offset=0):
+    """Streaming source for a TIFF, .npy or raw (raw_shape given) file."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".tif", ".tiff"):
+        return TiffSource(path)
+    if ext == ".npy":
+        return ArraySource(np.load(path, mmap_mode="r"))
+    if raw_shape is not None:
+        return ArraySource(np.memmap(path, dtype=raw_dtype, mode="r",
+                                     offset=raw_offset, shape=tuple(raw_shape)))
+    raise ValueError(f"Cannot stream {ext or path} files; use TIFF, .npy or a raw array")
+
+
+def stain_source(source, pipeline, stain=None, stain_matrix=DEFAULT_MATRIX, **_params):
+    """source, or a StainSource of it (as pipeline measures it) when a stain is selected."""
+    if not stain:
+        return source
+    return StainSource(source, stain, stain_matrix, inverted=pipeline in STAIN_INVERTED)
+
+
+# ---------- tiling geometry ----------
+def tile_size_for_budget(memory_budget, halo=0):
+    """Largest square tile whose padded working set fits in memory_budget bytes."""
+    padded = int(math.sqrt(memory_budget / _BUFFERS_PER_PIXEL))
+    tile = padded - 2 * halo
+    if tile < MIN_TILE:
+        needed = _BUFFERS_PER_PIXEL * (MIN_TILE + 2 * halo) ** 2
+        raise ValueError(f"Memory budget too small for halo {halo}; need at least {needed} bytes")
+    return tile
+
+
+def iter_tiles(shape, tile, halo=0):
+    """Yield (core, padded) boxes as (y0, y1, x0, x1) tuples covering shape."""
+    h, w = shape
+    for y0 in range(0, h, tile):
+        for x0 in range(0, w, tile):
+            y1, x1 = min(y0 + tile, h), min(x0 + tile, w)
+            padded = (max(0, y0 - halo), min(h, y1 + halo), max(0, x0 - halo), min(w, x1 + halo))
+            yield (y0, y1, x0, x1), padded
+
+
+# ---------- tiled pipelines ----------
+def _tissue_tiles(shape, tile, tissue, halo=0):
+    """iter_tiles, minus the tiles whose core holds no tissue."""
+    for core, padded in iter_tiles(shape, tile, halo):
+        if tissue is None or tissue.any(*core):
+            yield core, padded
+
+
+def _tissue_row(row, hist, tissue):
+    if tissue is None:
+        return row
+    return with_tissue_area(row, hist.total, tissue.shape[0] * tissue.shape[1])
+
+
+def tiled_histogram(source, tile, depth8=True, tissue=None):
+    """Merged histogram of all tiles (one streaming pass), inside tissue if given."""
+    hist = Histogram.empty(256 if depth8 else 65536)
+    for (y0, y1, x0, x1), _ in _tissue_tiles(source.shape, tile, tissue):
+        region = source.read_region(y0, y1, x0, x1, depth8)
+        if region.dtype == np.uint8 and hist.bins != 256:
+            region = region.astype(np.uint16)
+        mask = tissue.region(y0, y1, x0, x1) if tissue is not None else None
+        hist += Histogram.of(region, mask)
+    return hist
+
+
+def _tophat_tiles(source, lut, background_mode, background_radius, tile, tissue=None):
+    """Yield (y0, x0, core) top-hat tiles of the equalized image."""
+    halo = 2 * background_radius
+    for (y0, y1, x0, x1), (py0, py1, px0, px1) in _tissue_tiles(source.shape, tile, tissue, halo):
+        padded = cv2.LUT(source.read_region(py0, py1, px0, px1), lut)
+        tophat = subtract_background(padded, background_radius, background_mode)
+        yield y0, x0, tophat[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+
+
+def tiled_myelin_area(source, name, background_mode=DEFAULT_MODE, background_radius=DEFAULT_RADIUS,
+                      memory_budget=DEFAULT_MEMORY_BUDGET, mask_callback=None, tissue=None):
+    """Tiled equivalent of pipelines.myelin_area (returns the result row).
+
+    mask_callback(y0, x0, binary_tile), if given, receives every binary tile
+    (only tiles with tissue when a TissueMask is given); this costs one extra
+    pass because the Otsu threshold is only known once the whole image has
+    been seen.
+    """
+    tile = tile_size_for_budget(memory_budget, 2 * background_radius)
+
+    # pass 1: global histogram → equalization LUT
+    lut = tiled_histogram(source, tile, tissue=tissue).equalize_lut()
+
+    # pass 2: equalize + top-hat with halo; global histogram of the result
+    tophat_hist = Histogram.empty()
+    for y0, x0, core in _tophat_tiles(source, lut, background_mode, background_radius, tile,
+                                      tissue):
+        mask = None
+        if tissue is not None:
+            mask = tissue.region(y0, y0 + core.shape[0], x0, x0 + core.shape[1])
+        tophat_hist += Histogram.of(core, mask)
+    threshold = tophat_hist.otsu_threshold()
+
+    if mask_callback is not None:
+        for y0, x0, core in _tophat_tiles(source, lut, background_mode, background_radius, tile,
+                                          tissue):
+            _, binary = cv2.threshold(core, threshold, 255, cv2.THRESH_BINARY)
+            mask_callback(y0, x0, binary)
+
+    return _tissue_row(myelin_row(name, tophat_hist, threshold), tophat_hist, tissue)
+
+
+def tiled_fixed_threshold_area(source, name, threshold=DEFAULT_THRESHOLD,
+                               memory_budget=DEFAULT_MEMORY_BUDGET, tissue=None):
+    """Tiled equivalent of pipelines.fixed_threshold_area (single pass)."""
+    hist = tiled_histogram(source, tile_size_for_budget(memory_budget), tissue=tissue)
+    return _tissue_row(fixed_threshold_row(name, hist, threshold), hist, tissue)
+
+
+def tiled_mean_intensity(source, name, memory_budget=DEFAULT_MEMORY_BUDGET, tissue=None):
+    """Tiled equivalent of pipelines.mean_intensity (keeps 16-bit depth)."""
+    hist = tiled_histogram(source, tile_size_for_budget(memory_budget), depth8=False,
+                           tissue=tissue)
+    return _tissue_row(intensity_row(name, hist), hist, tissue)
+
+
+def analyze_file_tiled(path, pipeline, memory_budget=DEFAULT_MEMORY_BUDGET, **params):
+    """Tiled counterpart of pipelines.analyze_file.
+
+    Formats that cannot be streamed (PNG, JPEG, ...) are analyzed in memory.
+    """
+    if not path.lower().endswith(STREAMABLE_EXTENSIONS):
+        return analyze_file(path, pipeline, **params)
+    name = os.path.basename(path)
+    source = open_source(path)
+    try:
+        tissue = None
+        if params.get("tissue"):             # from the grayscale, as in pipelines._tissue
+            tissue = TissueMask.of_source(source, depth8=pipeline != "intensity")
+        source = stain_source(source, pipeline, **params)
+        if pipeline == "area":
+            return tiled_myelin_area(source, name,
+                                     params.get("background_mode", DEFAULT_MODE),
+                                     params.get("background_radius", DEFAULT_RADIUS),
+                                     memory_budget, tissue=tissue)
+        if pipeline == "binary":
+            return tiled_fixed_threshold_area(source, name,
+                                              params.get("threshold", DEFAULT_THRESHOLD),
+                                              memory_budget, tissue)
+        if pipeline == "intensity":
+            return tiled_mean_intensity(source, name, memory_budget, tissue)
+        raise ValueError(f"Unknown pipeline {pipeline!r}")
+    finally:
+        source.close()
@@ -0,0 +1,133 @@
+"""
+Tissue detection on a low-resolution level
+ • The image is reduced to at most LEVEL_MAX_SIDE pixels on its longest
+   side by taking every step-th row and column of its grayscale. Tiled
+   sources read the same pixels one segment at a time (read_strided in
+   tiling.py), so in-memory and tiled runs find exactly the same tissue.
+   Tissue is whatever differs from the glass: the glass level is the median
+   of the image border, so bright-field (dark tissue on bright glass) and
+   fluorescence (bright on dark) both work.
+ • The low-resolution mask is cleaned (closing / opening, dust removed)
+   and upsampled on demand, one full-resolution region at a time, so tiled
+   runs can skip tiles with no tissue without ever building a full mask.
+ • If no glass / tissue contrast is found the whole image counts as
+   tissue, so statistics never end up with zero pixels.
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+LEVEL_MAX_SIDE = 1024
+BORDER_FRACTION = 0.02          # share of each side sampled as glass
+MIN_CONTRAST = 8                # gray levels (of 255) between glass and tissue
+NOISE_SIGMAS = 4                # … or this many robust sigmas of the glass noise
+SMOOTH_SIGMA = 2                # low-res pixels
+CLOSE_RADIUS = 4
+MIN_COMPONENT_FRACTION = 0.0005  # smaller specks (of the level area) are dust
+
+
+def level_step(shape, max_side=LEVEL_MAX_SIDE):
+    """Stride that brings the longest side of shape to at most max_side."""
+    return max(1, math.ceil(max(shape[:2]) / max_side))
+
+
+def to_level(gray, max_side=LEVEL_MAX_SIDE):
+    """Every step-th pixel of gray, so the longest side is at most max_side."""
+    step = level_step(gray.shape, max_side)
+    return np.ascontiguousarray(gray[::step, ::step])
+
+
+def _as_8bit(level):
+    if level.ndim == 3:
+        level = cv2.cvtColor(level, cv2.COLOR_RGB2GRAY if level.shape[2] == 3
+                             else cv2.COLOR_RGBA2GRAY)
+    if level.dtype == np.uint8:
+        return level
+    level = level.astype(np.float32)
+    peak = float(level.max())
+    return (level * (255 / peak) if peak > 0 else level).astype(np.uint8)
+
+
+def detect_tissue(level):
+    """Boolean tissue mask of a low-resolution gray (or RGB) level."""
+    level = cv2.GaussianBlur(_as_8bit(level), (0, 0), SMOOTH_SIGMA).astype(np.int16)
+    h, w = level.shape
+    by, bx = max(1, int(h * BORDER_FRACTION)), max(1, int(w * BORDER_FRACTION))
+    border = np.concatenate([level[:by].ravel(), level[-by:].ravel(),
+                             level[:, :bx].ravel(), level[:, -bx:].ravel()])
+    glass = np.median(border)
+    noise = 1.4826 * np.median(np.abs(border - glass))
+    mask = (np.abs(level - glass) > max(MIN_CONTRAST, NOISE_SIGMAS * noise)).astype(np.uint8)
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * CLOSE_RADIUS + 1,) * 2)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    keep = stats[:, cv2.CC_STAT_AREA] >= max(1, MIN_COMPONENT_FRACTION * h * w)
+    keep[0] = False                          # label 0 is the glass
+    mask = keep[labels]
+    if not mask.any():
+        mask[:] = True
+    return mask
+
+
+class TissueMask:
+    """Low-resolution tissue mask of an image of the given full-resolution shape."""
+
+    def __init__(self, level_mask, shape):
+        self.level = level_mask
+        self.shape = tuple(shape[:2])
+        self._level255 = level_mask.astype(np.uint8) * 255
+
+    @classmethod
+    def of(cls, gray):
+        """Mask of an in-memory image."""
+        return cls(detect_tissue(to_level(gray)), gray.shape)
+
+    @classmethod
+    def of_source(cls, source, depth8=True):
+        """Mask of a tiling source, read at low resolution only.
+
+        depth8 must match how the pipeline reads the image (False keeps
+        16-bit, as the intensity pipeline does), so the level equals the one
+        of() sees in memory.
+        """
+        level = source.read_strided(level_step(source.shape), depth8)
+        return cls(detect_tissue(level), source.shape)
+
+    @property
+    def fraction(self):
+        """Approximate share of the image that is tissue (from the low-res level)."""
+        return float(self.level.mean())
+
+    def pixels(self):
+        """Exact number of full-resolution tissue pixels (without building the mask)."""
+        (h, w), (lh, lw) = self.shape, self.level.shape
+        rows = np.bincount(np.arange(h) * lh // h, minlength=lh)
+        cols = np.bincount(np.arange(w) * lw // w, minlength=lw)
+        return int(rows @ self.level.astype(np.int64) @ cols)
+
+    def _rows_cols(self, y0, y1, x0, x1):
+        (h, w), (lh, lw) = self.shape, self.level.shape
+        return np.arange(y0, y1) * lh // h, np.arange(x0, x1) * lw // w
+
+    def any(self, y0, y1, x0, x1):
+        """Whether the full-resolution box holds any tissue."""
+        rows, cols = self._rows_cols(y0, y1, x0, x1)
+        return bool(self.level[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1].any())
+
+    def region(self, y0, y1, x0, x1):
+        """Full-resolution uint8 mask (255 = tissue) of a box, for cv2 mask arguments."""
+        rows, cols = self._rows_cols(y0, y1, x0, x1)
+        out = np.empty((len(rows), len(cols)), np.uint8)
+        # full-resolution rows come in runs on one level row: expand each once, copy the rest
+        starts = np.flatnonzero(np.diff(rows, prepend=-1)).tolist() + [len(rows)]
+        for start, end in zip(starts, starts[1:]):
+            np.take(self._level255[rows[start]], cols, out=out[start])
+            out[start + 1:end] = out[start]
+        return out
+
+    def full(self):
+        return self.region(0, self.shape[0], 0, self.shape[1])
@@ -0,0 +1,282 @@
+"""
+Watch-folder mode for scanner output
+ • Watches a directory and quantifies only new or changed images, appending
+   one row per image to a running .csv / .xlsx table (results_sink.py) with
+   the same pipelines and parameters as batch_quant.py.
+ • File system events come from watchdog (inotify on Linux, if installed);
+   without it, or on shares that don't deliver events, the folder is polled
+   every --interval seconds. Either way each pass is a full rescan, so
+   missed events only delay a file.
+ • Files still being written are skipped: a file is ready once its size and
+   mtime have stayed the same for --settle seconds and it can be opened.
+ • After every burst of files the table's header gains any new columns and
+   an .xlsx table is rewritten, so the running table is always readable.
+   SIGTERM (systemd, docker stop) shuts down like Ctrl+C.
+ • Processed files are recorded in a small SQLite index next to the table
+   (path, size, mtime, parameters), so a restart only picks up what
+   arrived or changed meanwhile. A changed file is measured again and gets
+   a new row; a file that failed is retried only once it changes.
+Example:
+    python watch_folder.py binary /mnt/scanner/exports -o daily.csv --threshold 100
+"""
+
+import argparse
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+
+from batch_quant import add_pipeline_arguments, pipeline_params, run_batch
+from pipelines import IMAGE_EXTENSIONS
+from result_cache import DEFAULT_CACHE_DIR, open_cache, params_key
+from results_sink import open_sink
+from tiling import STREAMABLE_EXTENSIONS, DEFAULT_MEMORY_BUDGET
+
+DEFAULT_INTERVAL = 10.0                     # seconds between scans
+DEFAULT_SETTLE = 5.0                        # seconds a file must stay unchanged
+INDEX_SUFFIX = ".index.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path      TEXT PRIMARY KEY,
+    size      INTEGER NOT NULL,
+    mtime     INTEGER NOT NULL,
+    params    TEXT NOT NULL,
+    error     TEXT,
+    processed REAL NOT NULL
+);
+"""
+
+
+def _signature(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class FileIndex:
+    """Which files (at which size / mtime, with which parameters) were processed."""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        with self._db:
+            self._db.executescript(_SCHEMA)
+
+    def is_done(self, path, signature, params):
+        found = self._db.execute("SELECT size, mtime, params FROM files WHERE path = ?",
+                                 (path,)).fetchone()
+        return found is not None and found == (*signature, params)
+
+    def mark(self, path, signature, params, error=None):
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                             (path, *signature, params, error, time.time()))
+
+    def counts(self):
+        """(processed, failed) files on record."""
+        return self._db.execute("SELECT COUNT(*), COUNT(error) FROM files").fetchone()
+
+    def close(self):
+        self._db.close()
+
+
+class FolderWatcher:
+    def __init__(self, directory, pipeline, params, sink, index, recursive=False,
+                 settle=DEFAULT_SETTLE, extensions=IMAGE_EXTENSIONS, **run_options):
+        self.directory = os.path.abspath(directory)
+        self.pipeline = pipeline
+        self.params = params
+        self.sink = sink
+        self.index = index
+        self.recursive = recursive
+        self.settle = settle
+        self.extensions = tuple(extensions)
+        self.run_options = run_options       # workers, memory_budget, cache for run_batch
+        self._params_key = params_key(pipeline, params)
+        self._seen = {}                      # path → (signature, first seen with it)
+
+    def _files(self):
+        stack = [self.directory]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith((".", "~$")):
+                    continue                 # hidden / lock files
+                if entry.is_dir() and self.recursive:
+                    stack.append(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(self.extensions):
+                    yield entry.path
+
+    def scan(self, now=None):
+        """Paths that are new or changed and have stopped changing."""
+        now = time.time() if now is None else now
+        ready, present = [], set()
+        for path in self._files():
+            present.add(path)
+            try:
+                signature = _signature(path)
+            except OSError:
+                continue                     # removed meanwhile
+            if self.index.is_done(path, signature, self._params_key):
+                self._seen.pop(path, None)
+                continue
+            seen = self._seen.get(path)
+            if seen is None or seen[0] != signature:
+                self._seen[path] = (signature, now)      # new, or still being written
+                continue
+            if signature[0] and now - seen[1] >= self.settle and _can_open(path):
+                ready.append(path)
+        for path in set(self._seen) - present:
+            del self._seen[path]
+        return sorted(ready)
+
+    def process(self, paths):
+        """Measure paths, append their rows and record them; returns the errors."""
+        signatures = {path: self._seen.pop(path)[0] for path in paths}
+
+        def record(path, row, error):
+            try:
+                changed = _signature(path) != signatures[path]
+            except OSError:
+                changed = True
+            if not changed:                  # otherwise it is picked up again later
+                self.index.mark(path, signatures[path], self._params_key, error)
+
+        _, errors = run_batch(paths, self.pipeline, sink=self.sink, on_result=record,
+                              **self.run_options, **self.params)
+        return errors
+
+    def run(self, interval=DEFAULT_INTERVAL, once=False, wake=None):
+        """Scan and process until interrupted (once: until nothing new is settling).
+
+        wake, a threading.Event set on file system events, ends a wait early.
+        """
+        while True:
+            ready = self.scan()
+            if ready:
+                for error in self.process(ready):
+                    print(f"Skipped {error}", file=sys.stderr)
+                self.sink.checkpoint()
+                print(f"{len(ready)} new image(s) processed, table: {self.sink.path}")
+            elif once and self._stuck():
+                return
+            if wake is None:
+                time.sleep(min(interval, self.settle) if once else interval)
+            else:
+                wake.wait(interval)
+                wake.clear()
+                time.sleep(min(self.settle, interval))   # let bursts of events settle
+
+    def _stuck(self):
+        # every file still waiting has had time to settle (empty or locked)
+        now = time.time()
+        return all(now - first >= self.settle for _, first in self._seen.values())
+
+
+def _can_open(path):
+    # writers on Windows shares hold the file locked until they are done
+    try:
+        with open(path, "rb"):
+            return True
+    except OSError:
+        return False
+
+
+def watch_events(directory, recursive=False):
+    """(Event set on any change under directory, observer) via watchdog, or None."""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+    wake = threading.Event()
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wake.set()
+
+    observer = Observer()
+    observer.schedule(Handler(), directory, recursive=recursive)
+    observer.daemon = True
+    observer.start()
+    return wake, observer
+
+
+def _terminate(signum, frame):
+    # SIGTERM leaves through main()'s finally block, like Ctrl+C
+    raise KeyboardInterrupt
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Quantify new images as they appear in a folder.")
+    add_pipeline_arguments(parser)
+    parser.add_argument("directory", help="folder the scanner exports to")
+    parser.add_argument("-o", "--output", default="results.csv",
+                        help="running results table (.csv or .xlsx), appended to")
+    parser.add_argument("--index", default=None,
+                        help=f"processed-file index (default: <output>{INDEX_SUFFIX})")
+    parser.add_argument("-r", "--recursive", action="store_true", help="watch subfolders too")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help="seconds between scans (without file system events)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE,
+                        help="seconds a file must stay unchanged before it is read")
+    parser.add_argument("--once", action="store_true",
+                        help="process what is there now, then exit")
+    parser.add_argument("--poll", action="store_true",
+                        help="poll even if watchdog is installed")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="worker processes per burst of files (default: in-process)")
+    parser.add_argument("--tiled", action="store_true",
+                        help="stream large TIFF / .npy images tile by tile")
+    parser.add_argument("--memory-mb", type=float, default=DEFAULT_MEMORY_BUDGET / 2**20,
+                        help="per-worker memory budget for --tiled (MiB)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't read or write the on-disk result cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.isdir(args.directory):
+        print(f"Not a folder: {args.directory}", file=sys.stderr)
+        return 1
+    try:
+        params = pipeline_params(args)
+        sink = open_sink(args.output, append=True)
+    except (ValueError, ImportError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    index = FileIndex(args.index or os.path.splitext(args.output)[0] + INDEX_SUFFIX)
+    cache = None if args.no_cache else open_cache(args.cache_dir)
+    extensions = IMAGE_EXTENSIONS + STREAMABLE_EXTENSIONS if args.tiled else IMAGE_EXTENSIONS
+    watcher = FolderWatcher(args.directory, args.pipeline, params, sink, index,
+                            args.recursive, args.settle, extensions, workers=args.workers,
+                            memory_budget=int(args.memory_mb * 2**20) if args.tiled else None,
+                            cache=cache)
+    events = None if args.poll or args.once else watch_events(args.directory, args.recursive)
+    done, failed = index.counts()
+    print(f"Watching {watcher.directory} ({'events' if events else 'polling'}); "
+          f"{done} file(s) already processed, {failed} failed")
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        watcher.run(args.interval, args.once, events[0] if events else None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if events:
+            events[1].stop()
+        sink.close()
+        index.close()
+        if cache is not None:
+            cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
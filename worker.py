@@ -0,0 +1,108 @@
+"""
+Background execution for the Tk analyzer apps
+ • Jobs run on a thread pool (OpenCV / NumPy release the GIL, so images are
+   processed concurrently) while the Tk main loop stays responsive.
+ • Results, errors and completion are queued by the workers and delivered
+   on the Tk thread through root.after polling – callbacks may touch widgets.
+ • Optional ttk.Progressbar is advanced per finished item.
+ • cancel() drops queued jobs; jobs already running finish but their results
+   are discarded.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 50
+
+
+class BackgroundRunner:
+    def __init__(self, root, progress=None, max_workers=None):
+        self.root = root
+        self.progress = progress
+        self.max_workers = max_workers
+        self._queue = queue.Queue()
+        self._cancel = threading.Event()
+        self._pool = None
+        self._futures = []
+        self._pending = 0
+        self._finished = 0
+        self._callbacks = None
+
+    @property
+    def busy(self):
+        return self._pool is not None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def run(self, items, func, on_result=None, on_error=None, on_done=None, workers=None):
+        """Run func(item) for every item in the background.
+
+        on_result(item, result) / on_error(item, exc) fire per item and
+        on_done(cancelled) once at the end, all on the Tk thread.
+        workers overrides max_workers for this run (1: one item at a time).
+        """
+        if self.busy:
+            raise RuntimeError("A background job is already running")
+        items = list(items)
+        self._cancel.clear()
+        self._callbacks = (on_result, on_error, on_done)
+        self._pending = len(items)
+        self._finished = 0
+        if self.progress is not None:
+            self.progress.config(maximum=max(1, len(items)), value=0)
+
+        self._pool = ThreadPoolExecutor(max_workers=workers or self.max_workers)
+        self._futures = [self._pool.submit(self._call, func, item) for item in items]
+        self.root.after(POLL_MS, self._poll)
+
+    def cancel(self):
+        if not self.busy:
+            return
+        self._cancel.set()
+        for future in self._futures:
+            if future.cancel():               # never started
+                self._queue.put(("cancelled", None, None))
+
+    # ---------- internals ----------
+    def _call(self, func, item):
+        # runs on a worker thread: never touch Tk here
+        if self._cancel.is_set():
+            self._queue.put(("cancelled", item, None))
+            return
+        try:
+            result = func(item)
+        except Exception as e:
+            self._queue.put(("error", item, e))
+        else:
+            self._queue.put(("result", item, result))
+
+    def _poll(self):
+        on_result, on_error, on_done = self._callbacks
+        while True:
+            try:
+                kind, item, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            self._finished += 1
+            if self.progress is not None:      # step() would wrap to 0 at maximum
+                self.progress["value"] = self._finished
+            if self._cancel.is_set():
+                continue
+            if kind == "result" and on_result:
+                on_result(item, payload)
+            elif kind == "error" and on_error:
+                on_error(item, payload)
+
+        if self._pending > 0:
+            self.root.after(POLL_MS, self._poll)
+            return
+
+        self._pool.shutdown(wait=False)
+        self._pool = None
+        self._futures = []
+        if on_done:
+            on_done(self._cancel.is_set())